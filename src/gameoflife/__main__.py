@@ -0,0 +1,328 @@
+"""Command line interface for scripts and cron jobs: python -m gameoflife <command>
+
+Works on the same database as the GUI but never imports tkinter, matplotlib
+or tkcalendar. Each command imports only the core modules it needs, so
+startup stays well under 100 ms (test_cli.py checks this).
+
+    python -m gameoflife --user alice add "Write report" --priority high --due 2026-11-01
+    python -m gameoflife --user alice list --status all > tasks.tsv
+    python -m gameoflife --user alice complete 42 43
+    python -m gameoflife --user alice stats --json
+    python -m gameoflife --user alice plan 90     # what to do with 90 free minutes
+    python -m gameoflife sweep-overdue            # every user, same as the nightly batch job
+    python -m gameoflife --user alice import tasks.csv
+    python -m gameoflife --user alice import calendar.ics   # again later only adds new events
+    python -m gameoflife backup                   # online backup, see core/backup.py
+    python -m gameoflife restore latest
+
+list writes one tab-separated line per task as rows are read, so a big
+listing starts printing straight away and can be piped into head.
+"""
+import argparse
+import contextlib
+import datetime
+import itertools
+import json
+import os
+import sys
+
+#the core modules import each other by plain module name (import database, import game)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "core"))
+
+PRIORITIES = ("low", "medium", "high", "critical")
+LIST_STATUSES = ("active", "pending", "in_progress", "completed", "failed", "all")
+
+#import: how many tasks go into one transaction
+IMPORT_CHUNK = 1000
+
+
+def parse_due(value):
+    for fmt in ("%Y-%m-%d %H:%M", "%Y-%m-%dT%H:%M", "%Y-%m-%d"):
+        try:
+            return datetime.datetime.strptime(value, fmt)
+        except ValueError:
+            pass
+    raise argparse.ArgumentTypeError(f"invalid date {value!r}, use YYYY-MM-DD or 'YYYY-MM-DD HH:MM'")
+
+
+def open_db(args):
+    import database
+    #the core modules report what they do with print(); keep stdout for the command's own output
+    with contextlib.redirect_stdout(sys.stderr):
+        database.init_db(args.db)
+    return database
+
+
+def load_config():
+    #the XP economy from the config file, same as the GUI and task service use
+    from config import default_config_path, reload_config
+    path = default_config_path()
+    if path.exists():
+        reload_config(path)
+
+
+def find_user(database, args, create=False):
+    if not args.user:
+        sys.exit("error: --user (or GAMEOFLIFE_USER) is required for this command")
+    row = database.get_user_by_username(args.user)
+    if row:
+        return row[0]
+    if not create:
+        sys.exit(f"error: no user named {args.user!r}")
+    from game import User
+    return database.insert_user(User(args.user, ""))
+
+
+def load_manager(user_id, username):
+    """A TaskManager with the player's stats but none of the tasks, those are loaded by id."""
+    from game import User, TaskManager
+    import session
+    import streaks
+    with contextlib.redirect_stdout(sys.stderr):
+        player = session.load_player(User(username, ""), user_id)
+    streaks.refresh_player(player)
+    return TaskManager(player, user_id, player.id)
+
+
+def cmd_add(args):
+    from config import Task
+    database = open_db(args)
+    user_id = find_user(database, args, create=True)
+    task = Task(args.title, args.priority, due_date=args.due, description=args.description,
+                estimated_duration=args.minutes)
+    print(database.insert_task(task, user_id))
+
+
+def cmd_complete(args):
+    database = open_db(args)
+    load_config()
+    user_id = find_user(database, args)
+    task_manager = load_manager(user_id, args.user)
+    failed = False
+    for task_id in args.task_ids:
+        task = database.get_task(task_id, user_id)
+        if task is None or task.status not in database.ACTIVE_STATUSES:
+            print(f"error: task {task_id} is not an active task of {args.user}", file=sys.stderr)
+            failed = True
+            continue
+        task_manager.active_tasks.append(task)
+        result = task_manager.complete_task(task)
+        line = f"{task_id}\t+{result['xp_earned']} XP"
+        if result['rank_changed']:
+            line += f"\trank up: {result['new_rank']}"
+        print(line)
+    return 1 if failed else 0
+
+
+def cmd_list(args):
+    database = open_db(args)
+    user_id = find_user(database, args)
+    status = {"active": database.ACTIVE_STATUSES, "all": None}.get(args.status, args.status)
+    out = sys.stdout
+    for task in database.iter_tasks(user_id, status):
+        if args.json:
+            out.write(json.dumps(task.to_dict()) + "\n")
+        else:
+            due = task.due_date.strftime("%Y-%m-%d %H:%M") if task.due_date else "-"
+            out.write(f"{task.id}\t{task.priority}\t{task.status}\t{due}\t{task.title}\n")
+
+
+def cmd_stats(args):
+    database = open_db(args)
+    load_config()
+    user_id = find_user(database, args)
+    player = load_manager(user_id, args.user).player
+    stats = {'user': args.user, 'xp': player.xp, 'level': player.level, 'rank': player.get_rank(),
+             'current_streak': player.current_streak, 'longest_streak': player.longest_streak,
+             'tasks_completed': player.tasks_completed, 'tasks_failed': player.tasks_failed,
+             'active_tasks': sum(database.count_tasks_by(user_id, "status",
+                                                         database.ACTIVE_STATUSES).values())}
+    if args.json:
+        print(json.dumps(stats))
+    else:
+        for name, value in stats.items():
+            print(f"{name}\t{value}")
+
+
+def cmd_plan(args):
+    from game import User
+    import session
+    database = open_db(args)
+    load_config()
+    user_id = find_user(database, args)
+    #the planner needs every active task and the dependencies, so this loads the whole session
+    with contextlib.redirect_stdout(sys.stderr):
+        task_manager = session.load_session(User(args.user, ""), user_id)
+    plan = task_manager.plan(args.minutes, exact=args.exact)
+    for task, finish in zip(plan.tasks, plan.finish_times):
+        if args.json:
+            print(json.dumps({**task.to_dict(), 'planned_finish': finish.isoformat()}))
+        else:
+            print(f"{task.id}\t{finish.strftime('%H:%M')}\t{task.priority}\t{task.title}")
+    print(f"{plan.minutes} of {args.minutes} minutes, {plan.xp} XP", file=sys.stderr)
+
+
+def cmd_sweep_overdue(args):
+    import batch
+    database = open_db(args)
+    load_config()
+    if args.user:
+        lo = hi = find_user(database, args)
+    else:
+        lo, hi = database.conn.execute("SELECT MIN(id), MAX(id) FROM users").fetchone()
+        if lo is None:
+            print(0)
+            return
+    #same job the nightly batch runs, here for one user or all of them in one transaction
+    with database.transaction() as conn:
+        failed = batch.sweep_overdue(conn.cursor(), lo, hi, datetime.datetime.now())
+    database._invalidate_counts()
+    print(failed)
+
+
+def cmd_backup(args):
+    import backup
+    print(backup.backup(args.db, keep=args.keep))
+
+
+def cmd_restore(args):
+    import backup
+    path = args.backup
+    if path == "latest":
+        backups = backup.list_backups(args.db)
+        if not backups:
+            sys.exit("error: no backups to restore")
+        path = backups[0]
+    backup.restore(path, args.db)
+    print(path)
+
+
+def read_import_rows(source):
+    """Rows from a CSV file with a header line (title,priority,due_date,description,minutes) or JSON lines."""
+    import csv
+    source = iter(source)
+    first = next(source, "")
+    if first.lstrip().startswith("{"):
+        yield json.loads(first)
+        for line in source:
+            if line.strip():
+                yield json.loads(line)
+    else:
+        yield from csv.DictReader(source, fieldnames=next(csv.reader([first])))
+
+
+def cmd_import(args):
+    from config import Task
+    database = open_db(args)
+    user_id = find_user(database, args, create=True)
+    source = sys.stdin if args.file == "-" else open(args.file, newline="", encoding="utf-8")
+    imported = 0
+    chunk = []
+    with source:
+        first = source.readline()
+        if first.lstrip("\ufeff").startswith("BEGIN:VCALENDAR"):
+            import ics
+            result = ics.import_ics(itertools.chain([first], source), user_id, include_past=args.include_past)
+            print(result.imported)
+            if result.duplicates or result.skipped:
+                print(f"{result.duplicates} already imported, {result.skipped} skipped (done, past or undated)",
+                      file=sys.stderr)
+            return
+        for number, row in enumerate(read_import_rows(itertools.chain([first], source)), start=1):
+            title = (row.get("title") or "").strip()
+            priority = (row.get("priority") or "medium").strip().lower()
+            if not title or priority not in PRIORITIES:
+                print(f"skipped record {number}: needs a title and a priority in {PRIORITIES}", file=sys.stderr)
+                continue
+            try:
+                due = parse_due(row["due_date"].strip()) if row.get("due_date") else None
+            except argparse.ArgumentTypeError as exc:
+                print(f"skipped record {number}: {exc}", file=sys.stderr)
+                continue
+            try:
+                minutes = int(row["minutes"]) if row.get("minutes") else None
+            except ValueError:
+                print(f"skipped record {number}: minutes must be a whole number", file=sys.stderr)
+                continue
+            chunk.append(Task(title, priority, due_date=due, description=row.get("description") or "",
+                              estimated_duration=minutes))
+            if len(chunk) >= IMPORT_CHUNK:
+                imported += database.insert_tasks(chunk, user_id)
+                chunk = []
+    if chunk:
+        imported += database.insert_tasks(chunk, user_id)
+    print(imported)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m gameoflife",
+                                     description="Game of Life tasks from the command line.")
+    parser.add_argument("--db", help="database path (defaults to the app database)")
+    parser.add_argument("--user", default=os.environ.get("GAMEOFLIFE_USER"),
+                        help="username (defaults to $GAMEOFLIFE_USER)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    add = commands.add_parser("add", help="add a task, prints its id")
+    add.add_argument("title")
+    add.add_argument("--priority", choices=PRIORITIES, default="medium")
+    add.add_argument("--due", type=parse_due, help="YYYY-MM-DD or 'YYYY-MM-DD HH:MM'")
+    add.add_argument("--description", default="")
+    add.add_argument("--minutes", type=int, help="how long the task should take, used by plan")
+    add.set_defaults(run=cmd_add)
+
+    complete = commands.add_parser("complete", help="complete tasks by id and award their XP")
+    complete.add_argument("task_ids", type=int, nargs="+")
+    complete.set_defaults(run=cmd_complete)
+
+    listing = commands.add_parser("list", help="list tasks, one tab-separated line each")
+    listing.add_argument("--status", choices=LIST_STATUSES, default="active")
+    listing.add_argument("--json", action="store_true", help="one JSON object per line")
+    listing.set_defaults(run=cmd_list)
+
+    stats = commands.add_parser("stats", help="show XP, level, rank and streak")
+    stats.add_argument("--json", action="store_true")
+    stats.set_defaults(run=cmd_stats)
+
+    planning = commands.add_parser("plan", help="the active tasks worth the most XP in MINUTES of free time, "
+                                                "in the order to do them")
+    planning.add_argument("minutes", type=int)
+    planning.add_argument("--exact", action="store_true", help="best possible plan, slower on long task lists")
+    planning.add_argument("--json", action="store_true", help="one JSON object per line")
+    planning.set_defaults(run=cmd_plan)
+
+    sweep = commands.add_parser("sweep-overdue", help="fail overdue tasks and charge their XP penalties "
+                                                      "(every user unless --user is given)")
+    sweep.set_defaults(run=cmd_sweep_overdue)
+
+    importer = commands.add_parser("import", help="import tasks from a CSV (with header), JSON lines or .ics file")
+    importer.add_argument("file", help="path, or - for stdin")
+    importer.add_argument("--include-past", action="store_true",
+                          help=".ics: also import events and to-dos that are already past")
+    importer.set_defaults(run=cmd_import)
+
+    backing_up = commands.add_parser("backup", help="back up the database while it is in use, prints the backup's path")
+    backing_up.add_argument("--keep", type=int, default=None, help="backups to keep (default from the config)")
+    backing_up.set_defaults(run=cmd_backup)
+
+    restoring = commands.add_parser("restore", help="replace the database with a backup (close the app first)")
+    restoring.add_argument("backup", help="a backup's path, or latest")
+    restoring.set_defaults(run=cmd_restore)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        return args.run(args) or 0
+    except BrokenPipeError:
+        #the reader went away (e.g. piped into head), not an error for a listing;
+        #point stdout at devnull so the flush at exit doesn't raise again
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 0
+    finally:
+        if "database" in sys.modules:
+            sys.modules["database"].close_db()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
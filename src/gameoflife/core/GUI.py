@@ -1,7 +1,17 @@
-from config import Task, TaskStatus
-from game import User, Player, TaskManager
+from config import Task, TaskStatus, TaskTemplate, config, ConfigWatcher, default_config_path
+from events import (TaskAdded, TaskCompleted, TaskFailed, TaskRemoved, TaskRestored, TemplateAdded,
+                    XPChanged, RankChanged)
+import backup
+import client
 import database
+import reminders
+import session
+import shards
+import streaks
+import bisect
 import datetime
+import queue
+import threading
 import tkinter as tk
 from tkinter import messagebox
 from tkinter import font as tkfont
@@ -17,6 +27,27 @@ FG = "#2AF76F"  # neon-ish green for text
 ACCENT = "#1E8B4D"  # green for fills
 SUBTLE = "#3A3A3A"  # dark gray for bars & frames
 
+#search box: wait this long after the last keystroke before searching, and how often to check for results
+SEARCH_DEBOUNCE_MS = 250
+SEARCH_POLL_MS = 30
+
+#a backup is taken this long after startup (and at midnight) if the newest one is a day old,
+#then checked on every BACKUP_POLL_MS until it finishes
+BACKUP_DELAY_MS = 60_000
+BACKUP_POLL_MS = 500
+
+#how often the reminder timer wheel is moved on (see reminders.py)
+REMINDER_POLL_MS = 1000
+
+#active task list order, same as TaskManager.get_active_tasks
+PRIORITY_ORDER = {"critical": 0, "high": 1, "medium": 2, "low": 3}
+
+
+def same_task(a, b):
+    #tasks from a task service or an undo are new objects, so match by id (or occurrence)
+    return (a is b or (a.id is not None and a.id == b.id)
+            or (a.template_id is not None and (a.template_id, a.due_date) == (b.template_id, b.due_date)))
+
 
 class App(tk.Tk):
     def __init__(self):
@@ -27,12 +58,22 @@ class App(tk.Tk):
         self.geometry("920x640")
 
         #initialize the database on startup. overlooked this and caused a headache
-        database.init_db()
+        #(not needed when a task service owns the database, see service.py, and with sharded
+        #storage each user's database is opened when they log in, see shards.py)
+        if not config.service_address and not config.shard_dir:
+            database.init_db()
 
         #these values are initialized to None originally, and will be populated after the user logs in
         self.task_manager = None
         self.current_user = None
         self.current_player = None
+        #unsubscribe functions for the pages' handlers on task_manager.events
+        self._subscriptions = []
+        #sessions of the users switched away from, for switching back without a login
+        self.sessions = session.SessionCache()
+        #the page on screen, and the pending after_idle repaint if there is one
+        self.current_page = None
+        self._repaint_after = None
 
         #defining different font sizes
         self.font_lg = tkfont.Font(size=18, weight="bold")
@@ -52,10 +93,123 @@ class App(tk.Tk):
             page.grid(row=0, column=0, sticky="nsew")
 
         self.show("WelcomePage")
+        #save a snapshot on close so the next login can skip the task query
+        self.protocol("WM_DELETE_WINDOW", self._on_close)
+        #reset broken streaks when the day changes while the app is open
+        self.after(streaks.ms_until_midnight(), self._midnight_rollover)
+        #XP economy from the config file, if there is one; edits apply without a restart
+        self.config_watcher = ConfigWatcher(default_config_path(), on_reload=self._on_config_reload)
+        self._poll_config()
+        #daily backup on a background thread (see backup.py), the window never waits for it
+        self._backup_job = None
+        self.after(BACKUP_DELAY_MS, self._maybe_backup)
+        #deadline reminders for the logged in user, one after loop moves their timer wheel on
+        self.reminders = None
+        self.after(REMINDER_POLL_MS, self._poll_reminders)
+
+    def _poll_config(self):
+        self.config_watcher.poll()
+        self.after(int(self.config_watcher.interval * 1000), self._poll_config)
+
+    def _on_config_reload(self, snapshot):
+        #XP needed per level, ranks and rewards may all have changed
+        self.pages["DashboardPage"].mark_dirty("xp", "rank")
+        self.pages["AddTaskPage"].mark_dirty("preview")
+
+    def _midnight_rollover(self):
+        if not config.service_address:
+            streaks.rollover()
+        if self.current_player:
+            streaks.refresh_player(self.current_player)
+        #the streak, today's recurring tasks and the calendar's today all moved on
+        self.pages["DashboardPage"].mark_dirty("rank")
+        self.pages["AddTaskPage"].mark_dirty("list")
+        self.pages["CalendarPage"].mark_dirty("month", "details")
+        self._maybe_backup()
+        self.after(streaks.ms_until_midnight(), self._midnight_rollover)
+
+    def _maybe_backup(self):
+        #with a task service the database lives with the service, not here
+        #(and with sharded storage there is nothing to back up until someone logs in)
+        if config.service_address or self._backup_job is not None or database.conn is None:
+            return
+        age = backup.newest_backup_age()
+        if age is None or age >= datetime.timedelta(days=1):
+            self._backup_job = backup.start_backup()
+            self.after(BACKUP_POLL_MS, self._poll_backup)
+
+    def _poll_backup(self):
+        job = self._backup_job
+        if not job.done():
+            self.after(BACKUP_POLL_MS, self._poll_backup)
+            return
+        self._backup_job = None
+        if job.error is not None:
+            print(f"Backup failed: {job.error}")
+        else:
+            print(f"Backed up to {job.path}")
+
+    def _poll_reminders(self):
+        if self.reminders is not None:
+            self._show_reminders(self.reminders.poll())
+        self.after(REMINDER_POLL_MS, self._poll_reminders)
+
+    def _show_reminders(self, due):
+        if due:
+            messagebox.showinfo("Reminders", "\n".join(reminders.message(r) for r in due))
+
+    def set_session(self, task_manager):
+        """Switch the app to a logged in user's TaskManager (or RemoteTaskManager)."""
+        for unsubscribe in self._subscriptions:
+            unsubscribe()
+        if self.reminders is not None:
+            self.reminders.stop()
+            self.reminders = None
+        self.task_manager = task_manager
+        self.current_player = task_manager.player
+        self.current_user = task_manager.player.user
+        self._subscriptions = []
+        for page in self.pages.values():
+            if isinstance(page, DirtyPage):
+                self._subscriptions += page.subscribe(task_manager.events)
+                page.mark_dirty()
+        #the reminder state is kept in the database, which the task service has to itself
+        if not config.service_address:
+            self.reminders = reminders.ReminderScheduler(task_manager)
+            #what came due while the app was closed, in one box
+            self.after_idle(self._show_reminders, self.reminders.start())
+
+    def switch_user(self):
+        #the current session stays loaded in case the user comes back (see session.SessionCache)
+        if self.task_manager is not None and not config.service_address:
+            self.sessions.put(self.task_manager)
+        self.show("WelcomePage")
+
+    def schedule_repaint(self, page):
+        #one after_idle per burst of changes; pages that aren't showing wait until show()
+        if page is self.current_page and self._repaint_after is None:
+            self._repaint_after = self.after_idle(self._flush_repaint)
+
+    def _flush_repaint(self):
+        self._repaint_after = None
+        if isinstance(self.current_page, DirtyPage):
+            self.current_page.repaint()
+
+    def _on_close(self):
+        if self._backup_job is not None:
+            self._backup_job.cancel()
+        if self.task_manager and not config.service_address:
+            session.save_session(self.task_manager)
+        if not config.service_address:
+            self.sessions.clear()
+            database.close_db()
+            shards.close_catalog()
+        self.destroy()
 
     def show(self, name: str):
         #retreieve the page object from the dictionary
         frame = self.pages[name]
+        self.current_page = frame
         #we use tkraise() to bring the retrieved object to the front of the scren
         frame.tkraise()
         #hasattr -> has attribute -> used to reload a users data
@@ -72,6 +226,34 @@ class App(tk.Tk):
         return button
 
 
+class DirtyPage:
+    """Mixin for pages that repaint only the parts whose data changed.
+
+    Each name in PARTS has a _paint_<name> method. Event handlers call
+    mark_dirty() with the parts they affect and the app repaints them in one
+    after_idle callback, or when the page is next shown.
+    """
+    PARTS = ()
+
+    def mark_dirty(self, *parts):
+        #no parts means everything, e.g. after logging in
+        self.dirty.update(parts or self.PARTS)
+        self.app.schedule_repaint(self)
+
+    def repaint(self):
+        dirty, self.dirty = self.dirty, set()
+        for part in self.PARTS:
+            if part in dirty:
+                getattr(self, f"_paint_{part}")()
+
+    def subscribe(self, events):
+        """Subscribe to task_manager.events, returns the unsubscribe functions."""
+        return []
+
+    def on_show(self):
+        self.repaint()
+
+
 class WelcomePage(tk.Frame):
     def __init__(self, parent, app: App):
         super().__init__(parent, bg=BG)
@@ -92,6 +274,23 @@ class WelcomePage(tk.Frame):
 
         app.make_button(self, "BEGIN", self._begin).pack(pady=24)
 
+        #one button per profile still loaded from earlier, logs straight back in
+        self.recent = tk.Frame(self, bg=BG)
+        self.recent.pack()
+
+    def on_show(self):
+        for button in self.recent.winfo_children():
+            button.destroy()
+        usernames = self.app.sessions.usernames()
+        if usernames:
+            self.app.make_label(self.recent, "OR SWITCH BACK TO:", font=self.app.font_sm).pack(pady=(0, 6))
+        for username in usernames:
+            self.app.make_button(self.recent, username, lambda name=username: self._switch_to(name)).pack(pady=2)
+
+    def _switch_to(self, username):
+        self.app.set_session(self.app.sessions.login(username))
+        self.app.show("MenuPage")
+
     def _begin(self):
         #this gets the entered string from StringVar
         #then strips it from any additional whitespace which is important becasue we dont care about spaces in a username
@@ -103,64 +302,16 @@ class WelcomePage(tk.Frame):
             messagebox.showwarning("Input Error", "Please enter a username.")
             return
 
-        #query the database to see if the username already exists
-        user_data = database.get_user_by_username(name)
-
-        if user_data: #if the user is found
-            #id is stored at index 0, so extract it
-            user_id = user_data[0]
-            #then get username at index 1 and email at index 2
-            user_obj = User(user_data[1], user_data[2])
-            print(f"Loaded User: {user_obj}")
-        else: #otherwise create a new user
-            user_obj = User(name, email)
-            #save the new user into the databse
-            user_id = database.insert_user(user_obj)
-            print(f"Created New User ID: {user_id}")
-
-        self.app.current_user = user_obj
-
-        #retreive the stats from the user
-        player_data = database.get_player_by_user_id(user_id)
-
-        if player_data:
-            p_obj = Player(user_obj) #this is the empty player object linked to the user
-            #all of these are the indicies we want to retrieve
-            #ex. ID, username, email, XP, level, etc.
-            p_obj.id = player_data[0]
-            p_obj.xp = player_data[2]
-            p_obj.level = player_data[3]
-            p_obj.tasks_completed = player_data[4]
-            p_obj.tasks_failed = player_data[5]
-            p_obj.current_streak = player_data[6]
-            p_obj.longest_streak = player_data[7]
-            p_obj.tasks_completed_early = player_data[8]
-            p_obj.critical_tasks_completed = player_data[9]
-            p_obj.previous_rank = player_data[10]
-            print("Loaded existing player stats.")
-        else: #othewise we create a defualt player
-            player_id = database.insert_player(user_id)
-            p_obj = Player(user_obj)
-            p_obj.id = player_id
-            print("Created new player stats.")
-
-        self.app.current_player = p_obj
-
-        #initialize task manager
-        #p_obj: the loaded in player object
-        #p_obj.id: used as a save file
-        self.app.task_manager = TaskManager(p_obj, user_id, p_obj.id)
-
-        #loads the active tasks from the database into the task manager
-        db_tasks = database.get_tasks_by_user(user_id)
-        for t in db_tasks:
-            #We removed OVERDUE and FAILED from before, so we only check for active or completed
-            #if active, add it to the task manager list
-            if t.status in [TaskStatus.PENDING, TaskStatus.IN_PROGRESS]:
-                self.app.task_manager.active_tasks.append(t)
-            #if the task is completed leave it be
-            elif t.status == TaskStatus.COMPLETED:
-                self.app.task_manager.completed_tasks.append(t)
+        if config.service_address:
+            #the task service owns the database, log in through it instead
+            self.app.set_session(client.RemoteTaskManager.login(config.service_address, name, email))
+            self.app.show("MenuPage")
+            return
+
+        #the user, their stats and tasks in a few queries, or from the snapshot when nothing
+        #changed since last time; new usernames get a new user (see session.py). A profile
+        #switched away from earlier comes back from the app's session cache
+        self.app.set_session(self.app.sessions.login(name, email))
 
         self.app.show("MenuPage")
 
@@ -177,16 +328,20 @@ class MenuPage(tk.Frame):
         app.make_button(self, "MAIN DASHBOARD", lambda: app.show("DashboardPage")).pack(pady=6)
         app.make_button(self, "MANAGE TASKS", lambda: app.show("AddTaskPage")).pack(pady=6)
         app.make_button(self, "VIEW CALENDAR", lambda: app.show("CalendarPage")).pack(pady=6)
+        app.make_button(self, "SWITCH USER", app.switch_user).pack(pady=(18, 6))
 
     def on_show(self):
         if self.app.current_user:
             self.welcome.config(text=f"WELCOME BACK, {self.app.current_user.username.upper()}!")
 
 
-class DashboardPage(tk.Frame):
+class DashboardPage(DirtyPage, tk.Frame):
+    PARTS = ("name", "xp", "rank")
+
     def __init__(self, parent, app: App):
         super().__init__(parent, bg=BG)
         self.app = app
+        self.dirty = set()
 
         # header using large font
         app.make_label(self, "MAIN DASHBOARD", font=app.font_lg).pack(pady=(24, 20))
@@ -212,29 +367,61 @@ class DashboardPage(tk.Frame):
         tk.Frame(self, height=16, bg=BG).pack()
         app.make_button(self, "BACK TO MENU", lambda: app.show("MenuPage")).pack(pady=8)
 
-    def on_show(self):
+    def subscribe(self, events):
+        return [events.subscribe(XPChanged, lambda event: self.mark_dirty("xp")),
+                events.subscribe(RankChanged, lambda event: self.mark_dirty("rank")),
+                #the streak is shown next to the rank
+                events.subscribe(TaskCompleted, lambda event: self.mark_dirty("rank")),
+                events.subscribe(TaskRestored, lambda event: self.mark_dirty("rank"))]
+
+    def _paint_name(self):
+        if self.app.current_user:
+            self.name_box.config(text=self.app.current_user.username)
+
+    def _paint_xp(self):
         #this is our solution to our task manager crashing
         #it ensures that the game engine is running properly
-        if self.app.current_user and self.app.task_manager:
-            p = self.app.task_manager.player
-            self.name_box.config(text=self.app.current_user.username)
+        if not self.app.task_manager:
+            return
+        p = self.app.task_manager.player
+        #calculate the xp progress and update the bar
+        progress_pct = p.get_progress_to_next_level()
+        self.xp_bar.set_ratio(progress_pct / 100.0)
 
-            #calculate the xp progress and update the bar
-            progress_pct = p.get_progress_to_next_level()
-            self.xp_bar.set_ratio(progress_pct / 100.0)
+        #update the labels to show the updated stats
+        self.xp_details.config(text=f"{p.xp} Total XP")
+        self.level_text.config(text=f"LEVEL {p.level}")
 
-            #update the labels to show the updated stats
-            self.xp_details.config(text=f"{p.xp} Total XP")
-            self.level_text.config(text=f"LEVEL {p.level}")
+    def _paint_rank(self):
+        if self.app.task_manager:
+            p = self.app.task_manager.player
             self.rank_text.config(text=f"Rank: {p.get_rank()} | Streak: {p.current_streak}")
 
 
-class AddTaskPage(tk.Frame):
+class AddTaskPage(DirtyPage, tk.Frame):
+    #"list" rebuilds the listbox, "list_changes" only applies the queued inserts/removals
+    PARTS = ("list", "list_changes", "chart", "preview")
+
     def __init__(self, parent, app: App):
         super().__init__(parent, bg=BG)
         self.app = app
+        self.dirty = set()
         #used to keep track of which task object corresponds to a specific list selection
         self.displayed_tasks = []
+        #priority order of the active task rows; the rows after them are today's recurring tasks
+        self._row_ranks = []
+        #("add" | "remove", task) waiting for the next repaint
+        self._list_changes = []
+        #active tasks per priority, None until counted by the database
+        self._priority_counts = None
+        #search state: results shown instead of the active list while the box has text
+        self.search_results = None
+        self._search_after = None
+        self._search_seq = 0
+        self._search_requests = queue.Queue()
+        self._search_replies = queue.Queue()
+        self._search_thread = None
+        self._search_polling = None  #seq of the search the poll loop is waiting for
 
         app.make_label(self, "TASK MANAGER", font=app.font_lg).grid(row=0, column=0, columnspan=4, pady=(24, 16))
 
@@ -248,9 +435,16 @@ class AddTaskPage(tk.Frame):
         #priority options
         app.make_label(self, "PRIORITY", font=app.font_sm).grid(row=2, column=0, sticky="w", padx=20, pady=(8, 0))
         self.priority = tk.StringVar(value="medium")
+        #priority and repeat share one grid cell
+        option_row = tk.Frame(self, bg=BG)
+        option_row.grid(row=2, column=1, sticky="w", pady=(8, 0))
         # Note: Mapping display strings to config strings lowercase
-        tk.OptionMenu(self, self.priority, "low", "medium", "high", "critical").grid(row=2, column=1, sticky="w",
-                                                                                     pady=(8, 0))
+        tk.OptionMenu(option_row, self.priority, "low", "medium", "high", "critical").pack(side="left")
+
+        #repeat options, anything but "none" saves a recurring template instead of a single task
+        app.make_label(option_row, "REPEAT", font=app.font_sm).pack(side="left", padx=(12, 4))
+        self.repeat = tk.StringVar(value="none")
+        tk.OptionMenu(option_row, self.repeat, "none", "daily", "weekly", "monthly").pack(side="left")
 
         #due date entry
         app.make_label(self, "DUE DATE", font=app.font_sm).grid(row=1, column=2, sticky="w", padx=(40, 0))
@@ -268,11 +462,28 @@ class AddTaskPage(tk.Frame):
         app.make_button(btn_frame, "ADD TASK", self._add_task).pack(side="left", padx=(0, 10))
         #complete task button
         app.make_button(btn_frame, "COMPLETE SELECTED", self._complete_task).pack(side="left", padx=(0, 10))
+        app.make_button(btn_frame, "UNDO", self._undo).pack(side="left", padx=(0, 10))
+        app.make_button(btn_frame, "REDO", self._redo).pack(side="left", padx=(0, 10))
         app.make_button(btn_frame, "BACK TO MENU", lambda: app.show("MenuPage")).pack(side="left")
 
+        #what the task being typed in is worth, updated as priority or due date change
+        self.xp_preview = app.make_label(btn_frame, "", font=app.font_sm)
+        self.xp_preview.pack(side="left", padx=(20, 0))
+        self.priority.trace_add("write", lambda *_: self._update_xp_preview())
+        self.due_date.trace_add("write", lambda *_: self._update_xp_preview())
+
         #active tasks list
-        app.make_label(self, "ACTIVE TASKS", font=app.font_sm).grid(row=4, column=0, columnspan=2, sticky="w", padx=20,
-                                                                    pady=(12, 4))
+        self.list_label = app.make_label(self, "ACTIVE TASKS", font=app.font_sm)
+        self.list_label.grid(row=4, column=0, columnspan=2, sticky="w", padx=20, pady=(12, 4))
+
+        #search box, searches run on a background thread once typing pauses
+        search_row = tk.Frame(self, bg=BG)
+        search_row.grid(row=4, column=2, columnspan=2, sticky="w", padx=(40, 0), pady=(12, 4))
+        app.make_label(search_row, "SEARCH", font=app.font_sm).pack(side="left", padx=(0, 6))
+        self.search_text = tk.StringVar()
+        self.search_text.trace_add("write", lambda *_: self._on_search_typed())
+        tk.Entry(search_row, textvariable=self.search_text, bg=SUBTLE, fg=FG, insertbackground=FG,
+                 width=24).pack(side="left")
         self.listbox = tk.Listbox(self, width=80, height=8, bg=SUBTLE, fg=FG, font=("Consolas", 10))
         self.listbox.grid(row=5, column=0, columnspan=4, sticky="w", padx=20)
 
@@ -305,17 +516,38 @@ class AddTaskPage(tk.Frame):
                 messagebox.showerror("Date Error", "Invalid Date Format. Use YYYY-MM-DD")
                 return
 
-        #create our task object
-        new_task = Task(title=name, priority=self.priority.get(), due_date=d_obj)
+        if self.repeat.get() != "none":
+            #recurring: the due date (or today) is the first occurrence
+            start = d_obj or datetime.datetime.combine(datetime.date.today(), datetime.time())
+            self.app.task_manager.add_template(
+                TaskTemplate(name, self.repeat.get(), start, priority=self.priority.get()))
+        else:
+            #create our task object
+            new_task = Task(title=name, priority=self.priority.get(), due_date=d_obj)
 
-        #send it to the task manager
-        self.app.task_manager.add_task(new_task)
-
-        self._refresh_list()
-        self._refresh_chart()
+            #send it to the task manager
+            self.app.task_manager.add_task(new_task)
 
+        #the list and chart follow from the TaskAdded event
         self.task_name.set("")
         self.due_date.set("")
+        self.repeat.set("none")
+
+    def _update_xp_preview(self):
+        if not self.app.task_manager:
+            self.xp_preview.config(text="")
+            return
+        try:
+            due = datetime.datetime.strptime(self.due_date.get().strip(), "%Y-%m-%d")
+        except ValueError:
+            due = None  #no date, or one that is still being typed
+        preview = self.app.task_manager.xp_calculator.preview(self.priority.get(), due)
+
+        text = f"WORTH {preview['reward']} XP"
+        if preview['bonus']:
+            text += f" (incl. +{preview['bonus']} early bonus)"
+        text += f" | FAIL -{preview['penalty']} XP"
+        self.xp_preview.config(text=text)
 
     def _complete_task(self):
         #this is the logic behind when a user clicks the complete task button
@@ -337,39 +569,195 @@ class AddTaskPage(tk.Frame):
             if result['rank_changed']:
                 msg += f"\nRANK UP! You are now a {result['new_rank']}!"
             messagebox.showinfo("Victory", msg)
-            #then it refreshes the lists and the charts
-            self._refresh_list()
-            self._refresh_chart()
+            #the list and chart follow from the TaskCompleted event
 
-    def on_show(self):
-        #all this does is ensure that everything is refreshed upon a task being added
-        self._refresh_list()
-        self._refresh_chart()
+    def _undo(self):
+        if self.app.task_manager:
+            self._show_journal_result("Undone", self.app.task_manager.undo())
+
+    def _redo(self):
+        if self.app.task_manager:
+            self._show_journal_result("Redone", self.app.task_manager.redo())
 
-    def _refresh_list(self):
+    def _show_journal_result(self, verb, result):
+        #the list, chart and dashboard follow from the events the undo/redo published
+        if result is None:
+            messagebox.showinfo(verb, f"Nothing to {verb[:-2].lower()}.")
+            return
+        msg = f"{verb}: {result['action']} \"{result['task'].title}\""
+        if result['xp_delta']:
+            delta = -result['xp_delta'] if verb == "Undone" else result['xp_delta']
+            msg += f"\nXP: {delta:+d}"
+        messagebox.showinfo(verb, msg)
+
+    def subscribe(self, events):
+        #a new session, count again for this user
+        self._priority_counts = None
+        return [events.subscribe(TaskAdded, lambda event: self._on_task_changed("add", event.task, 1)),
+                events.subscribe(TaskCompleted, lambda event: self._on_task_changed("remove", event.task, -1)),
+                events.subscribe(TaskFailed, lambda event: self._on_task_changed("remove", event.task, -1)),
+                events.subscribe(TaskRemoved, lambda event: self._on_task_changed("remove", event.task, -1)),
+                #an occurrence whose completion was undone has no task row again, so it isn't counted
+                events.subscribe(TaskRestored, lambda event: self._on_task_changed(
+                    "add", event.task, 0 if event.task.id is None else 1)),
+                #a new template may have an occurrence today
+                events.subscribe(TemplateAdded, lambda event: self.mark_dirty("list"))]
+
+    def _on_task_changed(self, change, task, count_delta):
+        if self._priority_counts is not None:
+            self._priority_counts[task.priority] = max(0, self._priority_counts.get(task.priority, 0) + count_delta)
+        if self.search_results is not None:
+            #search results come from the database, so search again; the active list is rebuilt
+            #when the search box is cleared
+            self.dirty.add("list")
+            self._start_search()
+        elif "list" not in self.dirty:
+            self._list_changes.append((change, task))
+            self.dirty.add("list_changes")
+        self.mark_dirty("chart")
+
+    def _paint_preview(self):
+        self._update_xp_preview()
+
+    def _paint_list_changes(self):
+        changes, self._list_changes = self._list_changes, []
+        for change, task in changes:
+            index = next((i for i, t in enumerate(self.displayed_tasks) if same_task(t, task)), None)
+            if change == "remove":
+                if index is not None:
+                    self._remove_row(index)
+            elif index is None and task.id is None:
+                #a recurring occurrence again, those go after the active tasks
+                self.displayed_tasks.append(task)
+                self.listbox.insert(tk.END, self._format_row(task))
+            elif index is None:
+                #completing a recurring task saves it first, which is also a TaskAdded
+                rank = PRIORITY_ORDER[task.priority]
+                index = bisect.bisect_right(self._row_ranks, rank)
+                self._row_ranks.insert(index, rank)
+                self.displayed_tasks.insert(index, task)
+                self.listbox.insert(index, self._format_row(task))
+
+    def _remove_row(self, index):
+        del self.displayed_tasks[index]
+        self.listbox.delete(index)
+        if index < len(self._row_ranks):
+            del self._row_ranks[index]
+
+    def _format_row(self, t):
+        d_text = t.due_date.strftime("%Y-%m-%d") if t.due_date else "No Due Date"
+        if t.template_id is not None:
+            d_text += " (repeats)"
+        #makes sure the columns are roughly aligned -> looks much better than before
+        return f"{t.title:<30} | {t.priority.upper():<10} | {d_text}"
+
+    def _paint_list(self):
         #delete from index 0 to the very last index
         self.listbox.delete(0, tk.END)
         #reset the list to be empty
         self.displayed_tasks = []
-
-        if self.app.task_manager: #make sure everything running properly
+        self._row_ranks = []
+        #the full rebuild already includes anything queued
+        self._list_changes = []
+
+        if self.search_results is not None:
+            self.list_label.config(text="SEARCH RESULTS")
+            tasks = self.search_results
+        elif self.app.task_manager: #make sure everything running properly
+            self.list_label.config(text="ACTIVE TASKS")
             tasks = self.app.task_manager.get_active_tasks()
-            self.displayed_tasks = tasks  #store objects to match listbox index
-
-            for t in tasks:
-                d_text = t.due_date.strftime("%Y-%m-%d") if t.due_date else "No Due Date"
-                #makes sure the columns are roughly aligned -> looks much better than before
-                self.listbox.insert(tk.END, f"{t.title:<30} | {t.priority.upper():<10} | {d_text}")
-
-    def _refresh_chart(self):
+            self._row_ranks = [PRIORITY_ORDER[t.priority] for t in tasks]
+            #recurring tasks only show today's occurrences, they get a row once completed
+            today = datetime.datetime.combine(datetime.date.today(), datetime.time())
+            tasks = tasks + self.app.task_manager.get_occurrences(today, today + datetime.timedelta(days=1))
+        else:
+            return
+        self.displayed_tasks = tasks  #store objects to match listbox index
+
+        for t in tasks:
+            self.listbox.insert(tk.END, self._format_row(t))
+
+    def _on_search_typed(self):
+        #debounce: restart the timer on every keystroke so only the last one searches
+        if self._search_after is not None:
+            self.after_cancel(self._search_after)
+        self._search_after = self.after(SEARCH_DEBOUNCE_MS, self._start_search)
+
+    def _start_search(self):
+        self._search_after = None
+        query = self.search_text.get().strip()
+        self._search_seq += 1
+        if not query or not self.app.task_manager:
+            if self.search_results is not None:
+                self.search_results = None
+                self.mark_dirty("list")
+            return
+        if self._search_thread is None:
+            self._search_thread = threading.Thread(target=self._search_worker, daemon=True)
+            self._search_thread.start()
+        #the path goes with the query: with shards it changes whenever the user switches
+        self._search_requests.put((self._search_seq, self.app.task_manager, query, config.db_path))
+        if self._search_polling is None:
+            self.after(SEARCH_POLL_MS, self._poll_search)
+        self._search_polling = self._search_seq
+
+    def _search_worker(self):
+        #sqlite3 connections can't be shared across threads, so the worker opens its own, again
+        #whenever a query is for another database file
+        #(with a task service there is no local database, RemoteTaskManager ignores conn)
+        worker_conn = worker_path = None
+        while True:
+            seq, task_manager, query, db_path = self._search_requests.get()
+            #skip queries that were already replaced by newer ones
+            while not self._search_requests.empty():
+                seq, task_manager, query, db_path = self._search_requests.get_nowait()
+            try:
+                if not config.service_address and db_path != worker_path:
+                    if worker_conn is not None:
+                        worker_conn.close()
+                    #if connect fails, the next query tries again
+                    worker_conn, worker_path = None, None
+                    worker_conn, worker_path = database.connect(db_path), db_path
+                results = task_manager.search_tasks(query, status=database.ACTIVE_STATUSES,
+                                                    limit=50, conn=worker_conn)
+            except Exception as exc:
+                results = exc
+            self._search_replies.put((seq, results))
+
+    def _poll_search(self):
+        #runs on the Tk thread every SEARCH_POLL_MS until the newest search has answered
+        current = None
+        while not self._search_replies.empty():
+            seq, results = self._search_replies.get_nowait()
+            if seq == self._search_seq:
+                current = results
+        if current is None:
+            if self._search_polling == self._search_seq:
+                self.after(SEARCH_POLL_MS, self._poll_search)
+            else:
+                self._search_polling = None  #the box was cleared, nothing left to wait for
+            return
+        self._search_polling = None
+        if isinstance(current, Exception):
+            print(f"Search failed: {current}")
+            current = []
+        self.search_results = current
+        self.mark_dirty("list")
+
+    def _paint_chart(self):
         if not self.app.task_manager:
             return
+        if self._priority_counts is None:
+            #the database does the counting with a GROUP BY instead of looping over every task,
+            #after that the task events keep the counts up to date
+            self._priority_counts = self.app.task_manager.count_tasks_by("priority",
+                                                                         status=database.ACTIVE_STATUSES)
         #clears all the previous bars
         self.ax.clear()
         counts = {"low": 0, "medium": 0, "high": 0, "critical": 0}
-        for t in self.app.task_manager.active_tasks:
-            if t.priority in counts:
-                counts[t.priority] += 1
+        for priority, count in self._priority_counts.items():
+            if priority in counts:
+                counts[priority] = count
 
         labels = list(counts.keys())
         values = [counts[k] for k in labels]
@@ -395,10 +783,14 @@ class AddTaskPage(tk.Frame):
 from tkcalendar import Calendar
 
 
-class CalendarPage(tk.Frame):
+class CalendarPage(DirtyPage, tk.Frame):
+    #"month" reloads the visible month, "details" only redraws the selected day's list
+    PARTS = ("month", "details")
+
     def __init__(self, parent, app: App):
         super().__init__(parent, bg=BG)
         self.app = app
+        self.dirty = set()
 
         # 1. Header
         app.make_label(self, "CALENDAR & SCHEDULE", font=app.font_lg).pack(pady=(20, 10))
@@ -427,6 +819,15 @@ class CalendarPage(tk.Frame):
 
         # Bind the "Click" event
         self.cal.bind("<<CalendarSelected>>", self._on_day_selected)
+        # recurring tasks are generated per visible month, so refresh when it changes
+        self.cal.bind("<<CalendarMonthChanged>>", lambda event: self.mark_dirty("month", "details"))
+        # active tasks plus recurring occurrences for the visible month
+        self.month_tasks = []
+        # tasks completed in the visible month (older months come from the archive)
+        self.month_history = []
+        # id(task) -> calendar event id of its "task_due" dot, so one dot can be removed
+        self._due_events = {}
+        self.month_range = (None, None)
 
         # 3. Task Details Section
         details_frame = tk.Frame(self, bg=BG)
@@ -439,32 +840,77 @@ class CalendarPage(tk.Frame):
 
         app.make_button(self, "BACK TO MENU", lambda: app.show("MenuPage")).pack(pady=10)
 
-    def on_show(self):
-        """Refreshes events (dots) whenever the page is opened."""
+    def subscribe(self, events):
+        return [events.subscribe(TaskAdded, lambda event: self._on_task_added(event.task)),
+                events.subscribe(TaskCompleted, lambda event: self._on_task_done(event.task, completed=True)),
+                events.subscribe(TaskFailed, lambda event: self._on_task_done(event.task, completed=False)),
+                events.subscribe(TaskRemoved, lambda event: self._on_task_done(event.task, completed=False)),
+                #an undone completion also takes a dot out of the history, simplest to reload
+                events.subscribe(TaskRestored, lambda event: self.mark_dirty("month", "details")),
+                events.subscribe(TemplateAdded, lambda event: self.mark_dirty("month", "details"))]
+
+    def _in_month(self, when):
+        return self.month_range[0] is not None and self.month_range[0] <= when < self.month_range[1]
+
+    def _on_task_added(self, task):
+        #while the month is waiting to be reloaded there is nothing to update
+        if "month" in self.dirty or any(same_task(t, task) for t in self.month_tasks):
+            return
+        self.month_tasks.append(task)
+        if task.due_date:
+            self._add_due_dot(task)
+            self.mark_dirty("details")
+
+    def _on_task_done(self, task, completed):
+        if "month" in self.dirty:
+            return
+        for shown in [t for t in self.month_tasks if same_task(t, task)]:
+            if id(shown) in self._due_events:
+                self.cal.calevent_remove(self._due_events.pop(id(shown)))
+        self.month_tasks = [t for t in self.month_tasks if not same_task(t, task)]
+        if completed and self._in_month(task.completed_at):
+            self.month_history.append(task)
+            self.cal.calevent_create(task.completed_at.date(), "Task Done", "task_done")
+        self.mark_dirty("details")
+
+    def _add_due_dot(self, task):
+        # We strip the time and keep only the date component
+        # task.due_date is a datetime object, so we need .date()
+        self._due_events[id(task)] = self.cal.calevent_create(task.due_date.date(), "Task Due", "task_due")
+
+    def _paint_month(self):
+        """Reloads the visible month's events (dots)."""
         self.cal.calevent_remove("all")  # Clear old dots
+        self._due_events = {}
 
+        self.month_tasks = []
+        self.month_history = []
         if self.app.task_manager:
-            for task in self.app.task_manager.active_tasks:
+            #only the visible month's occurrences are generated
+            month, year = self.cal.get_displayed_month()
+            month_start = datetime.datetime(year, month, 1)
+            month_end = datetime.datetime(year + month // 12, month % 12 + 1, 1)
+            self.month_range = (month_start, month_end)
+            self.month_tasks = (list(self.app.task_manager.active_tasks)
+                                + self.app.task_manager.get_occurrences(month_start, month_end))
+            self.month_history = self.app.task_manager.get_history(month_start, month_end)
+
+            for task in self.month_tasks:
                 if task.due_date:
-                    # We strip the time and keep only the date component
-                    # task.due_date is a datetime object, so we need .date()
-                    d_date = task.due_date.date()
+                    self._add_due_dot(task)
 
-                    self.cal.calevent_create(
-                        d_date,
-                        "Task Due",
-                        "task_due"
-                    )
+            for task in self.month_history:
+                self.cal.calevent_create(task.completed_at.date(), "Task Done", "task_done")
 
         # Color the dots GREEN
         self.cal.tag_config("task_due", background=ACCENT, foreground='white')
-
-        # Trigger the selection logic immediately for the current day
-        # so the list isn't empty when you first open the page
-        self._on_day_selected(None)
+        self.cal.tag_config("task_done", background=SUBTLE, foreground=FG)
 
     def _on_day_selected(self, event):
         """Updates the listbox when a day is clicked."""
+        self._paint_details()
+
+    def _paint_details(self):
         self.details_list.delete(0, tk.END)
 
         # Get the selected date as a string (Format: YYYY-MM-DD)
@@ -472,7 +918,7 @@ class CalendarPage(tk.Frame):
 
         found_any = False
         if self.app.task_manager:
-            for task in self.app.task_manager.active_tasks:
+            for task in self.month_tasks:
                 if task.due_date:
                     # Convert the task's datetime object to the same string format
                     task_date_str = task.due_date.strftime("%Y-%m-%d")
@@ -482,6 +928,10 @@ class CalendarPage(tk.Frame):
                         # Add to list
                         self.details_list.insert(tk.END, f"• {task.title} ({task.priority.upper()})")
                         found_any = True
+            for task in self.month_history:
+                if task.completed_at.strftime("%Y-%m-%d") == selected_date_str:
+                    self.details_list.insert(tk.END, f"✓ {task.title} (done)")
+                    found_any = True
 
         if not found_any:
             self.details_list.insert(tk.END, "(No tasks due on this day)")
@@ -0,0 +1,105 @@
+"""The achievement catalogue.
+
+Every achievement has a fixed integer id, which is also its bit in the
+player's earned set (Player.achievements_earned, stored in the
+players.achievements_earned INTEGER column). "Already earned?" is one bit
+test instead of a scan of the player's achievements, and each achievement
+can only be awarded once.
+
+Across players, database.count_players_with answers "how many players have
+all of these" with a bitwise AND in SQL, and the achievement_counts table
+(kept up to date by triggers on the achievements table) has the number of
+players for each id without scanning anything.
+
+Ids are stored in players' bitsets, so they are never renumbered or reused.
+The rank-up achievements take one id per rank name, from RANK_UP up, in
+the order the ranks were first seen. Ranks can be renamed, added or
+reordered in the config file at any time, so the ids are not worked out
+from the config but kept in the rank_achievements table: database.init_db
+loads them (load_rank_ids) and a new rank name gets the next free id the
+first time it is awarded.
+"""
+from typing import NamedTuple
+
+from config import current_config
+
+
+class AchievementInfo(NamedTuple):
+    id: int
+    name: str
+    description: str
+    xp_reward: int
+
+
+FIRST_TASK = 0
+EARLY_BIRD = 1
+#ids 2-7 are free for new achievements, the rank-ups start at RANK_UP
+RANK_UP = 8
+#sqlite INTEGERs are signed 64-bit, rank names past this many get no achievement
+MAX_RANKS = 63 - RANK_UP
+
+CATALOGUE = {
+    FIRST_TASK: AchievementInfo(FIRST_TASK, "First Task Completed", "Awarded for completing your first task.", 25),
+    EARLY_BIRD: AchievementInfo(EARLY_BIRD, "Early Bird", "Awarded for completing 10 tasks early.", 50),
+}
+RANK_UP_XP = 50
+
+#rank name -> rank-up achievement id and back, as stored in the rank_achievements table
+_rank_ids = {}
+_rank_names = {}
+
+
+def load_rank_ids(rows):
+    """Replace the rank ids with (rank_name, achievement_id) rows, done by database.init_db."""
+    _rank_ids.clear()
+    _rank_names.clear()
+    for rank_name, achievement_id in rows:
+        _rank_ids[rank_name] = achievement_id
+        _rank_names[achievement_id] = rank_name
+
+
+def rank_up_id(rank_name):
+    """The id of the rank-up achievement for rank_name, None for a rank without one."""
+    if rank_name in _rank_ids:
+        return _rank_ids[rank_name]
+    if rank_name not in current_config().rank_names:
+        return None
+    #a rank added to the config since init_db gets its id now, for good
+    import database
+    achievement_id = database.assign_rank_achievement(rank_name, RANK_UP, RANK_UP + MAX_RANKS - 1)
+    if achievement_id is not None:
+        _rank_ids[rank_name] = achievement_id
+        _rank_names[achievement_id] = rank_name
+    return achievement_id
+
+
+def get(achievement_id):
+    """The AchievementInfo for an id. KeyError if there is no such achievement."""
+    if achievement_id in CATALOGUE:
+        return CATALOGUE[achievement_id]
+    if achievement_id in _rank_names:
+        rank_name = _rank_names[achievement_id]
+        return AchievementInfo(achievement_id, f"Rank Up: {rank_name}", f"Reached the {rank_name} rank!",
+                               RANK_UP_XP)
+    raise KeyError(achievement_id)
+
+
+def has(earned, achievement_id):
+    return bool(earned >> achievement_id & 1)
+
+
+def mask(achievement_ids):
+    bits = 0
+    for achievement_id in achievement_ids:
+        bits |= 1 << achievement_id
+    return bits
+
+
+def ids(earned):
+    """The ids set in a bitset, lowest first."""
+    found = []
+    while earned:
+        low = earned & -earned
+        found.append(low.bit_length() - 1)
+        earned ^= low
+    return found
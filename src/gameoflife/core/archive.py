@@ -0,0 +1,111 @@
+"""Moving old completed tasks out of the live tasks table.
+
+Completed tasks used to stay in tasks forever, so every login loaded all of
+them and the per-user indexes kept growing. Tasks completed more than
+config.archive_after_days ago are moved to tasks_archive instead, and their
+counts are added to task_rollups so count_tasks_by totals don't change. The
+history view (database.get_task_history) only reads the archive when asked
+for dates that old.
+
+After archiving, compact() returns the freed pages to the filesystem with
+incremental_vacuum and refreshes the query planner stats with PRAGMA optimize.
+
+    python archive.py                   # archive the app database
+    python archive.py --db path/to/gamelife.db --days 30 --vacuum
+"""
+import argparse
+import datetime
+
+from config import config, TaskStatus
+import database
+import timestamps
+
+
+def archive_range(cur, lo, hi, cutoff):
+    """Move tasks of users in [lo, hi] completed before cutoff into the archive.
+
+    Doesn't commit, so it can run inside a caller's transaction (the nightly
+    batch runs it as one of its jobs). Returns how many tasks were moved.
+    """
+    mode = timestamps.detect_mode(cur.connection)
+    params = {'lo': lo, 'hi': hi, 'completed': TaskStatus.COMPLETED,
+              'cutoff': timestamps.encode(cutoff, mode),
+              'now': timestamps.encode(datetime.datetime.now(), mode)}
+    where = """user_id BETWEEN :lo AND :hi AND status = :completed
+               AND completed_at IS NOT NULL AND completed_at < :cutoff"""
+
+    cur.execute(f"""INSERT INTO tasks_archive ({database.TASK_COLUMNS}, external_uid, archived_at)
+                    SELECT {database.TASK_COLUMNS}, external_uid, :now FROM tasks WHERE {where}""", params)
+    moved = cur.rowcount
+    if moved <= 0:
+        return 0
+    cur.execute(f"""INSERT INTO task_rollups (user_id, priority, status, due_day, count)
+                    SELECT user_id, priority, status,
+                           COALESCE({timestamps.day_sql('due_date', mode)}, ''), COUNT(*)
+                    FROM tasks WHERE {where}
+                    GROUP BY 1, 2, 3, 4
+                    ON CONFLICT (user_id, priority, status, due_day)
+                    DO UPDATE SET count = count + excluded.count""", params)
+    cur.execute(f"DELETE FROM tasks WHERE {where}", params)
+    return moved
+
+
+def archive_completed(conn=None, days=None, now=None, batch_size=1000, progress=None):
+    """Archive every user's old completed tasks, committing every batch_size users."""
+    conn = conn or database.conn
+    days = config.archive_after_days if days is None else days
+    cutoff = (now or datetime.datetime.now()) - datetime.timedelta(days=days)
+    min_id, max_id = conn.execute("SELECT MIN(id), MAX(id) FROM users").fetchone()
+    if min_id is None:
+        return 0
+    cur = conn.cursor()
+    moved = 0
+    for lo in range(min_id, max_id + 1, batch_size):
+        with conn:
+            count = archive_range(cur, lo, min(lo + batch_size - 1, max_id), cutoff)
+        moved += count
+        if progress and count:
+            progress(moved)
+    #cached counts would now count the archived tasks twice
+    database._invalidate_counts()
+    return moved
+
+
+def compact(conn=None, pages=None, vacuum=False):
+    """Give free pages back to the filesystem and refresh planner stats.
+
+    pages limits how many pages incremental_vacuum frees (None frees them all).
+    Databases created before incremental auto_vacuum was turned on need one full
+    VACUUM to switch over, pass vacuum=True for that; otherwise the free pages
+    are simply reused by later inserts. Returns the number of pages freed.
+    """
+    conn = conn or database.conn
+    free_before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:  # 2 = INCREMENTAL
+        conn.execute("PRAGMA incremental_vacuum" + (f"({int(pages)})" if pages else ""))
+    elif vacuum:
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+    conn.execute("PRAGMA optimize")
+    return free_before - conn.execute("PRAGMA freelist_count").fetchone()[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive old completed tasks and compact the database.")
+    parser.add_argument("--db", help="database path (defaults to the app database)")
+    parser.add_argument("--days", type=int, default=None,
+                        help=f"archive tasks completed more than this many days ago "
+                             f"(default {config.archive_after_days})")
+    parser.add_argument("--vacuum", action="store_true",
+                        help="run a full VACUUM if the database isn't set up for incremental vacuum yet")
+    args = parser.parse_args()
+
+    database.init_db(args.db)
+    moved = archive_completed(days=args.days, progress=lambda n: print(f"  {n} tasks archived"))
+    freed = compact(vacuum=args.vacuum)
+    print(f"Archived {moved} tasks, freed {freed} pages")
+    database.close_db()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Asyncio front end for TaskManager and the database layer.
+
+sqlite3 calls block, so running TaskManager.complete_task inside a coroutine
+would stall the event loop. AsyncTaskManager hands every call to a DBExecutor:
+a single worker thread that owns all access to the global database connection,
+plus a semaphore that caps how many calls may be queued at once. When the cap
+is reached further callers wait (backpressure) instead of piling up work.
+
+    async_tm = AsyncTaskManager(task_manager)
+    await async_tm.add_task(Task("Write report"))
+"""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+import database
+import session
+
+#how many database calls may be queued or running before callers have to wait
+DEFAULT_MAX_PENDING = 256
+
+
+class DBExecutor:
+    """Runs blocking database calls on one dedicated thread with a bounded queue."""
+
+    def __init__(self, max_pending=DEFAULT_MAX_PENDING):
+        #one thread: the global sqlite3 connection and cursor are not safe to share concurrently
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="gameoflife-db")
+        self._slots = asyncio.Semaphore(max_pending)
+        self.max_pending = max_pending
+        #calls currently queued or running on the DB thread
+        self.pending = 0
+
+    async def run(self, fn, *args, **kwargs):
+        async with self._slots:
+            self.pending += 1
+            try:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self._pool, functools.partial(fn, *args, **kwargs))
+            finally:
+                self.pending -= 1
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait)
+
+
+_default_executor = None
+
+
+def default_executor():
+    """Executor shared by every AsyncTaskManager that isn't given its own."""
+    global _default_executor
+    if _default_executor is None:
+        _default_executor = DBExecutor()
+    return _default_executor
+
+
+class AsyncTaskManager:
+    """Async versions of the TaskManager calls, all run on the DB executor."""
+
+    def __init__(self, task_manager, executor=None):
+        self.task_manager = task_manager
+        self.executor = executor or default_executor()
+
+    @property
+    def player(self):
+        return self.task_manager.player
+
+    async def add_task(self, task):
+        return await self.executor.run(self.task_manager.add_task, task)
+
+    async def complete_task(self, task):
+        return await self.executor.run(self.task_manager.complete_task, task)
+
+    async def fail_task(self, task):
+        return await self.executor.run(self.task_manager.fail_task, task)
+
+    async def get_active_tasks(self, sort_by='priority', unblocked=False):
+        #in-memory, but it goes through the executor too so it never reads a list mid-update
+        return await self.executor.run(self.task_manager.get_active_tasks, sort_by, unblocked)
+
+    async def load_player_stats(self):
+        """Player row for this user as a dict of column name -> value."""
+        return await self.executor.run(_player_stats, self.task_manager.user_id)
+
+
+async def load_session(user_obj, user_id, executor=None):
+    """Async counterpart of session.load_session, returning an AsyncTaskManager."""
+    executor = executor or default_executor()
+    task_manager = await executor.run(session.load_session, user_obj, user_id)
+    return AsyncTaskManager(task_manager, executor)
+
+
+def _player_stats(user_id):
+    database.c.execute("SELECT * FROM players WHERE user_id = :user_id", {'user_id': user_id})
+    row = database.c.fetchone()
+    if row is None:
+        return None
+    return {col[0]: value for col, value in zip(database.c.description, row)}
@@ -0,0 +1,242 @@
+"""Online backups of the game database with sqlite's backup API.
+
+Copying gamelife.db with a file copy while the app is writing to it can give
+a corrupt copy. backup() uses Connection.backup instead, which copies the
+database a page at a time under sqlite's own locking: BACKUP_PAGES pages per
+step, pausing BACKUP_PAUSE seconds between steps. The database is in WAL
+mode (see database.init_db), so the backup holds one read transaction for the
+whole copy: the app's commits carry on into the WAL and the backup is the
+database as it was when it started. (A database not in WAL mode is copied
+without holding the transaction, and sqlite restarts the copy whenever
+another connection writes to it.)
+
+Backups go to a backups/ folder next to the database, named after it and the
+time they were taken (gamelife-20261019-030000-123456.db). Each one is written to a
+.part file and renamed when complete, and only config.backup_generations of
+them are kept. A config.backup_verify_rate fraction of new backups is checked
+with PRAGMA integrity_check; a restore always checks the backup first.
+
+The GUI runs start_backup() once a day on a background thread.
+
+    python backup.py                        # back up the app database
+    python backup.py --db path/to/gamelife.db --keep 3 --verify-rate 1
+    python backup.py --list
+    python backup.py --restore latest       # or a backup's path; close the app first
+"""
+import argparse
+import datetime
+import random
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from config import config
+import database
+import snapshot
+
+#pages copied per backup step (4 KiB each by default) and the pause between steps
+BACKUP_PAGES = 256
+BACKUP_PAUSE = 0.005
+
+
+class BackupCancelled(Exception):
+    pass
+
+
+def backup_dir(db_path=None):
+    db_path = Path(str(db_path or config.db_path))
+    return db_path.parent / "backups"
+
+
+def list_backups(db_path=None):
+    """The database's backups, newest first."""
+    db_path = Path(str(db_path or config.db_path))
+    folder = backup_dir(db_path)
+    if not folder.is_dir():
+        return []
+    #a glob on "<stem>-*" would also take the backups of e.g. <stem>-test.db from the same folder
+    name = re.compile(rf"{re.escape(db_path.stem)}-\d{{8}}-\d{{6}}-\d{{6}}\.db")
+    #the timestamp in the name sorts the same way as the dates
+    return sorted((p for p in folder.iterdir() if name.fullmatch(p.name)), key=lambda p: p.name, reverse=True)
+
+
+def verify(path):
+    """Run PRAGMA integrity_check on a backup. Returns the problems found, empty if there are none."""
+    check = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        rows = [row[0] for row in check.execute("PRAGMA integrity_check")]
+    finally:
+        check.close()
+    return [] if rows == ["ok"] else rows
+
+
+def backup(db_path=None, pages=BACKUP_PAGES, pause=BACKUP_PAUSE, keep=None, verify_rate=None,
+           progress=None, cancel=None):
+    """Copy the database into a new backup and drop the oldest ones beyond `keep`.
+
+    Opens its own connection, so it can run on any thread. progress(remaining,
+    total) is called after each step; setting the `cancel` Event stops the
+    backup and raises BackupCancelled. Returns the backup's path.
+    """
+    db_path = Path(str(db_path or config.db_path))
+    if str(db_path) == ":memory:":
+        raise ValueError("an in-memory database can't be backed up")
+    keep = config.backup_generations if keep is None else keep
+    verify_rate = config.backup_verify_rate if verify_rate is None else verify_rate
+
+    folder = backup_dir(db_path)
+    folder.mkdir(parents=True, exist_ok=True)
+    target = folder / f"{db_path.stem}-{datetime.datetime.now():%Y%m%d-%H%M%S-%f}.db"
+    part = target.with_name(target.name + ".part")
+
+    def step(status, remaining, total):
+        if cancel is not None and cancel.is_set():
+            raise BackupCancelled()
+        if progress:
+            progress(remaining, total)
+        #sqlite3 releases the GIL during each step, this pause lets writers have the database
+        if remaining and pause:
+            time.sleep(pause)
+
+    source = database.connect(db_path)
+    dest = sqlite3.connect(part)
+    try:
+        if source.execute("PRAGMA journal_mode").fetchone()[0] == "wal":
+            #the read transaction pins the version being copied until the backup is done
+            source.execute("BEGIN")
+            source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+        source.backup(dest, pages=pages, progress=step)
+        #the copy comes out in WAL mode like the database, make it a single self-contained file
+        dest.execute("PRAGMA journal_mode = DELETE")
+    except BaseException:
+        dest.close()
+        _remove(part)
+        raise
+    finally:
+        source.close()
+    dest.close()
+
+    if verify_rate and random.random() < verify_rate:
+        problems = verify(part)
+        if problems:
+            _remove(part)
+            raise sqlite3.DatabaseError(f"backup failed its integrity check: {problems[:5]}")
+    part.replace(target)
+    rotate(db_path, keep)
+    return target
+
+
+def _remove(path):
+    for name in (path.name, path.name + "-wal", path.name + "-shm", path.name + "-journal"):
+        path.with_name(name).unlink(missing_ok=True)
+
+
+def rotate(db_path=None, keep=None):
+    """Delete all but the `keep` newest backups, and any .part files left by an interrupted backup."""
+    keep = config.backup_generations if keep is None else keep
+    for old in list_backups(db_path)[keep:]:
+        old.unlink(missing_ok=True)
+    #a backup still being written by another process is left alone for a while
+    cutoff = time.time() - 3600
+    for stale in backup_dir(db_path).glob("*.part"):
+        if stale.stat().st_mtime < cutoff:
+            _remove(stale)
+
+
+def restore(backup_path, db_path=None):
+    """Replace the database's contents with a backup.
+
+    The backup is checked with PRAGMA integrity_check first and nothing is
+    touched if it fails. The app should be closed: a running app would keep
+    (and save) the state it loaded before the restore. Login snapshots are
+    deleted since they describe the replaced data.
+    """
+    db_path = db_path or config.db_path
+    backup_path = Path(backup_path)
+    if not backup_path.is_file():
+        raise FileNotFoundError(f"no backup at {backup_path}")
+    problems = verify(backup_path)
+    if problems:
+        raise sqlite3.DatabaseError(f"{backup_path} failed its integrity check: {problems[:5]}")
+
+    source = sqlite3.connect(f"file:{backup_path}?mode=ro", uri=True)
+    dest = database.connect(db_path)
+    try:
+        source.backup(dest)
+    finally:
+        source.close()
+        dest.close()
+    snapshot.discard_all(db_path)
+
+
+class BackupJob:
+    """A backup() running on a daemon thread, see start_backup."""
+
+    def __init__(self, **options):
+        self.path = None
+        self.error = None
+        self._cancel = threading.Event()
+        self._thread = threading.Thread(target=self._run, kwargs=options, daemon=True)
+
+    def _run(self, **options):
+        try:
+            self.path = backup(cancel=self._cancel, **options)
+        except BaseException as exc:
+            self.error = exc
+
+    def done(self):
+        return not self._thread.is_alive()
+
+    def cancel(self):
+        self._cancel.set()
+
+
+def start_backup(**options):
+    """Start backup(**options) on a background thread. Poll the returned job's done()."""
+    job = BackupJob(**options)
+    job._thread.start()
+    return job
+
+
+def newest_backup_age(db_path=None):
+    """Time since the newest backup was written, None if there isn't one."""
+    backups = list_backups(db_path)
+    if not backups:
+        return None
+    return datetime.datetime.now() - datetime.datetime.fromtimestamp(backups[0].stat().st_mtime)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Back up the game database, or restore a backup.")
+    parser.add_argument("--db", help="database path (defaults to the app database)")
+    parser.add_argument("--keep", type=int, default=None,
+                        help=f"backups to keep (default {config.backup_generations})")
+    parser.add_argument("--verify-rate", type=float, default=None,
+                        help=f"fraction of backups to integrity check, 0 to 1 (default {config.backup_verify_rate})")
+    parser.add_argument("--list", action="store_true", help="list the backups, newest first")
+    parser.add_argument("--restore", metavar="BACKUP", help="restore a backup's path, or 'latest'")
+    args = parser.parse_args()
+    if args.db:
+        config.db_path = args.db
+
+    if args.list:
+        for path in list_backups():
+            print(f"{path}\t{path.stat().st_size} bytes")
+    elif args.restore:
+        if args.restore == "latest":
+            backups = list_backups()
+            if not backups:
+                parser.exit(1, "No backups to restore\n")
+            args.restore = backups[0]
+        restore(args.restore)
+        print(f"Restored {args.restore}")
+    else:
+        started = time.perf_counter()
+        path = backup(keep=args.keep, verify_rate=args.verify_rate)
+        print(f"Backed up to {path} in {time.perf_counter() - started:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+"""Nightly batch jobs run across every player in the database.
+
+Players are split into user_id ranges (shards) and each shard is handled by a
+worker process with its own sqlite3 connection. Work inside a shard is
+committed every `batch_size` players so a long run never holds the write lock
+for long.
+
+Run it directly for a synthetic benchmark:
+    python batch.py --synthetic /tmp/bench.db --players 100000 --workers 4
+"""
+import argparse
+import datetime
+import os
+import random
+import time
+from multiprocessing import Pool
+
+from config import config, current_config, TaskPriority, TaskStatus
+import archive
+import database
+import streaks
+import timestamps
+
+#job names in the order they run for each batch of players
+JOBS = ("sweep_overdue", "reset_streaks", "recompute_levels", "archive_completed")
+
+
+def make_shards(min_id, max_id, shard_count):
+    """Split the inclusive user_id range [min_id, max_id] into shard_count ranges."""
+    if min_id is None or max_id is None:
+        return []
+    span = max_id - min_id + 1
+    shard_count = max(1, min(shard_count, span))
+    step = -(-span // shard_count)  # ceiling division
+    return [(lo, min(lo + step - 1, max_id)) for lo in range(min_id, max_id + 1, step)]
+
+
+def sweep_overdue(cur, lo, hi, now):
+    """Fail overdue active tasks for users in [lo, hi] and charge their penalties."""
+    snapshot = current_config()
+    active = database.ACTIVE_STATUSES
+    mode = timestamps.detect_mode(cur.connection)
+    params = {'lo': lo, 'hi': hi, 'now': timestamps.encode(now, mode),
+              'active0': active[0], 'active1': active[1]}
+    where = """user_id BETWEEN :lo AND :hi AND status IN (:active0, :active1)
+               AND due_date IS NOT NULL AND due_date < :now"""
+
+    cur.execute(f"""SELECT user_id, priority, COUNT(*) FROM tasks
+                    WHERE {where} GROUP BY user_id, priority""", params)
+    per_user = {}
+    for user_id, priority, count in cur.fetchall():
+        xp_lost, failed = per_user.get(user_id, (0, 0))
+        per_user[user_id] = (xp_lost + getattr(snapshot.penalties, priority, 0) * count, failed + count)
+
+    if not per_user:
+        return 0
+    cur.execute(f"UPDATE tasks SET status = :failed WHERE {where}",
+                dict(params, failed=TaskStatus.FAILED))
+    cur.executemany("""UPDATE players SET
+                       xp = MAX(:floor, xp - :xp_lost),
+                       tasks_failed = tasks_failed + :failed
+                       WHERE user_id = :user_id""",
+                    [{'floor': snapshot.xp_floor, 'xp_lost': xp_lost,
+                      'failed': failed, 'user_id': user_id}
+                     for user_id, (xp_lost, failed) in per_user.items()])
+    return sum(failed for _, failed in per_user.values())
+
+
+def reset_streaks(cur, lo, hi, now):
+    """Zero the streak of players in [lo, hi] who missed a day (see streaks.rollover)."""
+    return streaks.rollover(cur, now.date(), (lo, hi))
+
+
+def recompute_levels(cur, lo, hi, now):
+    """Bring level and rank of players in [lo, hi] in line with their XP and the current config."""
+    snapshot = current_config()
+    params = {'lo': lo, 'hi': hi, 'per_level': snapshot.xp_per_level}
+    cases = []
+    #ranks are checked highest first, giving the same answer as Player.get_rank
+    for i in range(len(snapshot.rank_xp) - 1, -1, -1):
+        cases.append(f"WHEN xp >= :min{i} THEN :rank{i}")
+        params[f"min{i}"] = snapshot.rank_xp[i]
+        params[f"rank{i}"] = snapshot.rank_names[i]
+    params['lowest'] = snapshot.rank_names[0]
+    #level never goes down, matching Player._check_level_up
+    cur.execute(f"""UPDATE players SET
+                    level = MAX(level, xp / :per_level + 1),
+                    previous_rank = CASE {' '.join(cases)} ELSE :lowest END
+                    WHERE user_id BETWEEN :lo AND :hi""", params)
+    return cur.rowcount
+
+
+def archive_completed(cur, lo, hi, now):
+    """Move tasks of users in [lo, hi] completed over archive_after_days ago to tasks_archive."""
+    cutoff = now - datetime.timedelta(days=current_config().archive_after_days)
+    return archive.archive_range(cur, lo, hi, cutoff)
+
+
+_JOB_FUNCTIONS = {
+    "sweep_overdue": sweep_overdue,
+    "reset_streaks": reset_streaks,
+    "recompute_levels": recompute_levels,
+    "archive_completed": archive_completed,
+}
+
+
+def run_shard(shard):
+    """Worker entry point: run every job over one user_id range, committing per batch."""
+    db_path, lo, hi, batch_size, jobs, now = shard
+    worker_conn = database.connect(db_path)
+    cur = worker_conn.cursor()
+    started = time.perf_counter()
+    totals = dict.fromkeys(jobs, 0)
+    players = 0
+    try:
+        for batch_lo in range(lo, hi + 1, batch_size):
+            batch_hi = min(batch_lo + batch_size - 1, hi)
+            with worker_conn:
+                for job in jobs:
+                    totals[job] += _JOB_FUNCTIONS[job](cur, batch_lo, batch_hi, now)
+            cur.execute("SELECT COUNT(*) FROM players WHERE user_id BETWEEN ? AND ?",
+                        (batch_lo, batch_hi))
+            players += cur.fetchone()[0]
+    finally:
+        worker_conn.close()
+    return {'pid': os.getpid(), 'shard': (lo, hi), 'players': players,
+            'seconds': time.perf_counter() - started, 'rows': totals}
+
+
+def run_batch(db_path=None, workers=None, shards=None, batch_size=1000, jobs=JOBS, now=None):
+    """Run the nightly jobs over all players and return a per-worker throughput report."""
+    db_path = db_path or config.db_path
+    workers = workers or os.cpu_count() or 1
+    #a few shards per worker keeps the pool busy when some id ranges are denser than others
+    shards = shards or workers * 4
+    now = now or datetime.datetime.now()
+
+    main_conn = database.connect(db_path)
+    #WAL lets workers read while another one holds the write lock
+    main_conn.execute("PRAGMA journal_mode = WAL")
+    min_id, max_id = main_conn.execute("SELECT MIN(user_id), MAX(user_id) FROM players").fetchone()
+    main_conn.close()
+
+    specs = [(db_path, lo, hi, batch_size, tuple(jobs), now)
+             for lo, hi in make_shards(min_id, max_id, shards)]
+    started = time.perf_counter()
+    if workers == 1:
+        results = [run_shard(spec) for spec in specs]
+    else:
+        with Pool(workers) as pool:
+            results = pool.map(run_shard, specs)
+    elapsed = time.perf_counter() - started
+
+    if "archive_completed" in jobs:
+        #hand the pages freed by archiving back once all the workers are done
+        main_conn = database.connect(db_path)
+        archive.compact(main_conn)
+        main_conn.close()
+
+    per_worker = {}
+    for result in results:
+        stats = per_worker.setdefault(result['pid'], {'players': 0, 'seconds': 0.0, 'shards': 0})
+        stats['players'] += result['players']
+        stats['seconds'] += result['seconds']
+        stats['shards'] += 1
+    for stats in per_worker.values():
+        stats['players_per_sec'] = stats['players'] / stats['seconds'] if stats['seconds'] else 0.0
+
+    rows = dict.fromkeys(jobs, 0)
+    for result in results:
+        for job, count in result['rows'].items():
+            rows[job] += count
+    total_players = sum(r['players'] for r in results)
+    return {'players': total_players, 'seconds': elapsed,
+            'players_per_sec': total_players / elapsed if elapsed else 0.0,
+            'rows': rows, 'workers': per_worker}
+
+
+def make_synthetic_db(db_path, players, tasks_per_player=5, seed=0):
+    """Fill a fresh database with `players` users, each with a handful of random tasks."""
+    database.init_db(db_path)
+    rng = random.Random(seed)
+    now = datetime.datetime.now()
+    ts = lambda value: timestamps.encode(value, database.timestamp_mode)
+    priorities = (TaskPriority.LOW, TaskPriority.MEDIUM, TaskPriority.HIGH, TaskPriority.CRITICAL)
+    statuses = (TaskStatus.PENDING, TaskStatus.PENDING, TaskStatus.COMPLETED)
+    conn = database.conn
+    with conn:
+        conn.executemany("INSERT INTO users (id, username, email, created_at) VALUES (?, ?, ?, ?)",
+                         ((i, f"player{i}", f"player{i}@example.com", ts(now))
+                          for i in range(1, players + 1)))
+        conn.executemany("""INSERT INTO players (user_id, xp, level, current_streak)
+                            VALUES (?, ?, 1, ?)""",
+                         ((i, rng.randrange(0, 6000), rng.randrange(0, 10))
+                          for i in range(1, players + 1)))
+        rows = []
+        for user_id in range(1, players + 1):
+            for _ in range(tasks_per_player):
+                status = rng.choice(statuses)
+                due = now + datetime.timedelta(hours=rng.randrange(-96, 96))
+                completed = ts(now - datetime.timedelta(hours=rng.randrange(0, 72))) \
+                    if status == TaskStatus.COMPLETED else None
+                rows.append((user_id, "task", rng.choice(priorities), status,
+                             ts(due), "", ts(now), completed))
+        conn.executemany("""INSERT INTO tasks (user_id, title, priority, status, due_date,
+                            description, created_at, completed_at)
+                            VALUES (?, ?, ?, ?, ?, ?, ?, ?)""", rows)
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the nightly jobs across all players.")
+    parser.add_argument("--db", help="database path (defaults to the app database)")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--synthetic", metavar="PATH",
+                        help="build a synthetic database at PATH first and run against it")
+    parser.add_argument("--players", type=int, default=100000)
+    args = parser.parse_args()
+
+    db_path = args.db
+    if args.synthetic:
+        if os.path.exists(args.synthetic):
+            os.remove(args.synthetic)
+        started = time.perf_counter()
+        make_synthetic_db(args.synthetic, args.players)
+        print(f"Built {args.players} synthetic players in {time.perf_counter() - started:.1f}s")
+        db_path = args.synthetic
+
+    report = run_batch(db_path, workers=args.workers, batch_size=args.batch_size)
+    print(f"{report['players']} players in {report['seconds']:.2f}s "
+          f"({report['players_per_sec']:.0f} players/s)")
+    for job, count in report['rows'].items():
+        print(f"  {job}: {count} rows")
+    for pid, stats in sorted(report['workers'].items()):
+        print(f"  worker {pid}: {stats['players']} players, {stats['shards']} shards, "
+              f"{stats['players_per_sec']:.0f} players/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Benchmark: importing a large .ics file, then importing it again.
+
+Writes --events VEVENTs (a third with a TZID, a third in UTC, some folded
+descriptions and alarms) to a temporary file and times ics.import_ics on it,
+then on the same file again, where every entry is found by its UID and
+nothing is added. With --memory the peak Python memory of each import is
+shown as well (tracemalloc slows the import down a lot, so the times are
+then off): the file is streamed, so it stays about the same for 10k or 1M
+events.
+
+    python bench_ics.py --events 100000
+"""
+import argparse
+import datetime
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+from config import config
+import database
+import ics
+
+
+def write_calendar(path, event_count, seed):
+    rng = random.Random(seed)
+    start = datetime.datetime.now() + datetime.timedelta(days=1)
+    with open(path, "w", encoding="utf-8", newline="") as out:
+        out.write("BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//bench//EN\r\n")
+        for i in range(event_count):
+            when = start + datetime.timedelta(minutes=rng.randint(0, 60 * 24 * 365))
+            kind = i % 3
+            if kind == 0:
+                dtstart = f"DTSTART;TZID=Europe/Berlin:{when:%Y%m%dT%H%M%S}"
+            elif kind == 1:
+                dtstart = f"DTSTART:{when:%Y%m%dT%H%M%S}Z"
+            else:
+                dtstart = f"DTSTART:{when:%Y%m%dT%H%M%S}"
+            out.write(f"BEGIN:VEVENT\r\nUID:event-{i}@bench\r\nSUMMARY:Event {i}\r\n{dtstart}\r\n"
+                      f"DURATION:PT{rng.choice((15, 30, 45, 60, 90))}M\r\nPRIORITY:{rng.randint(0, 9)}\r\n")
+            if i % 10 == 0:
+                out.write("DESCRIPTION:A longer description that is folded over\r\n  more than one line\\, "
+                          "like calendar exports do\r\n")
+                out.write("BEGIN:VALARM\r\nACTION:DISPLAY\r\nDESCRIPTION:Reminder\r\nTRIGGER:-PT15M\r\n"
+                          "END:VALARM\r\n")
+            out.write("END:VEVENT\r\n")
+        out.write("END:VCALENDAR\r\n")
+
+
+def timed(label, path, user_id, memory):
+    if memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    with open(path, encoding="utf-8") as source:
+        result = ics.import_ics(source, user_id)
+    elapsed = time.perf_counter() - started
+    peak = ""
+    if memory:
+        peak = f"  peak {tracemalloc.get_traced_memory()[1] / 2**20:5.1f} MB"
+        tracemalloc.stop()
+    print(f"{label:18}{elapsed * 1000:10.1f} ms{peak}  "
+          f"{result.imported} imported, {result.duplicates} duplicates, {result.skipped} skipped")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark importing and re-importing a large .ics file.")
+    parser.add_argument("--events", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--memory", action="store_true", help="also show peak memory (slower)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.ics")
+        write_calendar(path, args.events, args.seed)
+        print(f"{args.events} events, {os.path.getsize(path) / 2**20:.1f} MB")
+        config.db_path = os.path.join(tmp, "ics.db")
+        database.init_db()
+        from game import User
+        user_id = database.insert_user(User("bench", ""))
+
+        first = timed("import", path, user_id, args.memory)
+        again = timed("import again", path, user_id, args.memory)
+        assert first.imported == args.events and again.imported == 0, (first, again)
+        database.close_db()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Benchmark: login time for a player with many tasks, cold (SQL) vs warm (snapshot).
+
+    python bench_login.py --tasks 50000
+"""
+import argparse
+import datetime
+import os
+import tempfile
+import time
+
+from config import config, TaskPriority, TaskStatus
+from game import User
+import database
+import session
+import snapshot
+import timestamps
+
+
+def build_db(task_count):
+    user = User("bench", "bench@example.com")
+    user_id = database.insert_user(user)
+    database.insert_player(user_id)
+    now = datetime.datetime.now()
+    priorities = (TaskPriority.LOW, TaskPriority.MEDIUM, TaskPriority.HIGH, TaskPriority.CRITICAL)
+    ts = lambda value: timestamps.encode(value, database.timestamp_mode)
+    rows = []
+    for i in range(task_count):
+        status = TaskStatus.COMPLETED if i % 3 == 0 else TaskStatus.PENDING
+        completed = ts(now - datetime.timedelta(hours=i % 500)) if status == TaskStatus.COMPLETED else None
+        rows.append((user_id, f"Task number {i}", priorities[i % 4], status,
+                     ts(now + datetime.timedelta(hours=i % 1000)),
+                     "benchmark task", ts(now), completed))
+    with database.conn:
+        database.conn.executemany("""INSERT INTO tasks (user_id, title, priority, status, due_date,
+                                     description, created_at, completed_at)
+                                     VALUES (?, ?, ?, ?, ?, ?, ?, ?)""", rows)
+    return user, user_id
+
+
+def timed(label, fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    print(f"{label:<28} {best * 1000:8.1f} ms")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tasks", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        config.db_path = os.path.join(tmp, "bench.db")
+        database.init_db()
+        user, user_id = build_db(args.tasks)
+        print(f"{args.tasks} tasks")
+
+        def cold():
+            snapshot.discard(user_id)
+            return session.load_session(user, user_id)
+
+        timed("cold login (SQL + parse)", cold, args.repeat)
+        tm = timed("warm login (snapshot)", lambda: session.load_session(user, user_id), args.repeat)
+        assert len(tm.active_tasks) + len(tm.completed_tasks) == args.tasks
+        database.conn.close()
+
+
+if __name__ == "__main__":
+    main()
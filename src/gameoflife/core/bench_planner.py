@@ -0,0 +1,92 @@
+"""Benchmark: TaskManager.plan on a large task list.
+
+Builds --tasks active tasks with random priorities, estimated durations and
+due dates (some within the free time, some days away, some without one) and
+times plan(--minutes): the first call, which works out every task's value,
+then calls after adding a task and after completing one the plan didn't
+pick, which reuse what the planner already has. The exact mode is timed on
+the first --exact-tasks tasks only, it is far slower on the full list.
+
+    python bench_planner.py --tasks 10000 --minutes 240
+"""
+import argparse
+import datetime
+import os
+import random
+import tempfile
+import time
+
+from config import config, Task, TaskPriority
+import database
+import session
+
+
+def build(task_count, seed):
+    rng = random.Random(seed)
+    task_manager = session.login("bench")
+    priorities = (TaskPriority.LOW, TaskPriority.MEDIUM, TaskPriority.HIGH, TaskPriority.CRITICAL)
+    now = datetime.datetime.now()
+    tasks = []
+    for i in range(task_count):
+        kind = rng.random()
+        if kind < 0.2:
+            due = None
+        elif kind < 0.5:
+            due = now + datetime.timedelta(minutes=rng.randint(20, 300))
+        else:
+            due = now + datetime.timedelta(days=rng.randint(1, 14))
+        tasks.append(Task(f"task {i}", rng.choice(priorities), due_date=due,
+                          estimated_duration=rng.choice((None, 5, 10, 15, 25, 45, 60, 90))))
+    database.insert_tasks(tasks, task_manager.user_id)
+    return session.login("bench")
+
+
+def ms(seconds):
+    return f"{seconds * 1000:8.2f} ms"
+
+
+def timed(label, call):
+    started = time.perf_counter()
+    plan = call()
+    print(f"{label:32}{ms(time.perf_counter() - started)}  "
+          f"{len(plan.tasks)} tasks, {plan.minutes} min, {plan.xp} XP")
+    return plan
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the task planner on a large task list.")
+    parser.add_argument("--tasks", type=int, default=10000)
+    parser.add_argument("--minutes", type=int, default=240)
+    parser.add_argument("--exact-tasks", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        config.db_path = os.path.join(tmp, "planner.db")
+        database.init_db()
+        task_manager = build(args.tasks, args.seed)
+        print(f"{len(task_manager.active_tasks)} active tasks, {args.minutes} free minutes")
+
+        now = datetime.datetime.now()
+        plan = timed("plan (first call)", lambda: task_manager.plan(args.minutes, now=now))
+        timed("plan (nothing changed)", lambda: task_manager.plan(args.minutes, now=now))
+        task_manager.add_task(Task("one more", TaskPriority.HIGH, estimated_duration=20))
+        timed("plan (after add_task)", lambda: task_manager.plan(args.minutes, now=now))
+        skipped = next(t for t in task_manager.active_tasks if t not in plan.tasks)
+        task_manager.complete_task(skipped)
+        timed("plan (completed unplanned)", lambda: task_manager.plan(args.minutes, now=now))
+        task_manager.complete_task(task_manager.plan(args.minutes, now=now).tasks[0])
+        timed("plan (completed planned)", lambda: task_manager.plan(args.minutes, now=now))
+
+        #exact versus greedy on a smaller list
+        del task_manager.active_tasks[args.exact_tasks:]
+        task_manager._planner = None
+        greedy = timed(f"plan ({args.exact_tasks} tasks)", lambda: task_manager.plan(args.minutes, now=now))
+        exact = timed(f"plan exact ({args.exact_tasks} tasks)",
+                      lambda: task_manager.plan(args.minutes, exact=True, now=now))
+        assert exact.xp >= greedy.xp * 0.95, (exact.xp, greedy.xp)
+        database.close_db()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Benchmark: search_tasks latency over a large task table.
+
+Fills a database with --tasks tasks spread over --users users (titles and
+descriptions drawn from a deliberately small vocabulary, so every word matches
+a large share of rows) and times typed prefixes, whole words and two-word
+searches, plus filtered and deeper pages.
+For comparison it also times the old way of finding a task: loading the
+user's tasks with get_tasks_by_user and filtering in Python.
+
+    python bench_search.py                  # 1M tasks
+    python bench_search.py --tasks 1000000 --users 10   # a few very heavy users
+"""
+import argparse
+import datetime
+import os
+import random
+import tempfile
+import time
+
+from config import TaskPriority, TaskStatus
+import database
+
+WORDS = ("report budget meeting email invoice review draft call plan gym groceries laundry "
+         "dentist taxes slides deploy backup refactor interview garden paint book flight "
+         "hotel renew license homework essay exam lecture bug release design sketch").split()
+
+
+def build_db(path, task_count, user_count, seed=0):
+    rng = random.Random(seed)
+    database.init_db(path)
+    now = datetime.datetime.now().isoformat()
+    with database.conn:
+        database.conn.executemany("INSERT INTO users (username, email, created_at) VALUES (?, ?, ?)",
+                                  [(f"user{i}", f"user{i}@example.com", now) for i in range(user_count)])
+    priorities = (TaskPriority.LOW, TaskPriority.MEDIUM, TaskPriority.HIGH, TaskPriority.CRITICAL)
+    statuses = (TaskStatus.PENDING, TaskStatus.IN_PROGRESS, TaskStatus.COMPLETED)
+    chunk = 50000
+    for start in range(0, task_count, chunk):
+        rows = []
+        for i in range(start, min(start + chunk, task_count)):
+            title = " ".join(rng.choices(WORDS, k=rng.randint(2, 4)))
+            description = " ".join(rng.choices(WORDS, k=rng.randint(0, 12)))
+            rows.append((rng.randint(1, user_count), title, priorities[i % 4], statuses[i % 3],
+                         None, description, now, None))
+        #the FTS triggers index every row as it goes in, same as insert_task
+        with database.conn:
+            database.conn.executemany("""INSERT INTO tasks (user_id, title, priority, status, due_date,
+                                         description, created_at, completed_at)
+                                         VALUES (?, ?, ?, ?, ?, ?, ?, ?)""", rows)
+        print(f"  inserted {min(start + chunk, task_count):,} tasks")
+    database.conn.execute("INSERT INTO tasks_fts (tasks_fts) VALUES ('optimize')")
+    database.conn.commit()
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))] * 1000
+    return f"p50 {pick(0.50):7.2f} ms   p95 {pick(0.95):7.2f} ms   p99 {pick(0.99):7.2f} ms"
+
+
+def time_queries(queries, run):
+    samples = []
+    for query in queries:
+        started = time.perf_counter()
+        run(query)
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tasks", type=int, default=1000000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--queries", type=int, default=1000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "search.db")
+        started = time.perf_counter()
+        build_db(path, args.tasks, args.users)
+        print(f"{args.tasks:,} tasks for {args.users:,} users built in {time.perf_counter() - started:.1f}s, "
+              f"{os.path.getsize(path) / 1024 / 1024:.1f} MB")
+        if not database.fts_enabled:
+            print("FTS5 not available, timing the LIKE fallback")
+
+        rng = random.Random(1)
+        full_word = [(rng.randint(1, args.users), rng.choice(WORDS)) for _ in range(args.queries)]
+        typed = [(uid, word[:3]) for uid, word in full_word]
+        two_words = [(uid, f"{word} {rng.choice(WORDS)[:3]}") for uid, word in full_word]
+
+        cases = (
+            ("3-letter prefix", typed, lambda q: database.search_tasks(*q)),
+            ("full word", full_word, lambda q: database.search_tasks(*q)),
+            ("word + prefix", two_words, lambda q: database.search_tasks(*q)),
+            ("prefix, active only", typed,
+             lambda q: database.search_tasks(*q, status=database.ACTIVE_STATUSES)),
+            ("prefix, page 5", typed, lambda q: database.search_tasks(*q, offset=80)),
+            ("load + filter in Python", full_word,
+             lambda q: [t for t in database.get_tasks_by_user(q[0])
+                        if q[1] in t.title or q[1] in (t.description or "")][:20]),
+        )
+        for label, queries, run in cases:
+            print(f"{label:<26} {percentiles(time_queries(queries, run))}")
+        database.conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Benchmark: many concurrent writers through the task service vs straight to SQLite.
+
+Direct mode gives every client thread its own sqlite3 connection that commits
+each insert, like separate processes importing database would. Service mode
+sends the same inserts to service.py, which groups them into batched commits.
+
+    python bench_service.py --clients 32 --ops 200
+"""
+import argparse
+import datetime
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from config import Task, TaskPriority, TaskStatus
+from client import ServiceClient
+import database
+
+
+def run_threads(clients, work):
+    threads = [threading.Thread(target=work, args=(i,)) for i in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - started
+
+
+def bench_direct(db_path, clients, ops):
+    def work(i):
+        conn = database.connect(db_path)
+        conn.execute("INSERT INTO users (username, email, created_at) VALUES (?, '', ?)",
+                     (f"direct{i}", datetime.datetime.now().isoformat()))
+        user_id = conn.execute("SELECT id FROM users WHERE username = ?", (f"direct{i}",)).fetchone()[0]
+        conn.commit()
+        for n in range(ops):
+            with conn:
+                conn.execute("""INSERT INTO tasks (user_id, title, priority, status, created_at)
+                                VALUES (?, ?, ?, ?, ?)""",
+                             (user_id, f"task {n}", TaskPriority.LOW, TaskStatus.PENDING,
+                              datetime.datetime.now().isoformat()))
+        conn.close()
+    return run_threads(clients, work)
+
+
+def bench_service(address, clients, ops):
+    def work(i):
+        client = ServiceClient(address)
+        user_id = client.call("login", username=f"service{i}")
+        for n in range(ops):
+            client.call("add_task", user_id=user_id, task=Task(f"task {n}", TaskPriority.LOW).to_dict())
+        client.close()
+    return run_threads(clients, work)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--ops", type=int, default=200)
+    parser.add_argument("--port", type=int, default=8799)
+    args = parser.parse_args()
+    total = args.clients * args.ops
+
+    with tempfile.TemporaryDirectory() as tmp:
+        direct_db = os.path.join(tmp, "direct.db")
+        service_db = os.path.join(tmp, "service.db")
+        database.init_db(direct_db)
+        database.conn.close()
+
+        elapsed = bench_direct(direct_db, args.clients, args.ops)
+        print(f"direct sqlite : {total} inserts in {elapsed:.2f}s ({total / elapsed:,.0f}/s)")
+
+        address = f"127.0.0.1:{args.port}"
+        here = os.path.dirname(os.path.abspath(__file__))
+        server = subprocess.Popen([sys.executable, os.path.join(here, "service.py"),
+                                   "--address", address, "--db", service_db],
+                                  stdout=subprocess.DEVNULL)
+        try:
+            for _ in range(100):
+                try:
+                    ServiceClient(address).close()
+                    break
+                except OSError:
+                    time.sleep(0.1)
+            elapsed = bench_service(address, args.clients, args.ops)
+            print(f"task service  : {total} inserts in {elapsed:.2f}s ({total / elapsed:,.0f}/s)")
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
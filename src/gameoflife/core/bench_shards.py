@@ -0,0 +1,158 @@
+"""Benchmark: concurrent writers in one shared database vs one database per user.
+
+Every client is a different user with its own connection. Each small write
+is what completing a task does: a task row and the player's stats in one
+commit. Two runs per storage mode:
+
+    small   every client makes --ops small writes
+    bulk    the same, while client 0 keeps importing --bulk tasks per transaction
+
+With one file all clients queue for the same write lock, so the bulk import
+shows up in everyone's commit latency. With shards (see shards.py) only the
+importing user waits for it.
+
+    python bench_shards.py --clients 8 --ops 300 --bulk 20000
+"""
+import argparse
+import datetime
+import os
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+
+from config import config, TaskPriority, TaskStatus
+from game import User
+import database
+import shards
+
+#how long a small write waits for the lock before it counts as timed out,
+#and the importer's pause between two bulk transactions
+LOCK_TIMEOUT = 2.0
+BULK_PAUSE = 0.05
+
+
+def setup_single(folder, clients):
+    path = os.path.join(folder, "single.db")
+    database.init_db(path)
+    user_ids = [database.insert_user(User(f"user{i}", "")) for i in range(clients)]
+    for user_id in user_ids:
+        database.insert_player(user_id)
+    database.close_db()
+    return [(path, user_id) for user_id in user_ids]
+
+
+def setup_sharded(folder, clients):
+    config.shard_dir = os.path.join(folder, "shards")
+    targets = []
+    for i in range(clients):
+        user_id = shards.open_user(User(f"user{i}", ""))
+        database.insert_player(user_id)
+        targets.append((str(config.db_path), user_id))
+    database.close_db()
+    shards.close_catalog()
+    return targets
+
+
+def small_writes(path, user_id, ops, latencies, failures):
+    conn = database.connect(path)
+    conn.execute(f"PRAGMA busy_timeout = {int(LOCK_TIMEOUT * 1000)}")
+    now = datetime.datetime.now().isoformat()
+    for n in range(ops):
+        started = time.perf_counter()
+        try:
+            _complete(conn, user_id, n, now)
+        except sqlite3.OperationalError:
+            #gave up waiting for the lock; still counted in the latencies, with the time it waited
+            failures.append(n)
+        latencies.append(time.perf_counter() - started)
+    conn.close()
+
+
+def _complete(conn, user_id, n, now):
+    with conn:
+        conn.execute("""INSERT INTO tasks (user_id, title, priority, status, created_at, completed_at)
+                        VALUES (?, ?, ?, ?, ?, ?)""",
+                     (user_id, f"task {n}", TaskPriority.MEDIUM, TaskStatus.COMPLETED, now, now))
+        conn.execute("""UPDATE players SET xp = xp + 25, tasks_completed = tasks_completed + 1
+                        WHERE user_id = ?""", (user_id,))
+
+
+def bulk_imports(path, user_id, size, stop):
+    conn = database.connect(path)
+    now = datetime.datetime.now().isoformat()
+    batches = 0
+    while not stop.is_set():
+        with conn:
+            conn.executemany("""INSERT INTO tasks (user_id, title, priority, status, created_at)
+                                VALUES (?, ?, ?, ?, ?)""",
+                             ((user_id, f"imported {n}", TaskPriority.LOW, TaskStatus.PENDING, now)
+                              for n in range(size)))
+        batches += 1
+        stop.wait(BULK_PAUSE)
+    conn.close()
+    return batches
+
+
+def run(targets, ops, bulk):
+    latencies = []
+    failures = []
+    stop = threading.Event()
+    writers = targets[1:] if bulk else targets
+    threads = [threading.Thread(target=small_writes, args=(path, user_id, ops, latencies, failures))
+               for path, user_id in writers]
+    importer = None
+    if bulk:
+        importer = threading.Thread(target=bulk_imports, args=(*targets[0], bulk, stop))
+        importer.start()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    stop.set()
+    if importer:
+        importer.join()
+    return elapsed, latencies, len(failures)
+
+
+def report(label, elapsed, latencies, failed):
+    latencies = sorted(latencies)
+    p99 = latencies[max(0, int(len(latencies) * 0.99) - 1)]
+    print(f"{label:<18} {(len(latencies) - failed) / elapsed:8,.0f} commits/s   "
+          f"p50 {statistics.median(latencies) * 1000:6.2f} ms   p99 {p99 * 1000:7.2f} ms   "
+          f"{failed} timed out")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--ops", type=int, default=300, help="small writes per client")
+    parser.add_argument("--bulk", type=int, default=20000, help="tasks per bulk import transaction")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        single = setup_single(tmp, args.clients)
+        sharded = setup_sharded(tmp, args.clients)
+        for mode, bulk in (("small", 0), ("bulk", args.bulk)):
+            for label, targets in (("single file", single), ("sharded", sharded)):
+                report(f"{mode:<6} {label}", *run(targets, args.ops, bulk))
+
+        #reading the leaderboard: a join in the shared file vs the catalog summary
+        config.shard_dir = os.path.join(tmp, "shards")
+        print(f"rebuilt {shards.rebuild_leaderboard()} leaderboard rows from the shards")
+        started = time.perf_counter()
+        top = shards.get_leaderboard()
+        print(f"sharded leaderboard  {(time.perf_counter() - started) * 1000:.2f} ms, leader {top[0]['username']}")
+        shards.close_catalog()
+        database.init_db(single[0][0])
+        started = time.perf_counter()
+        top = database.get_leaderboard()
+        print(f"single-file leaderboard  {(time.perf_counter() - started) * 1000:.2f} ms, leader {top[0]['username']}")
+        database.close_db()
+
+
+if __name__ == "__main__":
+    main()
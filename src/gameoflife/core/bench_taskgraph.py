@@ -0,0 +1,108 @@
+"""Benchmark: task dependencies with 100k tasks and deep chains.
+
+The tasks are split into --chains chains (task i waits for task i-1 of the
+same chain), so with the defaults every chain is 10,000 tasks deep. Measures
+the login (edges come with the session row), adding a dependency in front
+of a chain (the cycle check walks what comes after it), completing the
+ready head of each chain, and get_active_tasks(unblocked=True). For
+comparison it also times working out the ready tasks from scratch, which is
+what every completion would cost without the counters in taskgraph.py.
+
+    python bench_taskgraph.py --tasks 100000 --chains 10
+"""
+import argparse
+import datetime
+import os
+import tempfile
+import time
+from collections import Counter
+
+from config import config, Task, TaskPriority
+import database
+import session
+
+
+def build(task_count, chains):
+    task_manager = session.login("bench")
+    priorities = (TaskPriority.LOW, TaskPriority.MEDIUM, TaskPriority.HIGH, TaskPriority.CRITICAL)
+    due = datetime.datetime.now() + datetime.timedelta(days=7)
+    database.insert_tasks([Task(f"step {i}", priorities[i % 4], due_date=due) for i in range(task_count)],
+                          task_manager.user_id)
+    ids = [row[0] for row in database.conn.execute("SELECT id FROM tasks ORDER BY id")]
+    length = task_count // chains
+    edges = [(ids[i - 1], ids[i], task_manager.user_id) for i in range(task_count) if i % length]
+    with database.conn:
+        database.conn.executemany("INSERT INTO task_edges (before_id, after_id, user_id) VALUES (?, ?, ?)", edges)
+    return ids, length
+
+
+def ready_from_scratch(task_manager):
+    #in-degree of every active task from the full edge list
+    open_ids = {t.id for t in task_manager.active_tasks}
+    waiting = Counter(after_id for before_id, after_id in
+                      database.conn.execute("SELECT before_id, after_id FROM task_edges")
+                      if before_id in open_ids)
+    return [t for t in task_manager.active_tasks if not waiting[t.id]]
+
+
+def ms(seconds):
+    return f"{seconds * 1000:8.2f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark task dependencies on a large task list.")
+    parser.add_argument("--tasks", type=int, default=100000)
+    parser.add_argument("--chains", type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        config.db_path = os.path.join(tmp, "graph.db")
+        database.init_db()
+        ids, length = build(args.tasks, args.chains)
+        print(f"{args.tasks} tasks in {args.chains} chains of {length}")
+
+        started = time.perf_counter()
+        task_manager = session.login("bench")
+        print(f"login                          {ms(time.perf_counter() - started)}")
+
+        heads = task_manager.get_active_tasks(sort_by=None, unblocked=True)
+        assert len(heads) == args.chains, len(heads)
+
+        #both checks walk a whole chain: the first finds no way back, the second closes a cycle
+        extra = task_manager.add_task(Task("before the second chain"))
+        started = time.perf_counter()
+        task_manager.add_dependency(extra, heads[1])
+        print(f"add_dependency (deep check)    {ms(time.perf_counter() - started)}")
+        tail = next(t for t in task_manager.active_tasks if t.id == ids[2 * length - 1])
+        started = time.perf_counter()
+        try:
+            task_manager.add_dependency(tail, extra)
+        except ValueError:
+            print(f"cycle refused (deep check)     {ms(time.perf_counter() - started)}")
+        else:
+            raise AssertionError("cycle not detected")
+
+        rounds = 200
+        elapsed = 0.0
+        for _ in range(rounds):
+            for task in task_manager.get_active_tasks(sort_by=None, unblocked=True)[:args.chains]:
+                started = time.perf_counter()
+                task_manager.complete_task(task)
+                elapsed += time.perf_counter() - started
+        completions = rounds * args.chains
+        print(f"complete_task                  {ms(elapsed / completions)} each "
+              f"({completions} along the chains)")
+
+        started = time.perf_counter()
+        ready = task_manager.get_active_tasks(unblocked=True)
+        print(f"get_active_tasks(unblocked)    {ms(time.perf_counter() - started)} ({len(ready)} ready)")
+
+        started = time.perf_counter()
+        from_scratch = ready_from_scratch(task_manager)
+        print(f"ready set from scratch         {ms(time.perf_counter() - started)}")
+        assert {t.id for t in from_scratch} == {t.id for t in ready}
+        database.close_db()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Benchmark: ISO text vs epoch integer timestamps.
+
+Builds an ISO database, migrates a copy with timestamps.migrate_to_epoch and
+compares file size and how fast get_tasks_by_user decodes rows.
+
+    python bench_timestamps.py --tasks 200000
+"""
+import argparse
+import datetime
+import os
+import shutil
+import tempfile
+import time
+
+from config import config, TaskPriority, TaskStatus
+from game import User
+import database
+import timestamps
+
+
+def build_iso_db(path, task_count):
+    config.timestamp_mode = timestamps.ISO
+    database.init_db(path)
+    user_id = database.insert_user(User("bench", "bench@example.com"))
+    now = datetime.datetime.now()
+    priorities = (TaskPriority.LOW, TaskPriority.MEDIUM, TaskPriority.HIGH, TaskPriority.CRITICAL)
+    rows = []
+    for i in range(task_count):
+        completed = (now - datetime.timedelta(minutes=i)).isoformat() if i % 2 else None
+        rows.append((user_id, f"Task {i}", priorities[i % 4],
+                     TaskStatus.COMPLETED if completed else TaskStatus.PENDING,
+                     (now + datetime.timedelta(minutes=i)).isoformat(), "",
+                     now.isoformat(), completed))
+    with database.conn:
+        database.conn.executemany("""INSERT INTO tasks (user_id, title, priority, status, due_date,
+                                     description, created_at, completed_at)
+                                     VALUES (?, ?, ?, ?, ?, ?, ?, ?)""", rows)
+    database.conn.execute("VACUUM")
+    database.conn.close()
+    return user_id
+
+
+def decode_rate(path, user_id, repeat):
+    database.init_db(path)
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        tasks = database.get_tasks_by_user(user_id)
+        best = min(best, time.perf_counter() - started)
+    database.conn.close()
+    return len(tasks) / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tasks", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        iso_path = os.path.join(tmp, "iso.db")
+        epoch_path = os.path.join(tmp, "epoch.db")
+        user_id = build_iso_db(iso_path, args.tasks)
+        shutil.copy(iso_path, epoch_path)
+
+        migrate_conn = database.connect(epoch_path)
+        started = time.perf_counter()
+        timestamps.migrate_to_epoch(migrate_conn)
+        migrate_seconds = time.perf_counter() - started
+        migrate_conn.execute("VACUUM")
+        migrate_conn.close()
+
+        print(f"{args.tasks} tasks, migration took {migrate_seconds:.2f}s")
+        for label, path in (("iso", iso_path), ("epoch", epoch_path)):
+            rate = decode_rate(path, user_id, args.repeat)
+            size = os.path.getsize(path) / 1024 / 1024
+            print(f"{label:<6} {size:8.2f} MB   {rate:12,.0f} rows/s decoded")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""Thin client for the local task service (service.py).
+
+ServiceClient sends raw requests. RemoteTaskManager wraps it in the parts of
+the TaskManager interface the GUI uses, so the GUI can run against the
+service without importing database at all.
+"""
+import json
+import socket
+import threading
+
+from config import Task
+from game import User, Player, XPCalculator
+from events import (EventBus, TaskAdded, TaskCompleted, TaskFailed, TemplateAdded,
+                    XPChanged, RankChanged)
+import journal
+
+
+class ServiceError(Exception):
+    pass
+
+
+def parse_address(address):
+    """'unix:/path' -> ('unix', path), 'host:port' -> ('tcp', (host, port))."""
+    if address.startswith("unix:"):
+        return "unix", address[len("unix:"):]
+    host, _, port = address.rpartition(":")
+    return "tcp", (host or "127.0.0.1", int(port))
+
+
+class ServiceClient:
+
+    def __init__(self, address):
+        kind, where = parse_address(address)
+        if kind == "unix":
+            self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._sock.connect(where)
+        self._file = self._sock.makefile("rb")
+        self._lock = threading.Lock()
+        self._next_id = 0
+
+    def call(self, op, **args):
+        with self._lock:
+            self._next_id += 1
+            request = {'id': self._next_id, 'op': op, 'args': args}
+            self._sock.sendall(json.dumps(request).encode() + b"\n")
+            line = self._file.readline()
+        if not line:
+            raise ServiceError("Connection closed by the task service")
+        response = json.loads(line)
+        if not response['ok']:
+            raise ServiceError(response['error'])
+        return response['result']
+
+    def close(self):
+        self._file.close()
+        self._sock.close()
+
+
+class RemoteTaskManager:
+    """TaskManager look-alike backed by the task service."""
+
+    def __init__(self, client, user_id):
+        self.client = client
+        self.user_id = user_id
+        self.player = None
+        self.completed_tasks = []
+        self.failed_tasks = []
+        #XP previews are worked out locally from the same config the service uses
+        self.xp_calculator = XPCalculator()
+        #same events as TaskManager publishes, raised here once the service has answered
+        self.events = EventBus()
+        self._refresh_player()
+
+    @classmethod
+    def login(cls, address, username, email=""):
+        client = ServiceClient(address)
+        return cls(client, client.call("login", username=username, email=email))
+
+    @property
+    def active_tasks(self):
+        return self.get_active_tasks(sort_by=None)
+
+    def _refresh_player(self):
+        #returns the xp the player had before, for XPChanged
+        xp_before = self.player.xp if self.player else 0
+        stats = self.client.call("get_player", user_id=self.user_id)
+        player = Player(User(stats.pop('username'), stats.pop('email')))
+        for name, value in stats.items():
+            setattr(player, name, value)
+        self.player = player
+        return xp_before
+
+    def add_task(self, task):
+        saved = self.client.call("add_task", user_id=self.user_id, task=task.to_dict())
+        task.id = saved['id']
+        self.events.publish(TaskAdded(task))
+        return task
+
+    def complete_task(self, task):
+        result = self.client.call("complete_task", user_id=self.user_id, task_id=task.id,
+                                  task=task.to_dict())
+        rank_before = self.player.previous_rank
+        xp_before = self._refresh_player()
+        self.events.publish(TaskCompleted(task, result['xp_earned']))
+        self._publish_xp(xp_before)
+        if result['rank_changed']:
+            self.events.publish(RankChanged(rank_before, result['new_rank']))
+        return result
+
+    def fail_task(self, task):
+        result = self.client.call("fail_task", user_id=self.user_id, task_id=task.id,
+                                  task=task.to_dict())
+        xp_before = self._refresh_player()
+        self.events.publish(TaskFailed(task, result['xp_lost']))
+        self._publish_xp(xp_before)
+        return result
+
+    def add_dependency(self, before, after):
+        self.client.call("add_dependency", user_id=self.user_id, before_id=before.id, after_id=after.id)
+
+    def remove_dependency(self, before, after):
+        self.client.call("remove_dependency", user_id=self.user_id, before_id=before.id, after_id=after.id)
+
+    def undo(self):
+        return self._journal_call("undo")
+
+    def redo(self):
+        return self._journal_call("redo")
+
+    def _journal_call(self, op):
+        #the service keeps the journal, see TaskManager.undo
+        result = self.client.call(op, user_id=self.user_id)
+        if result is None:
+            return None
+        result['task'] = Task.from_dict(result['task'])
+        rank_before = self.player.previous_rank
+        xp_before = self._refresh_player()
+        self.events.publish(journal.task_event(result['action'], result['task'], op == "undo",
+                                               result['xp_delta']))
+        self._publish_xp(xp_before)
+        if self.player.previous_rank != rank_before:
+            self.events.publish(RankChanged(rank_before, self.player.previous_rank))
+        return result
+
+    def _publish_xp(self, xp_before):
+        if self.player.xp != xp_before:
+            self.events.publish(XPChanged(self.player.xp, self.player.level, self.player.xp - xp_before))
+
+    def get_active_tasks(self, sort_by='priority', unblocked=False):
+        rows = self.client.call("get_active_tasks", user_id=self.user_id, sort_by=sort_by, unblocked=unblocked)
+        return [Task.from_dict(row) for row in rows]
+
+    def add_template(self, template):
+        template.id = self.client.call("add_template", user_id=self.user_id, template={
+            'title': template.title, 'frequency': template.frequency,
+            'start': template.start.isoformat(), 'priority': template.priority,
+            'interval': template.interval, 'description': template.description,
+            'until': template.until.isoformat() if template.until else None})
+        self.events.publish(TemplateAdded(template))
+        return template
+
+    def get_occurrences(self, start, end):
+        rows = self.client.call("get_occurrences", user_id=self.user_id,
+                                start=start.isoformat(), end=end.isoformat())
+        return [Task.from_dict(row) for row in rows]
+
+    def get_history(self, start=None, end=None):
+        rows = self.client.call("get_history", user_id=self.user_id,
+                                start=start.isoformat() if start else None,
+                                end=end.isoformat() if end else None)
+        return [Task.from_dict(row) for row in rows]
+
+    def count_tasks_by(self, group_by, status=None):
+        status = list(status) if status is not None and not isinstance(status, str) else status
+        return self.client.call("count_tasks_by", user_id=self.user_id, group_by=group_by, status=status)
+
+    def search_tasks(self, query, status=None, limit=20, offset=0, conn=None):
+        #conn is accepted for TaskManager compatibility, the service uses its own connection
+        status = list(status) if status is not None and not isinstance(status, str) else status
+        rows = self.client.call("search_tasks", user_id=self.user_id, query=query, status=status,
+                                limit=limit, offset=offset)
+        return [Task.from_dict(row) for row in rows]
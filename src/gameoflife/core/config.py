@@ -1,7 +1,18 @@
+import bisect
+import calendar
 import datetime
+import json
+import os
+import threading
 from pathlib import Path
+from typing import NamedTuple
 import platformdirs
 
+try:
+    import tomllib  # Python 3.11+
+except ImportError:
+    tomllib = None
+
 #class Taskpriority used to establish the different priority levels
 class TaskPriority:
     LOW = "low"
@@ -22,7 +33,7 @@ class TaskStatus:
 class Task:
     #We have set taskpriority set to medium and taskstatus set to pending for this class as default parameter values
     def __init__(self, title, priority=TaskPriority.MEDIUM, status=TaskStatus.PENDING,
-                 due_date=None, description=""):
+                 due_date=None, description="", estimated_duration=None):
         self.id = None
         self.title = title
         self.priority = priority
@@ -31,12 +42,110 @@ class Task:
         self.description = description
         self.created_at = datetime.datetime.now() # --- UPDATED: Added default creation time
         self.completed_at = None
+        #set when the task is an occurrence of a recurring TaskTemplate
+        self.template_id = None
+        #how long the task should take, in minutes (None if not given), used by planner.py
+        self.estimated_duration = estimated_duration
 
 
     def mark_completed(self):
         #marks the task as completed if it is completed
         self.status = TaskStatus.COMPLETED
 
+    def to_dict(self):
+        #plain JSON-friendly form, used by the task service and its client
+        return {
+            'id': self.id,
+            'title': self.title,
+            'priority': self.priority,
+            'status': self.status,
+            'due_date': self.due_date.isoformat() if self.due_date else None,
+            'description': self.description,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'completed_at': self.completed_at.isoformat() if self.completed_at else None,
+            'template_id': self.template_id,
+            'estimated_duration': self.estimated_duration,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        parse = lambda value: datetime.datetime.fromisoformat(value) if value else None
+        task = cls(data['title'], data.get('priority', TaskPriority.MEDIUM),
+                   data.get('status', TaskStatus.PENDING), parse(data.get('due_date')),
+                   data.get('description') or "", data.get('estimated_duration'))
+        task.id = data.get('id')
+        if 'created_at' in data:
+            task.created_at = parse(data['created_at'])
+        task.completed_at = parse(data.get('completed_at'))
+        task.template_id = data.get('template_id')
+        return task
+
+
+#how often a TaskTemplate repeats
+class Recurrence:
+    DAILY = "daily"
+    WEEKLY = "weekly"
+    MONTHLY = "monthly"
+
+
+class TaskTemplate:
+    #a recurring task stored once; its occurrences are only turned into task rows
+    #when one is completed or failed (see TaskManager.get_occurrences)
+    def __init__(self, title, frequency, start, priority=TaskPriority.MEDIUM,
+                 interval=1, until=None, description=""):
+        if frequency not in (Recurrence.DAILY, Recurrence.WEEKLY, Recurrence.MONTHLY):
+            raise ValueError(f"Unknown frequency: {frequency}")
+        if interval < 1:
+            raise ValueError("interval must be at least 1")
+        self.id = None
+        self.title = title
+        self.frequency = frequency
+        self.start = start
+        self.priority = priority
+        self.interval = interval
+        self.until = until
+        self.description = description
+
+    def occurrences(self, window_start, window_end):
+        #yields due dates in [window_start, window_end) without walking from self.start
+        window_start = max(window_start, self.start)
+        if self.until is not None:
+            window_end = min(window_end, self.until + datetime.timedelta(microseconds=1))
+        if window_start >= window_end:
+            return
+
+        if self.frequency == Recurrence.MONTHLY:
+            months = (window_start.year - self.start.year) * 12 + window_start.month - self.start.month
+            k = max(0, months // self.interval)
+            while True:
+                due = self._add_months(k * self.interval)
+                if due >= window_end:
+                    return
+                if due >= window_start:
+                    yield due
+                k += 1
+        else:
+            step = datetime.timedelta(days=self.interval * (7 if self.frequency == Recurrence.WEEKLY else 1))
+            #first index whose due date is at or after window_start (ceiling division)
+            k = -((self.start - window_start) // step)
+            due = self.start + k * step
+            while due < window_end:
+                yield due
+                due += step
+
+    def _add_months(self, months):
+        month_index = self.start.month - 1 + months
+        year, month = self.start.year + month_index // 12, month_index % 12 + 1
+        #the 31st of a short month falls back to its last day
+        day = min(self.start.day, calendar.monthrange(year, month)[1])
+        return self.start.replace(year=year, month=month, day=day)
+
+    def make_task(self, due_date):
+        #an unsaved occurrence, its id stays None until it is materialized
+        task = Task(self.title, self.priority, TaskStatus.PENDING, due_date, self.description)
+        task.template_id = self.id
+        return task
+
 
 class XPConfig:
     def __init__(self, base_rewards=None, base_penalties=None,
@@ -54,6 +163,17 @@ class XPConfig:
             #otherwise it not None, base reward is set to itself
             self.base_rewards = base_rewards
 
+        if base_penalties is None:
+            #penalties are 1.5x the reward, rounded the same way as the README table
+            self.base_penalties = {
+                TaskPriority.LOW: 15,
+                TaskPriority.MEDIUM: 38,
+                TaskPriority.HIGH: 75,
+                TaskPriority.CRITICAL: 150
+            }
+        else:
+            self.base_penalties = base_penalties
+
         if early_bonus_thresholds is None:
             self.early_bonus_thresholds = [
                 {"days_early": 7, "bonus_pct": 50},
@@ -63,6 +183,16 @@ class XPConfig:
         else:
             self.early_bonus_thresholds = early_bonus_thresholds
 
+    def __setattr__(self, name, value):
+        #every assignment bumps version, XPCalculator drops its preview cache when it moves
+        super().__setattr__(name, value)
+        if name != "version":
+            self.changed()
+
+    def changed(self):
+        """Call after editing base_rewards etc. in place, so cached XP previews are recomputed."""
+        super().__setattr__("version", getattr(self, "version", 0) + 1)
+
 
 class RankConfig:
 
@@ -73,8 +203,36 @@ class RankConfig:
 
 class Config:
 
-    def __init__(self, xp_per_level=200, ranks=None, xp_config=None, db_path=None):
+    def __init__(self, xp_per_level=200, ranks=None, xp_config=None, db_path=None,
+                 timestamp_mode="iso", service_address=None, archive_after_days=90,
+                 backup_generations=7, backup_verify_rate=0.25, shard_dir=None,
+                 reminder_minutes=(24 * 60, 60, 0), session_cache_mb=32, ics_priorities=None):
         self.xp_per_level = xp_per_level
+        #"iso" stores timestamps as text, "epoch" as integer seconds (new databases only, see timestamps.py)
+        self.timestamp_mode = timestamp_mode
+        #when set (e.g. "127.0.0.1:8765" or "unix:/tmp/gameoflife.sock") the GUI talks to service.py
+        #through client.py instead of opening the database itself
+        self.service_address = service_address
+        #completed tasks older than this many days are moved to tasks_archive (see archive.py)
+        self.archive_after_days = archive_after_days
+        #how many backups backup.py keeps, and the fraction of them checked with PRAGMA integrity_check
+        self.backup_generations = backup_generations
+        self.backup_verify_rate = backup_verify_rate
+        #when set, every user gets a database file of their own in this folder, with a catalog.db
+        #for the user list and leaderboard (see shards.py); db_path then follows the logged in user
+        self.shard_dir = shard_dir
+        #reminders.py reminds the user this many minutes before each task's due date (0 = when it is due)
+        self.reminder_minutes = reminder_minutes
+        #memory the GUI may keep using for the sessions of users it switched away from (see session.SessionCache)
+        self.session_cache_mb = session_cache_mb
+        #task priority for each iCalendar PRIORITY (1 highest .. 9 lowest, 0 = not set) when
+        #importing .ics files, see ics.py; values missing here import as medium
+        if ics_priorities is None:
+            self.ics_priorities = {1: TaskPriority.CRITICAL, 2: TaskPriority.HIGH, 3: TaskPriority.HIGH,
+                                   4: TaskPriority.HIGH, 5: TaskPriority.MEDIUM, 6: TaskPriority.LOW,
+                                   7: TaskPriority.LOW, 8: TaskPriority.LOW, 9: TaskPriority.LOW}
+        else:
+            self.ics_priorities = ics_priorities
 
         if ranks is None:
             self.ranks = [
@@ -95,12 +253,232 @@ class Config:
         else:
             self.xp_config = xp_config
 
-        if db_path is None:
+        #resolved (and the data dir created) on first use, so importing config touches no files
+        self._db_path = db_path
+
+    @property
+    def db_path(self):
+        if self._db_path is None:
             data_dir = Path(platformdirs.user_data_dir("GameOfLife"))
             data_dir.mkdir(parents=True, exist_ok=True)
-            self.db_path = data_dir / "gamelife.db"
+            self._db_path = data_dir / "gamelife.db"
+        return self._db_path
+
+    @db_path.setter
+    def db_path(self, value):
+        self._db_path = value
+
+
+class PriorityTable(NamedTuple):
+    """One value per priority, looked up with getattr(table, task.priority)."""
+    low: int
+    medium: int
+    high: int
+    critical: int
+
+
+class ConfigSnapshot(NamedTuple):
+    """Immutable, precompiled view of the XP economy that the game code reads.
+
+    Built by compile_config. A reload builds a new snapshot and swaps it in,
+    nothing ever changes one in place.
+    """
+    xp_per_level: int
+    xp_floor: int
+    rewards: PriorityTable
+    penalties: PriorityTable
+    #(seconds early, bonus percent), largest first: the first one reached wins
+    bonus_tiers: tuple
+    #the same thresholds ascending, for bisect
+    bonus_seconds: tuple
+    #ascending xp_min of each rank and the rank names in the same order
+    rank_xp: tuple
+    rank_names: tuple
+    archive_after_days: int
+
+    def early_bonus(self, base_xp, seconds_early):
+        for seconds, pct in self.bonus_tiers:
+            if seconds_early >= seconds:
+                return int(base_xp * pct / 100)
+        return 0
+
+    def rank_for(self, xp):
+        return self.rank_names[max(0, bisect.bisect_right(self.rank_xp, xp) - 1)]
+
+
+def compile_config(cfg):
+    """Check a Config and turn it into a ConfigSnapshot. Raises ValueError if it is invalid."""
+    xp = cfg.xp_config
+    priorities = PriorityTable._fields
+    for name, table in (("base_rewards", xp.base_rewards), ("base_penalties", xp.base_penalties)):
+        missing = [p for p in priorities if p not in table]
+        if missing:
+            raise ValueError(f"{name} is missing priorities: {', '.join(missing)}")
+    if cfg.xp_per_level <= 0:
+        raise ValueError("xp_per_level must be positive")
+    if not cfg.ranks:
+        raise ValueError("at least one rank is needed")
+
+    #thresholds may be given in days or hours, everything is compared in seconds
+    tiers = []
+    for threshold in xp.early_bonus_thresholds:
+        if 'days_early' in threshold:
+            seconds = threshold['days_early'] * 86400
+        elif 'hours_early' in threshold:
+            seconds = threshold['hours_early'] * 3600
         else:
-            self.db_path = db_path
+            raise ValueError(f"bonus threshold needs days_early or hours_early: {threshold}")
+        tiers.append((seconds, threshold['bonus_pct']))
+    tiers.sort(reverse=True)
+
+    ranks = sorted(cfg.ranks, key=lambda r: r.xp_min)
+    return ConfigSnapshot(
+        xp_per_level=int(cfg.xp_per_level),
+        xp_floor=int(xp.xp_floor),
+        rewards=PriorityTable(*(int(xp.base_rewards[p]) for p in priorities)),
+        penalties=PriorityTable(*(int(xp.base_penalties[p]) for p in priorities)),
+        bonus_tiers=tuple(tiers),
+        bonus_seconds=tuple(seconds for seconds, _ in reversed(tiers)),
+        rank_xp=tuple(r.xp_min for r in ranks),
+        rank_names=tuple(r.name for r in ranks),
+        archive_after_days=int(cfg.archive_after_days),
+    )
+
+
+def load_config(path):
+    """Read a .toml or .json config file into a Config.
+
+    Only the XP economy is read from the file (xp_per_level, archive_after_days,
+    [[ranks]] and [xp]); the database path, timestamp mode and service address
+    are chosen in code and need a restart to change.
+    """
+    path = Path(path)
+    if path.suffix == ".toml":
+        if tomllib is None:
+            raise ValueError("TOML config files need Python 3.11+, use a .json file instead")
+        with open(path, "rb") as f:
+            data = tomllib.load(f)
+    else:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+
+    defaults = XPConfig()
+    xp = data.get("xp", {})
+    xp_config = XPConfig(
+        base_rewards={**defaults.base_rewards, **xp.get("base_rewards", {})},
+        base_penalties={**defaults.base_penalties, **xp.get("base_penalties", {})},
+        early_bonus_thresholds=xp.get("early_bonus_thresholds", defaults.early_bonus_thresholds),
+        xp_floor=xp.get("xp_floor", defaults.xp_floor))
+    ranks = None
+    if "ranks" in data:
+        ranks = [RankConfig(r["name"], r["xp_min"]) for r in data["ranks"]]
+    return Config(xp_per_level=data.get("xp_per_level", 200), ranks=ranks, xp_config=xp_config,
+                  archive_after_days=data.get("archive_after_days", 90))
+
+
+def default_config_path():
+    """GAMEOFLIFE_CONFIG if set, otherwise config.toml in the app data dir (may not exist)."""
+    return Path(os.environ.get("GAMEOFLIFE_CONFIG")
+                or Path(platformdirs.user_data_dir("GameOfLife")) / "config.toml")
+
+
+#(ConfigSnapshot, the _config_key() it was compiled from), replaced with one assignment under
+#_snapshot_lock and never edited, so a reader gets both halves of the same publish
+_snapshot = None
+_snapshot_lock = threading.Lock()
+
+
+def _config_key():
+    #what the snapshot was compiled from: XPConfig.version moves on every edit of the XP values,
+    #ranks are compared by list (a new list, or one grown or shrunk in place)
+    xp = config.xp_config
+    return (config.xp_per_level, config.archive_after_days, id(config.ranks), len(config.ranks),
+            id(xp), xp.version)
+
+
+def current_config():
+    """The ConfigSnapshot in use right now, compiled from the global config.
+
+    It is compiled again when the global config was edited since, e.g. a new
+    xp_per_level or base_rewards, or config.xp_config.changed() after an edit
+    in place; apply_config swaps in a whole new config at once. Compiling
+    waits for an apply_config in progress, so it never sees half of one.
+    """
+    global _snapshot
+    published = _snapshot
+    if published is not None and published[1] == _config_key():
+        return published[0]
+    with _snapshot_lock:
+        key = _config_key()
+        if _snapshot is None or _snapshot[1] != key:
+            _snapshot = (compile_config(config), key)
+        return _snapshot[0]
+
+
+def apply_config(cfg):
+    """Make cfg's XP economy the live one. The snapshot is swapped in with a single assignment."""
+    global _snapshot
+    snapshot = compile_config(cfg)  # validate before anything changes
+    with _snapshot_lock:
+        config.xp_per_level = cfg.xp_per_level
+        config.ranks = cfg.ranks
+        config.xp_config = cfg.xp_config
+        config.archive_after_days = cfg.archive_after_days
+        _snapshot = (snapshot, _config_key())
+    return snapshot
+
+
+def reload_config(path):
+    """Load a config file and make it live, see apply_config."""
+    return apply_config(load_config(path))
+
+
+class ConfigWatcher:
+    """Reloads the config file whenever its modification time changes.
+
+    Call poll() from a timer (the GUI uses Tk's after) or start() a background
+    thread that polls every `interval` seconds. A file that fails to load is
+    reported and the previous snapshot stays in use.
+    """
+
+    def __init__(self, path, interval=1.0, on_reload=None):
+        self.path = Path(path)
+        self.interval = interval
+        self.on_reload = on_reload
+        self._mtime = None
+        self._stop = threading.Event()
+
+    def poll(self):
+        try:
+            mtime = self.path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return False
+        if mtime == self._mtime:
+            return False
+        self._mtime = mtime
+        try:
+            snapshot = reload_config(self.path)
+        except (OSError, ValueError, KeyError, TypeError) as exc:
+            print(f"Config not reloaded, keeping the previous one: {exc}")
+            return False
+        print(f"Loaded config from {self.path}")
+        if self.on_reload:
+            self.on_reload(snapshot)
+        return True
+
+    def start(self):
+        thread = threading.Thread(target=self._run, daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.poll()
+            self._stop.wait(self.interval)
+
 
 # Global configuration instance
 config = Config()
\ No newline at end of file
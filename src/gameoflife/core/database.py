@@ -1,32 +1,103 @@
 # Referenced from this youtube video: https://www.youtube.com/watch?v=pd-0G0MigUA
 
 import sqlite3
+import contextlib
 import datetime
-from config import config, Task
+import re
+import sys
+import time
+from config import config, current_config, Task, TaskStatus, TaskTemplate
+import timestamps
+import achievements
 
 #global connection - will be initialized when init_db() is called
 conn = None
 c = None
 
+#how many transaction() blocks are currently open, see transaction()
+_tx_depth = 0
 
-def init_db():
-    global conn, c
+#"iso" or "epoch", read from the db_meta table in init_db (see timestamps.py)
+timestamp_mode = timestamps.ISO
+
+#short-lived cache for count_tasks_by results, keyed by (user_id, group_by, status)
+#entries are dropped whenever that user's tasks are written
+COUNT_CACHE_TTL = 5.0
+_count_cache = {}
+
+#statuses that count as "active" in the GUI and task manager
+ACTIVE_STATUSES = (TaskStatus.PENDING, TaskStatus.IN_PROGRESS)
+
+#group_by keys accepted by count_tasks_by
+_GROUP_BY_KEYS = ('priority', 'status', 'due_day')
+
+#tasks columns in _row_to_task order, for queries that also read tasks_archive
+TASK_COLUMNS = ("id, user_id, title, priority, status, due_date, description, "
+                 "created_at, completed_at, template_id, estimated_duration")
+
+#the same with the table name, for joins
+_TASKS_PREFIXED = ", ".join(f"tasks.{column.strip()}" for column in TASK_COLUMNS.split(","))
+
+#players columns that map one-to-one onto Player attributes, see get_session_row
+PLAYER_STATS_COLUMNS = ("xp", "level", "tasks_completed", "tasks_failed", "current_streak",
+                        "longest_streak", "tasks_completed_early", "critical_tasks_completed",
+                        "previous_rank", "last_active_day", "achievements_earned")
+
+#statements count_queries leaves out
+_TX_CONTROL = ("BEGIN", "COMMIT", "ROLLBACK", "SAVEPOINT", "RELEASE", "END")
+
+#False when this sqlite build has no FTS5, search_tasks then falls back to LIKE
+fts_enabled = False
+
+#bm25 column weights for tasks_fts: a hit in the title counts more than one in the description
+_FTS_WEIGHTS = (10.0, 4.0, 0.0)
+
+
+def connect(db_path=None, check_same_thread=True):
+    """Open a new connection to the game database.
+
+    init_db uses this for the global connection; background jobs and worker
+    processes call it directly so each one gets its own connection.
+    """
+    #timeout lets a second connection wait for the write lock instead of failing straight away
+    #PARSE_DECLTYPES makes sqlite3 run the EPOCH converter on epoch-mode timestamp columns
+    new_conn = sqlite3.connect(db_path or config.db_path, timeout=30,
+                               detect_types=sqlite3.PARSE_DECLTYPES,
+                               check_same_thread=check_same_thread)
+    #enable foreign keys b/c sqlite has them off as default
+    new_conn.execute("PRAGMA foreign_keys = ON")
+    return new_conn
+
+
+def init_db(db_path=None):
+    global conn, c, timestamp_mode, fts_enabled
 
     #connect to database
-    conn = sqlite3.connect(config.db_path)
+    db_path = db_path or config.db_path
+    #the global connection may be used from AsyncTaskManager's DB thread, which
+    #runs one call at a time, so the same-thread check is turned off
+    conn = connect(db_path, check_same_thread=False)
     c = conn.cursor()
 
-    #enable foreign keys b/c sqlite has them off as default
-    c.execute("PRAGMA foreign_keys = ON")
+    #lets archive.compact hand free pages back a few at a time instead of a full VACUUM
+    #(only takes effect on a new database, older ones need one VACUUM to switch over)
+    c.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    #WAL lets readers (the search thread, backups) work while the app writes, and lets backup.py
+    #copy one consistent version of the database without blocking the app's commits
+    c.execute("PRAGMA journal_mode = WAL")
+
+    #existing databases keep whatever mode they were created with, new ones follow the config
+    timestamp_mode = timestamps.detect_mode(conn) or config.timestamp_mode
+    ts_type = timestamps.column_type(timestamp_mode)
 
 
 
     #create users table
-    c.execute("""CREATE TABLE IF NOT EXISTS users (
+    c.execute(f"""CREATE TABLE IF NOT EXISTS users (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 username TEXT UNIQUE NOT NULL,
                 email TEXT NOT NULL,
-                created_at TEXT NOT NULL
+                created_at {ts_type} NOT NULL
                 )""")
 
     #create players table
@@ -47,43 +118,390 @@ def init_db():
 
 
     #Updated create tasks table
-    c.execute("""CREATE TABLE IF NOT EXISTS tasks (
+    c.execute(f"""CREATE TABLE IF NOT EXISTS tasks (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         user_id INTEGER NOT NULL,
         title TEXT NOT NULL,
         priority TEXT NOT NULL,
         status TEXT NOT NULL,
-        due_date TEXT,
+        due_date {ts_type},
         description TEXT,
-        created_at TEXT,
-        completed_at TEXT,
+        created_at {ts_type},
+        completed_at {ts_type},
         FOREIGN KEY (user_id) REFERENCES users(id)
     )""")
 
     #create achievements table
-    c.execute("""CREATE TABLE IF NOT EXISTS achievements (
+    c.execute(f"""CREATE TABLE IF NOT EXISTS achievements (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 player_id INTEGER NOT NULL,
                 name TEXT NOT NULL,
                 description TEXT NOT NULL,
-                date_earned TEXT NOT NULL,
+                date_earned {ts_type} NOT NULL,
                 xp_reward INTEGER DEFAULT 0,
                 FOREIGN KEY (player_id) REFERENCES players(id)
                 )""")
 
+    #columns added after the first release, older databases get them here
+    if _add_column("players", "last_active_day", "INTEGER"):
+        #existing players would otherwise lose their streak on the next refresh or rollover
+        import streaks
+        streaks.backfill(conn)
+    _add_column("users", "change_counter", "INTEGER DEFAULT 0")
+    _add_column("tasks", "template_id", "INTEGER REFERENCES task_templates(id)")
+
+    #catalogue achievements (see achievements.py): the player's earned set as a bitset, and
+    #which catalogue entry each achievements row is, at most one row per player and entry
+    _add_column("players", "achievements_earned", "INTEGER NOT NULL DEFAULT 0")
+    _add_column("achievements", "achievement_id", "INTEGER")
+    c.execute("""CREATE UNIQUE INDEX IF NOT EXISTS idx_achievements_player_achievement
+                 ON achievements (player_id, achievement_id) WHERE achievement_id IS NOT NULL""")
+    #how many players have each achievement, so "how many have X" doesn't scan players
+    c.execute("""CREATE TABLE IF NOT EXISTS achievement_counts (
+                achievement_id INTEGER PRIMARY KEY,
+                players INTEGER NOT NULL
+                )""")
+    c.execute("""CREATE TRIGGER IF NOT EXISTS trg_achievements_insert_count
+                 AFTER INSERT ON achievements WHEN NEW.achievement_id IS NOT NULL BEGIN
+                     INSERT INTO achievement_counts (achievement_id, players) VALUES (NEW.achievement_id, 1)
+                     ON CONFLICT (achievement_id) DO UPDATE SET players = players + 1;
+                 END""")
+    c.execute("""CREATE TRIGGER IF NOT EXISTS trg_achievements_delete_count
+                 AFTER DELETE ON achievements WHEN OLD.achievement_id IS NOT NULL BEGIN
+                     UPDATE achievement_counts SET players = players - 1
+                     WHERE achievement_id = OLD.achievement_id;
+                 END""")
+
+    #recurring tasks are stored once here, their occurrences only become task rows when done
+    c.execute(f"""CREATE TABLE IF NOT EXISTS task_templates (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                title TEXT NOT NULL,
+                priority TEXT NOT NULL,
+                description TEXT,
+                frequency TEXT NOT NULL,
+                interval INTEGER NOT NULL DEFAULT 1,
+                start {ts_type} NOT NULL,
+                until {ts_type},
+                FOREIGN KEY (user_id) REFERENCES users(id)
+                )""")
+
+    #bump the owning user's change_counter on every task or player write,
+    #snapshot.py compares it to decide whether a cached session is still valid
+    for event, row in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD")):
+        c.execute(f"""CREATE TRIGGER IF NOT EXISTS trg_tasks_{event.lower()}_counter
+                      AFTER {event} ON tasks BEGIN
+                          UPDATE users SET change_counter = change_counter + 1 WHERE id = {row}.user_id;
+                      END""")
+    c.execute("""CREATE TRIGGER IF NOT EXISTS trg_players_update_counter
+                 AFTER UPDATE ON players BEGIN
+                     UPDATE users SET change_counter = change_counter + 1 WHERE id = NEW.user_id;
+                 END""")
+
+    #how much this connection's own writes moved each user's change_counter: a TEMP trigger only
+    #fires for writes made through its own connection, so a loaded session (see session.py) can
+    #tell its own changes from those of another process
+    c.execute("""CREATE TEMP TABLE IF NOT EXISTS own_changes (
+                user_id INTEGER PRIMARY KEY,
+                changes INTEGER NOT NULL
+                )""")
+    c.execute("""CREATE TEMP TRIGGER IF NOT EXISTS trg_own_changes
+                 AFTER UPDATE OF change_counter ON main.users BEGIN
+                     INSERT INTO own_changes (user_id, changes) VALUES (NEW.id, NEW.change_counter - OLD.change_counter)
+                     ON CONFLICT (user_id) DO UPDATE SET changes = changes + excluded.changes;
+                 END""")
+
+    #the id of each rank's rank-up achievement, kept for good once given (see achievements.py)
+    new_rank_table = c.execute("""SELECT 1 FROM sqlite_master
+                                  WHERE type = 'table' AND name = 'rank_achievements'""").fetchone() is None
+    c.execute("""CREATE TABLE IF NOT EXISTS rank_achievements (
+                rank_name TEXT PRIMARY KEY,
+                achievement_id INTEGER UNIQUE NOT NULL
+                )""")
+    if new_rank_table:
+        #ids given before the table existed were RANK_UP + the rank's place in the config
+        c.executemany("INSERT INTO rank_achievements (rank_name, achievement_id) VALUES (?, ?)",
+                      [(name, achievements.RANK_UP + i)
+                       for i, name in enumerate(current_config().rank_names[:achievements.MAX_RANKS])])
+        _backfill_achievements()
+    achievements.load_rank_ids(c.execute("SELECT rank_name, achievement_id FROM rank_achievements"))
+
+    #indexes so per-user lookups and the count_tasks_by aggregations don't scan the whole table
+    c.execute("""CREATE INDEX IF NOT EXISTS idx_tasks_user_status_priority
+                 ON tasks (user_id, status, priority)""")
+    c.execute("""CREATE INDEX IF NOT EXISTS idx_tasks_user_due_date
+                 ON tasks (user_id, due_date)""")
+    #one row per materialized occurrence, also what get_materialized_occurrences looks up
+    c.execute("""CREATE UNIQUE INDEX IF NOT EXISTS idx_tasks_template_occurrence
+                 ON tasks (template_id, due_date) WHERE template_id IS NOT NULL""")
+    c.execute("""CREATE INDEX IF NOT EXISTS idx_task_templates_user
+                 ON task_templates (user_id)""")
+
+    #cold storage for old completed tasks, see archive.py. Same columns as tasks, but
+    #no triggers or search index, and only the indexes the history view needs
+    c.execute(f"""CREATE TABLE IF NOT EXISTS tasks_archive (
+                id INTEGER PRIMARY KEY,
+                user_id INTEGER NOT NULL,
+                title TEXT NOT NULL,
+                priority TEXT NOT NULL,
+                status TEXT NOT NULL,
+                due_date {ts_type},
+                description TEXT,
+                created_at {ts_type},
+                completed_at {ts_type},
+                template_id INTEGER,
+                archived_at {ts_type} NOT NULL
+                )""")
+    _add_column("tasks", "estimated_duration", "INTEGER")
+    _add_column("tasks_archive", "estimated_duration", "INTEGER")
+    #the UID of a task imported from a calendar (see ics.py), unique per user so a re-import adds nothing
+    _add_column("tasks", "external_uid", "TEXT")
+    _add_column("tasks_archive", "external_uid", "TEXT")
+    c.execute("""CREATE UNIQUE INDEX IF NOT EXISTS idx_tasks_external_uid
+                 ON tasks (user_id, external_uid) WHERE external_uid IS NOT NULL""")
+    c.execute("""CREATE INDEX IF NOT EXISTS idx_tasks_archive_external_uid
+                 ON tasks_archive (user_id, external_uid) WHERE external_uid IS NOT NULL""")
+    c.execute("""CREATE INDEX IF NOT EXISTS idx_tasks_archive_user_completed
+                 ON tasks_archive (user_id, completed_at)""")
+    c.execute("""CREATE INDEX IF NOT EXISTS idx_tasks_archive_template
+                 ON tasks_archive (template_id, due_date) WHERE template_id IS NOT NULL""")
+    #archived tasks still count in count_tasks_by through these per-user totals
+    #(due_day is '' for tasks without a due date so it can be part of the key)
+    c.execute("""CREATE TABLE IF NOT EXISTS task_rollups (
+                user_id INTEGER NOT NULL,
+                priority TEXT NOT NULL,
+                status TEXT NOT NULL,
+                due_day TEXT NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (user_id, priority, status, due_day)
+                ) WITHOUT ROWID""")
+
+    #task dependencies: before_id has to be finished before after_id (see taskgraph.py);
+    #add_task_edge keeps them acyclic, and deleting (or archiving) a task drops its edges
+    c.execute("""CREATE TABLE IF NOT EXISTS task_edges (
+                before_id INTEGER NOT NULL REFERENCES tasks(id) ON DELETE CASCADE,
+                after_id INTEGER NOT NULL REFERENCES tasks(id) ON DELETE CASCADE,
+                user_id INTEGER NOT NULL,
+                PRIMARY KEY (before_id, after_id)
+                ) WITHOUT ROWID""")
+    c.execute("""CREATE INDEX IF NOT EXISTS idx_task_edges_after
+                 ON task_edges (after_id)""")
+    c.execute("""CREATE INDEX IF NOT EXISTS idx_task_edges_user
+                 ON task_edges (user_id)""")
+
+    #how far reminders.py has handed out reminders, so the next start can catch up on what it missed
+    c.execute(f"""CREATE TABLE IF NOT EXISTS reminder_state (
+                user_id INTEGER PRIMARY KEY REFERENCES users(id),
+                fired_until {ts_type} NOT NULL
+                )""")
+
+    fts_enabled = _create_search_index()
+    #a new database records its mode, an older one the mode worked out from its schema
+    timestamps.store_mode(conn, timestamp_mode)
+
     #commit schema changes
     conn.commit()
-    print(f"Database initialized at: {config.db_path}")
+    print(f"Database initialized at: {db_path}")
 
 
-def insert_user(user):
-    """Insert a new user into the database."""
-    with conn:
-        c.execute("""INSERT INTO users (username, email, created_at) 
-                     VALUES (:username, :email, :created_at)""",
-                  {'username': user.username,
+def close_db():
+    """Close the global connection, letting sqlite refresh its query planner stats first."""
+    global conn, c
+    if conn is None:
+        return
+    conn.execute("PRAGMA optimize")
+    conn.close()
+    conn = c = None
+
+
+@contextlib.contextmanager
+def transaction():
+    """Commit everything done inside the block at once, or roll it all back.
+
+    Nested blocks join the outer transaction through a savepoint, so a failing
+    inner block only undoes its own writes. The task service uses this to run
+    a whole batch of requests as one commit.
+    """
+    global _tx_depth
+    if _tx_depth == 0:
+        if not conn.in_transaction:
+            conn.execute("BEGIN")
+        savepoint = None
+    else:
+        savepoint = f"sp_{_tx_depth}"
+        conn.execute(f"SAVEPOINT {savepoint}")
+    _tx_depth += 1
+    try:
+        yield conn
+    except BaseException:
+        _tx_depth -= 1
+        if savepoint:
+            conn.execute(f"ROLLBACK TO {savepoint}")
+            conn.execute(f"RELEASE {savepoint}")
+        else:
+            conn.rollback()
+        raise
+    _tx_depth -= 1
+    if savepoint:
+        conn.execute(f"RELEASE {savepoint}")
+    else:
+        try:
+            conn.commit()
+        except BaseException:
+            #a failed COMMIT (e.g. SQLITE_BUSY, a deferred constraint) leaves the transaction open
+            conn.rollback()
+            raise
+
+
+@contextlib.contextmanager
+def count_queries(connection=None):
+    """Collect the SQL statements run on a connection inside the block.
+
+    Yields a list that fills up as statements run, so tests can hold an
+    operation to a query budget and catch N+1 loops. Transaction control
+    (BEGIN, COMMIT, SAVEPOINT...) and sqlite's own bookkeeping (the FTS index
+    writes, reported as "-- ..." comments) aren't counted.
+
+    sqlite3 reports the statements a trigger runs with the text of the
+    statement that fired it, so the trace alone can't tell them from the same
+    query run again. Each execute/executemany call made from Python on the
+    connection or its cursors is counted instead (a profile hook sees the
+    calls), with the first statement it traced as its text; an executemany
+    counts once, however many rows it has.
+    """
+    connection = connection or conn
+    statements = []
+    pending = False     # an execute call started and its statement wasn't traced yet
+
+    def profile(frame, event, arg):
+        nonlocal pending
+        if event == "c_call" and getattr(arg, "__name__", None) in ("execute", "executemany"):
+            owner = getattr(arg, "__self__", None)
+            if owner is connection or getattr(owner, "connection", None) is connection:
+                pending = True
+
+    def trace(sql):
+        nonlocal pending
+        if sql.startswith("--") or sql.lstrip().upper().startswith(_TX_CONTROL):
+            return
+        if pending:
+            statements.append(sql)
+            pending = False
+
+    previous_profile = sys.getprofile()
+    sys.setprofile(profile)
+    connection.set_trace_callback(trace)
+    try:
+        yield statements
+    finally:
+        connection.set_trace_callback(None)
+        sys.setprofile(previous_profile)
+
+
+def _create_search_index():
+    """Full-text index over task titles and descriptions, kept in sync by triggers.
+
+    user_id is indexed too (as a token) so a search only walks the posting
+    lists of the user's own tasks. Returns False if FTS5 isn't available.
+    """
+    c.execute("SELECT 1 FROM sqlite_master WHERE name = 'tasks_fts'")
+    existed = c.fetchone() is not None
+    try:
+        c.execute("""CREATE VIRTUAL TABLE IF NOT EXISTS tasks_fts
+                     USING fts5(title, description, user_id, content='tasks', content_rowid='id',
+                           prefix='2 3')""")
+    except sqlite3.OperationalError:
+        print("SQLite was built without FTS5, task search will use LIKE.")
+        return False
+
+    c.execute("""CREATE TRIGGER IF NOT EXISTS trg_tasks_fts_insert AFTER INSERT ON tasks BEGIN
+                     INSERT INTO tasks_fts (rowid, title, description, user_id)
+                     VALUES (NEW.id, NEW.title, NEW.description, NEW.user_id);
+                 END""")
+    c.execute("""CREATE TRIGGER IF NOT EXISTS trg_tasks_fts_delete AFTER DELETE ON tasks BEGIN
+                     INSERT INTO tasks_fts (tasks_fts, rowid, title, description, user_id)
+                     VALUES ('delete', OLD.id, OLD.title, OLD.description, OLD.user_id);
+                 END""")
+    #only text edits touch the index, status changes (the common update) skip it
+    c.execute("""CREATE TRIGGER IF NOT EXISTS trg_tasks_fts_update
+                 AFTER UPDATE OF title, description, user_id ON tasks BEGIN
+                     INSERT INTO tasks_fts (tasks_fts, rowid, title, description, user_id)
+                     VALUES ('delete', OLD.id, OLD.title, OLD.description, OLD.user_id);
+                     INSERT INTO tasks_fts (rowid, title, description, user_id)
+                     VALUES (NEW.id, NEW.title, NEW.description, NEW.user_id);
+                 END""")
+    if not existed:
+        #databases from before search existed: index the tasks already there
+        c.execute("INSERT INTO tasks_fts (tasks_fts) VALUES ('rebuild')")
+    return True
+
+
+def _ts(value):
+    #timestamps are bound as ISO text or as epoch seconds, depending on the DB
+    return timestamps.encode(value, timestamp_mode)
+
+
+def _add_column(table, column, declaration):
+    #sqlite has no ADD COLUMN IF NOT EXISTS, so check table_info first. True if it was added
+    c.execute(f"PRAGMA table_info({table})")
+    if column not in [row[1] for row in c.fetchall()]:
+        c.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+        return True
+    return False
+
+
+def _backfill_achievements():
+    #achievement rows from before the catalogue get their id from their name (the oldest row
+    #if the player has it twice), then the count table and the players' bitsets are rebuilt
+    names = [(info.name, info.id) for info in achievements.CATALOGUE.values()]
+    names += [(f"Rank Up: {name}", achievement_id)
+              for name, achievement_id in c.execute("SELECT rank_name, achievement_id FROM rank_achievements")]
+    c.executemany("""UPDATE achievements SET achievement_id = :id
+                     WHERE achievement_id IS NULL AND name = :name
+                     AND id = (SELECT MIN(a.id) FROM achievements a
+                               WHERE a.player_id = achievements.player_id AND a.name = :name)
+                     AND NOT EXISTS (SELECT 1 FROM achievements a
+                                     WHERE a.player_id = achievements.player_id AND a.achievement_id = :id)""",
+                  [{'name': name, 'id': achievement_id} for name, achievement_id in names])
+    c.execute("DELETE FROM achievement_counts")
+    c.execute("""INSERT INTO achievement_counts (achievement_id, players)
+                 SELECT achievement_id, COUNT(*) FROM achievements
+                 WHERE achievement_id IS NOT NULL GROUP BY achievement_id""")
+    #each id is a different power of two, so the sum is the bitwise OR
+    c.execute("""UPDATE players SET achievements_earned = achievements_earned | earned.bits
+                 FROM (SELECT player_id, SUM(1 << achievement_id) AS bits FROM achievements
+                       WHERE achievement_id IS NOT NULL GROUP BY player_id) AS earned
+                 WHERE players.id = earned.player_id""")
+
+
+def assign_rank_achievement(rank_name, first_id, last_id):
+    """The id of rank_name's rank-up achievement, giving it the next free one up to last_id if it
+    has none yet. None if they are all taken."""
+    with transaction():
+        #one statement, so two processes meeting a new rank at once can't hand out the same id
+        c.execute("""INSERT INTO rank_achievements (rank_name, achievement_id)
+                     SELECT :name, COALESCE(MAX(achievement_id) + 1, :first) FROM rank_achievements WHERE true
+                     HAVING COALESCE(MAX(achievement_id) + 1, :first) <= :last
+                     ON CONFLICT (rank_name) DO NOTHING""",
+                  {'name': rank_name, 'first': first_id, 'last': last_id})
+        row = c.execute("SELECT achievement_id FROM rank_achievements WHERE rank_name = ?",
+                        (rank_name,)).fetchone()
+    return row[0] if row else None
+
+
+def insert_user(user, user_id=None):
+    """Insert a new user into the database.
+
+    user_id is normally left for sqlite to pick; a user's shard (see
+    shards.py) takes the id the catalog gave them.
+    """
+    with transaction():
+        c.execute("""INSERT INTO users (id, username, email, created_at) 
+                     VALUES (:user_id, :username, :email, :created_at)""",
+                  {'user_id': user_id,
+                   'username': user.username,
                    'email': user.email,
-                   'created_at': user.created_at.isoformat()})
+                   'created_at': _ts(user.created_at)})
         return c.lastrowid  #return the new user's ID
 
 
@@ -92,13 +510,32 @@ def get_user_by_username(username):
     return c.fetchone()
 
 
+def get_user_by_id(user_id):
+    c.execute("SELECT * FROM users WHERE id = :user_id", {'user_id': user_id})
+    return c.fetchone()
+
+
+def get_change_counter(user_id):
+    """Return the user's change_counter, bumped by triggers whenever their data is written."""
+    c.execute("SELECT change_counter FROM users WHERE id = :user_id", {'user_id': user_id})
+    row = c.fetchone()
+    return row[0] if row else None
+
+
+def get_change_counters(user_id):
+    """(change_counter, how much of it this connection's own writes added), None if there is no such user."""
+    return c.execute("""SELECT u.change_counter,
+                               COALESCE((SELECT o.changes FROM temp.own_changes o WHERE o.user_id = u.id), 0)
+                        FROM users u WHERE u.id = :user_id""", {'user_id': user_id}).fetchone()
+
+
 def get_all_users():
     c.execute("SELECT * FROM users")
     return c.fetchall()
 
 
 def insert_player(user_id):
-    with conn:
+    with transaction():
         c.execute("""INSERT INTO players (user_id, xp, level, tasks_completed, 
                      tasks_failed, current_streak, longest_streak, 
                      tasks_completed_early, critical_tasks_completed) 
@@ -112,10 +549,55 @@ def get_player_by_user_id(user_id):
     return c.fetchone()
 
 
+def get_session_row(username=None, user_id=None):
+    """Everything a login needs about one user, in a single statement.
+
+    Look the user up by username or user_id. Returns a sqlite3.Row with
+    user_id, username, email, change_counter and own_changes (see
+    get_change_counters), the player's player_id and
+    PLAYER_STATS_COLUMNS (NULL if the user has no player row yet),
+    achievements, a JSON array of the player's achievement rows, and edges,
+    a JSON array of the user's [before_id, after_id] task dependencies. Columns are
+    read by name, so adding columns to these tables doesn't shift anything.
+    None if there is no such user.
+    """
+    stats = ", ".join(f"p.{column}" for column in PLAYER_STATS_COLUMNS)
+    cur = conn.cursor()
+    cur.row_factory = sqlite3.Row
+    cur.execute(f"""SELECT u.id AS user_id, u.username, u.email, u.change_counter,
+                           COALESCE((SELECT o.changes FROM temp.own_changes o WHERE o.user_id = u.id), 0)
+                               AS own_changes,
+                           p.id AS player_id, {stats},
+                           (SELECT json_group_array(json_object(
+                                       'achievement_id', a.achievement_id, 'name', a.name,
+                                       'description', a.description,
+                                       'date_earned', a.date_earned, 'xp_reward', a.xp_reward))
+                            FROM achievements a WHERE a.player_id = p.id) AS achievements,
+                           (SELECT json_group_array(json_array(e.before_id, e.after_id))
+                            FROM task_edges e WHERE e.user_id = u.id) AS edges
+                    FROM users u LEFT JOIN players p ON p.user_id = u.id
+                    WHERE {"u.username = :key" if username is not None else "u.id = :key"}""",
+                {'key': username if username is not None else user_id})
+    return cur.fetchone()
+
+
+def get_leaderboard(limit=10):
+    """The top players by XP (sharded storage has its own, shards.get_leaderboard)."""
+    cur = conn.cursor()
+    cur.row_factory = sqlite3.Row
+    cur.execute("""SELECT u.id AS user_id, u.username, p.xp, p.level, p.tasks_completed, p.previous_rank AS rank
+                   FROM players p JOIN users u ON u.id = p.user_id
+                   ORDER BY p.xp DESC LIMIT :limit""", {'limit': limit})
+    return [dict(row) for row in cur]
+
+
 def update_player_stats(player_id, xp, level, tasks_completed, tasks_failed,
                         current_streak, longest_streak, tasks_completed_early,
-                        critical_tasks_completed, previous_rank):
-    with conn:
+                        critical_tasks_completed, previous_rank, last_active_day=None,
+                        achievements_earned=None, restore=False):
+    """Save a player's stats. last_active_day and achievements_earned are left alone when None,
+    unless restore is set (an undo putting back the stats from before, where None is the value)."""
+    with transaction():
         c.execute("""UPDATE players SET 
                      xp = :xp,
                      level = :level,
@@ -125,68 +607,412 @@ def update_player_stats(player_id, xp, level, tasks_completed, tasks_failed,
                      longest_streak = :longest_streak,
                      tasks_completed_early = :tasks_completed_early,
                      critical_tasks_completed = :critical_tasks_completed,
-                     previous_rank = :previous_rank
+                     previous_rank = :previous_rank,
+                     last_active_day = CASE WHEN :restore THEN :last_active_day
+                                            ELSE COALESCE(:last_active_day, last_active_day) END,
+                     achievements_earned = CASE WHEN :restore THEN :achievements_earned
+                                                ELSE COALESCE(:achievements_earned, achievements_earned) END
                      WHERE id = :player_id""",
                   {'xp': xp, 'level': level, 'tasks_completed': tasks_completed,
                    'tasks_failed': tasks_failed, 'current_streak': current_streak,
                    'longest_streak': longest_streak,
                    'tasks_completed_early': tasks_completed_early,
                    'critical_tasks_completed': critical_tasks_completed,
-                   'previous_rank': previous_rank, 'player_id': player_id})
+                   'previous_rank': previous_rank, 'last_active_day': last_active_day,
+                   'achievements_earned': achievements_earned, 'restore': restore,
+                   'player_id': player_id})
+
+
+def insert_achievements(player_id, achievements):
+    """Record newly awarded achievements; the player's bitset is saved by update_player_stats."""
+    if not achievements:
+        return
+    with transaction():
+        c.executemany("""INSERT INTO achievements (player_id, achievement_id, name, description, date_earned,
+                                                   xp_reward)
+                         VALUES (?, ?, ?, ?, ?, ?)""",
+                      [(player_id, a.id, a.name, a.description, _ts(a.date_earned), a.xp_reward)
+                       for a in achievements])
+
+
+def delete_achievements(player_id, achievement_ids):
+    #for undo; achievements outside the catalogue (no id) aren't touched
+    achievement_ids = [i for i in achievement_ids if i is not None]
+    if not achievement_ids:
+        return
+    with transaction():
+        c.executemany("DELETE FROM achievements WHERE player_id = ? AND achievement_id = ?",
+                      [(player_id, i) for i in achievement_ids])
+
+
+def count_players_with(achievement_ids):
+    """How many players have earned all of achievement_ids, by a bitwise test on players.achievements_earned."""
+    return conn.execute("SELECT COUNT(*) FROM players WHERE achievements_earned & :mask = :mask",
+                        {'mask': achievements.mask(achievement_ids)}).fetchone()[0]
+
+
+def get_achievement_counts():
+    """{achievement_id: number of players who have it}, from the count table the triggers keep."""
+    return dict(conn.execute("SELECT achievement_id, players FROM achievement_counts WHERE players > 0"))
 
 
 def insert_task(task, user_id):
-    with conn:
+    _invalidate_counts(user_id)
+    with transaction():
         c.execute("""INSERT INTO tasks
-            (user_id, title, priority, status, due_date, description, created_at, completed_at)
-            VALUES (:user_id, :title, :priority, :status, :due_date, :description, :created_at, :completed_at)""",
+            (user_id, title, priority, status, due_date, description, created_at, completed_at, template_id,
+             estimated_duration)
+            VALUES (:user_id, :title, :priority, :status, :due_date, :description, :created_at, :completed_at,
+                    :template_id, :estimated_duration)""",
             {
                 'user_id': user_id,
                 'title': task.title,
                 'priority': task.priority,
                 'status': task.status,
-                'due_date': task.due_date.isoformat() if task.due_date else None,
+                'due_date': _ts(task.due_date),
                 'description': task.description,
-                'created_at': datetime.datetime.now().isoformat(),
-                'completed_at': task.completed_at.isoformat() if task.completed_at else None
+                'created_at': _ts(datetime.datetime.now()),
+                'completed_at': _ts(task.completed_at),
+                'template_id': task.template_id,
+                'estimated_duration': task.estimated_duration
             }
         )
         return c.lastrowid
 
 
 def get_tasks_by_user(user_id, status=None):
-    base = "SELECT * FROM tasks WHERE user_id = :user_id"
+    #status may be a single status or a tuple of statuses
+    if isinstance(status, str):
+        status = (status,)
+    base = f"SELECT {TASK_COLUMNS} FROM tasks WHERE user_id = :user_id"
     params = {'user_id': user_id}
     if status:
-        base += " AND status = :status"
-        params['status'] = status
+        base += _status_filter(status, params)
     c.execute(base, params)
+    return [_row_to_task(row) for row in c.fetchall()]
+
+
+def get_task(task_id, user_id):
+    c.execute(f"SELECT {TASK_COLUMNS} FROM tasks WHERE id = :task_id AND user_id = :user_id",
+              {'task_id': task_id, 'user_id': user_id})
+    row = c.fetchone()
+    return _row_to_task(row) if row else None
+
 
-    rows = c.fetchall()
-    tasks = []
-    for row in rows:
-        # 0 id, 1 user_id, 2 title, 3 priority, 4 status,
-        # 5 due_date, 6 description, 7 created_at, 8 completed_at
-        task = Task(
-            title=row[2],
-            priority=row[3],
-            status=row[4],
-            due_date=datetime.datetime.fromisoformat(row[5]) if row[5] else None,
-            description=row[6]
+def iter_tasks(user_id, status=None, chunk_size=500):
+    """Yield a user's tasks one at a time, for listings too big to load all at once.
+
+    status may be a single status or a tuple of statuses. Rows are fetched
+    chunk_size at a time on a cursor of their own, so other queries can run
+    while the caller is still iterating.
+    """
+    if isinstance(status, str):
+        status = (status,)
+    query = f"SELECT {TASK_COLUMNS} FROM tasks WHERE user_id = :user_id"
+    params = {'user_id': user_id}
+    if status:
+        query += _status_filter(status, params)
+    cur = conn.execute(query + " ORDER BY id", params)
+    while True:
+        rows = cur.fetchmany(chunk_size)
+        if not rows:
+            return
+        for row in rows:
+            yield _row_to_task(row)
+
+
+def insert_tasks(tasks, user_id, external_uids=None):
+    """Insert many tasks with one executemany. Returns how many were inserted (ids aren't set).
+
+    external_uids, one per task (or None), are the tasks' ids in the calendar they were
+    imported from; a task whose uid the user already has is skipped.
+    """
+    _invalidate_counts(user_id)
+    now = _ts(datetime.datetime.now())
+    if external_uids is None:
+        external_uids = [None] * len(tasks)
+    with transaction():
+        c.executemany("""INSERT INTO tasks
+            (user_id, title, priority, status, due_date, description, created_at, completed_at, template_id,
+             estimated_duration, external_uid)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (user_id, external_uid) WHERE external_uid IS NOT NULL DO NOTHING""",
+            [(user_id, t.title, t.priority, t.status, _ts(t.due_date), t.description, now,
+              _ts(t.completed_at), t.template_id, t.estimated_duration, uid)
+             for t, uid in zip(tasks, external_uids)])
+        return c.rowcount
+
+
+def get_archived_external_uids(user_id, uids):
+    """The ones among uids that belong to tasks of the user's that were archived."""
+    uids = list(uids)
+    found = set()
+    #sqlite allows at most 999 parameters per statement in older builds
+    for start in range(0, len(uids), 900):
+        part = uids[start:start + 900]
+        found.update(row[0] for row in conn.execute(
+            f"""SELECT external_uid FROM tasks_archive
+                WHERE user_id = ? AND external_uid IN ({', '.join('?' * len(part))})""", [user_id, *part]))
+    return found
+
+
+def _status_filter(status, params):
+    #" AND status IN (...)" for a tuple of statuses, adding their parameters to params
+    names = [f"status{i}" for i in range(len(status))]
+    params.update(zip(names, status))
+    return f" AND status IN ({', '.join(':' + name for name in names)})"
+
+
+def _row_to_task(row):
+    # 0 id, 1 user_id, 2 title, 3 priority, 4 status,
+    # 5 due_date, 6 description, 7 created_at, 8 completed_at, 9 template_id, 10 estimated_duration
+    task = Task(
+        title=row[2],
+        priority=row[3],
+        status=row[4],
+        due_date=timestamps.decode(row[5]),
+        description=row[6],
+        estimated_duration=row[10]
+    )
+    task.id = row[0]
+    task.created_at = timestamps.decode(row[7])
+    task.completed_at = timestamps.decode(row[8])
+    task.template_id = row[9]
+    return task
+
+
+def search_tasks(user_id, query, status=None, limit=20, offset=0, conn=None):
+    """Full-text search over a user's task titles and descriptions.
+
+    Every word in query has to match, the last one as a prefix since it may
+    still be being typed (so "weekly rep" finds "weekly report").
+    Results are Tasks, best match first, limit at a time starting at offset.
+    status may be a single status or a tuple like ACTIVE_STATUSES. Pass conn
+    to search from another thread on that thread's own connection.
+    """
+    words = re.findall(r"\w+", query)
+    if not words:
+        return []
+    cur = conn.cursor() if conn is not None else c
+    params = {'user_id': user_id, 'limit': limit, 'offset': offset}
+    if fts_enabled:
+        #each word is quoted so FTS5 operators typed into the search box are taken literally
+        terms = [f'"{w}"' for w in words[:-1]] + [f'"{words[-1]}"*']
+        params['match'] = f"user_id:{int(user_id)} AND " + " ".join(terms)
+        weights = ", ".join(str(w) for w in _FTS_WEIGHTS)
+        sql = f"""SELECT {_TASKS_PREFIXED} FROM tasks_fts JOIN tasks ON tasks.id = tasks_fts.rowid
+                  WHERE tasks_fts MATCH :match AND tasks.user_id = :user_id"""
+        order = f"bm25(tasks_fts, {weights})"
+    else:
+        sql = f"SELECT {_TASKS_PREFIXED} FROM tasks WHERE tasks.user_id = :user_id"
+        for i, word in enumerate(words):
+            sql += f" AND (title LIKE :w{i} OR description LIKE :w{i})"
+            params[f"w{i}"] = f"%{word}%"
+        order = "tasks.id DESC"
+    if isinstance(status, str):
+        status = (status,)
+    if status:
+        names = [f":status{i}" for i in range(len(status))]
+        sql += f" AND tasks.status IN ({', '.join(names)})"
+        params.update({name[1:]: value for name, value in zip(names, status)})
+    sql += f" ORDER BY {order} LIMIT :limit OFFSET :offset"
+    cur.execute(sql, params)
+    return [_row_to_task(row) for row in cur.fetchall()]
+
+
+def insert_template(template, user_id):
+    with transaction():
+        c.execute("""INSERT INTO task_templates
+            (user_id, title, priority, description, frequency, interval, start, until)
+            VALUES (:user_id, :title, :priority, :description, :frequency, :interval, :start, :until)""",
+            {
+                'user_id': user_id,
+                'title': template.title,
+                'priority': template.priority,
+                'description': template.description,
+                'frequency': template.frequency,
+                'interval': template.interval,
+                'start': _ts(template.start),
+                'until': _ts(template.until)
+            }
         )
-        task.id = row[0]
-        task.created_at = datetime.datetime.fromisoformat(row[7]) if row[7] else None
-        task.completed_at = datetime.datetime.fromisoformat(row[8]) if row[8] else None
-        tasks.append(task)
-    return tasks
+        return c.lastrowid
 
 
-def update_task_status(task_id, new_status, completed_at=None):
-    with conn:
+def get_templates_by_user(user_id):
+    c.execute("""SELECT id, title, priority, description, frequency, interval, start, until
+                 FROM task_templates WHERE user_id = :user_id""", {'user_id': user_id})
+    templates = []
+    for row in c.fetchall():
+        template = TaskTemplate(row[1], row[4], timestamps.decode(row[6]), priority=row[2],
+                                interval=row[5], until=timestamps.decode(row[7]),
+                                description=row[3] or "")
+        template.id = row[0]
+        templates.append(template)
+    return templates
+
+
+def get_materialized_occurrences(user_id, start, end):
+    """(template_id, due_date) pairs in [start, end) that already have a task row."""
+    query = """SELECT template_id, due_date FROM tasks
+               WHERE user_id = :user_id AND template_id IS NOT NULL
+               AND due_date >= :start AND due_date < :end"""
+    #occurrences done long enough ago may have been archived, only look there when needed
+    if _reaches_archive(start):
+        query += """ UNION ALL SELECT template_id, due_date FROM tasks_archive
+                     WHERE user_id = :user_id AND template_id IS NOT NULL
+                     AND due_date >= :start AND due_date < :end"""
+    c.execute(query, {'user_id': user_id, 'start': _ts(start), 'end': _ts(end)})
+    return {(row[0], timestamps.decode(row[1])) for row in c.fetchall()}
+
+
+def get_task_history(user_id, start=None, end=None, include_archive=None):
+    """Tasks the user completed in [start, end), most recent first.
+
+    Recent completions come from tasks; the archive is only read when
+    include_archive is True, or (by default) when start is older than
+    config.archive_after_days.
+    """
+    columns = TASK_COLUMNS
+    where = "user_id = :user_id AND status = :completed"
+    params = {'user_id': user_id, 'completed': TaskStatus.COMPLETED}
+    if start is not None:
+        where += " AND completed_at >= :start"
+        params['start'] = _ts(start)
+    if end is not None:
+        where += " AND completed_at < :end"
+        params['end'] = _ts(end)
+    if include_archive is None:
+        include_archive = _reaches_archive(start)
+
+    query = f"SELECT {columns} FROM tasks WHERE {where}"
+    if include_archive:
+        query += f" UNION ALL SELECT {columns} FROM tasks_archive WHERE {where}"
+    c.execute(query + " ORDER BY completed_at DESC", params)
+    return [_row_to_task(row) for row in c.fetchall()]
+
+
+def _reaches_archive(start):
+    #None means "from the beginning", which goes past any archive cutoff
+    if start is None:
+        return True
+    return start < datetime.datetime.now() - datetime.timedelta(days=current_config().archive_after_days)
+
+
+def update_task_status(task_id, new_status, completed_at=None, user_id=None):
+    #user_id is only used to drop the right cache entries; without it the whole cache is cleared
+    _invalidate_counts(user_id)
+    with transaction():
         c.execute("""UPDATE tasks
                      SET status = :status, completed_at = :completed_at
                      WHERE id = :task_id""",
                   {'status': new_status,
-                   'completed_at': completed_at.isoformat() if completed_at else None,
+                   'completed_at': _ts(completed_at),
                    'task_id': task_id})
 
+
+def delete_task(task_id, user_id=None):
+    _invalidate_counts(user_id)
+    with transaction():
+        c.execute("DELETE FROM tasks WHERE id = :task_id", {'task_id': task_id})
+
+
+def add_task_edge(user_id, before_id, after_id):
+    """Record that task before_id has to be finished before after_id.
+
+    Raises ValueError if either task isn't one of the user's, or if after_id
+    already leads to before_id, which would make a cycle. The check walks
+    only the tasks that come after after_id.
+    """
+    if before_id == after_id:
+        raise ValueError("a task can't depend on itself")
+    with transaction():
+        c.execute("SELECT COUNT(*) FROM tasks WHERE id IN (:before_id, :after_id) AND user_id = :user_id",
+                  {'before_id': before_id, 'after_id': after_id, 'user_id': user_id})
+        if c.fetchone()[0] != 2:
+            raise ValueError(f"tasks {before_id} and {after_id} aren't both tasks of user {user_id}")
+        c.execute("""WITH RECURSIVE later(id) AS (
+                         SELECT :after_id
+                         UNION
+                         SELECT e.after_id FROM task_edges e JOIN later ON e.before_id = later.id
+                     )
+                     SELECT 1 FROM later WHERE id = :before_id LIMIT 1""",
+                  {'before_id': before_id, 'after_id': after_id})
+        if c.fetchone():
+            raise ValueError(f"task {after_id} already comes before task {before_id}, "
+                             f"the dependency would make a cycle")
+        c.execute("""INSERT OR IGNORE INTO task_edges (before_id, after_id, user_id)
+                     VALUES (:before_id, :after_id, :user_id)""",
+                  {'before_id': before_id, 'after_id': after_id, 'user_id': user_id})
+
+
+def delete_task_edge(user_id, before_id, after_id):
+    with transaction():
+        c.execute("""DELETE FROM task_edges
+                     WHERE before_id = :before_id AND after_id = :after_id AND user_id = :user_id""",
+                  {'before_id': before_id, 'after_id': after_id, 'user_id': user_id})
+
+
+def get_reminders_fired_until(user_id):
+    row = conn.execute("SELECT fired_until FROM reminder_state WHERE user_id = ?", (user_id,)).fetchone()
+    return timestamps.decode(row[0]) if row else None
+
+
+def set_reminders_fired_until(user_id, when):
+    with transaction():
+        c.execute("""INSERT INTO reminder_state (user_id, fired_until) VALUES (:user_id, :when)
+                     ON CONFLICT (user_id) DO UPDATE SET fired_until = excluded.fired_until""",
+                  {'user_id': user_id, 'when': _ts(when)})
+
+
+def count_tasks_by(user_id, group_by="priority", status=None):
+    """Count a user's tasks grouped by priority, status or due day.
+
+    status may be a single status or a tuple of statuses, e.g. ACTIVE_STATUSES.
+    Returns a dict of {group value: count}, archived tasks included through
+    task_rollups. Results are cached for a few seconds and dropped as soon as
+    one of the user's tasks is written.
+    """
+    if group_by not in _GROUP_BY_KEYS:
+        raise ValueError(f"Unknown group_by: {group_by}")
+    if isinstance(status, str):
+        status = (status,)
+    elif status is not None:
+        status = tuple(status)
+
+    key = (user_id, group_by, status)
+    cached = _count_cache.get(key)
+    if cached and time.monotonic() - cached[0] < COUNT_CACHE_TTL:
+        return dict(cached[1])
+
+    column = timestamps.day_sql("due_date", timestamp_mode) if group_by == 'due_day' else group_by
+    query = f"SELECT {column} AS grp, COUNT(*) FROM tasks WHERE user_id = :user_id"
+    params = {'user_id': user_id}
+    if status:
+        query += _status_filter(status, params)
+    if group_by == 'due_day':
+        query += " AND due_date IS NOT NULL"
+    query += " GROUP BY grp"
+
+    c.execute(query, params)
+    counts = {row[0]: row[1] for row in c.fetchall()}
+
+    #archived tasks are all completed, so their rollups only matter when completed is counted
+    if status is None or TaskStatus.COMPLETED in status:
+        rollup_column = "NULLIF(due_day, '')" if group_by == 'due_day' else group_by
+        c.execute(f"""SELECT {rollup_column} AS grp, SUM(count) FROM task_rollups
+                      WHERE user_id = :user_id AND status = :completed GROUP BY grp""",
+                  {'user_id': user_id, 'completed': TaskStatus.COMPLETED})
+        for grp, count in c.fetchall():
+            if grp is not None or group_by != 'due_day':
+                counts[grp] = counts.get(grp, 0) + count
+    _count_cache[key] = (time.monotonic(), counts)
+    return dict(counts)
+
+
+def _invalidate_counts(user_id=None):
+    if user_id is None:
+        _count_cache.clear()
+        return
+    for key in [k for k in _count_cache if k[0] == user_id]:
+        del _count_cache[key]
@@ -0,0 +1,67 @@
+"""Change notifications from TaskManager to whoever shows its data.
+
+TaskManager (and RemoteTaskManager) publish one of the event types below
+after every change. The GUI pages subscribe to the ones that affect them and
+update only what changed, instead of re-reading everything on every page
+switch.
+
+    task_manager.events.subscribe(TaskAdded, lambda event: print(event.task.title))
+
+Handlers run synchronously on the thread that made the change.
+"""
+from typing import Any, NamedTuple, Optional
+
+
+class TaskAdded(NamedTuple):
+    task: Any
+
+
+class TaskCompleted(NamedTuple):
+    task: Any
+    xp_earned: int
+
+
+class TaskFailed(NamedTuple):
+    task: Any
+    xp_lost: int
+
+
+#an added task was taken back out (undo of an add)
+class TaskRemoved(NamedTuple):
+    task: Any
+
+
+#a completed or failed task is active again (undo of a complete/fail)
+class TaskRestored(NamedTuple):
+    task: Any
+
+
+class TemplateAdded(NamedTuple):
+    template: Any
+
+
+class XPChanged(NamedTuple):
+    xp: int
+    level: int
+    delta: int
+
+
+class RankChanged(NamedTuple):
+    old_rank: Optional[str]
+    new_rank: str
+
+
+class EventBus:
+
+    def __init__(self):
+        self._handlers = {}  # event type -> list of handlers
+
+    def subscribe(self, event_type, handler):
+        """Call handler(event) for every published event of event_type. Returns an unsubscribe function."""
+        self._handlers.setdefault(event_type, []).append(handler)
+        return lambda: self._handlers[event_type].remove(handler)
+
+    def publish(self, event):
+        #copy so a handler may unsubscribe while being called
+        for handler in list(self._handlers.get(type(event), ())):
+            handler(event)
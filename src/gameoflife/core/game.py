@@ -1,6 +1,15 @@
+import bisect
 import datetime
-from config import TaskStatus, Task, TaskPriority, config  # --- UPDATED: Added config import
+from collections import OrderedDict
+from config import TaskStatus, Task, TaskPriority, Config, compile_config, current_config
 import database  # used for add_task method and complete_tasks
+import streaks
+import journal
+import taskgraph
+import planner
+import achievements
+from events import (EventBus, TaskAdded, TaskCompleted, TaskFailed, TemplateAdded,
+                    XPChanged, RankChanged)
 
 
 class User:
@@ -18,8 +27,10 @@ class User:
 
 
 class Achievement:
-    def __init__(self, name: str, description: str, date_earned: datetime.date, xp_reward: int = 0):
+    def __init__(self, name: str, description: str, date_earned: datetime.date, xp_reward: int = 0,
+                 achievement_id=None):
 
+        self.id = achievement_id  #id in the catalogue (achievements.py), None for one that isn't in it
         self.name = name
         self.description = description #sets our string parameter 'description' that you will see later on in the code
         self.date_earned = date_earned
@@ -36,11 +47,13 @@ class FirstTaskCompleted(Achievement):
     #used to output reward text after first achievement. intended to keep users engaged so they dont have to complete 10 tasks to get a nice message
     #note it inherits the parameters from the Achievement super class
     def __init__(self):
+        info = achievements.CATALOGUE[achievements.FIRST_TASK]
         super().__init__(
-            name="First Task Completed",
-            description="Awarded for completing your first task.",
+            name=info.name,
+            description=info.description,
             date_earned=datetime.date.today(),
-            xp_reward=25
+            xp_reward=info.xp_reward,
+            achievement_id=info.id
         )
 
 
@@ -48,11 +61,13 @@ class EarlyBirdAchievement(Achievement):
     #same idea as previous class, used when you complete 10 tasks early
     #note it inherits the parameters from the Achievement super class
     def __init__(self):
+        info = achievements.CATALOGUE[achievements.EARLY_BIRD]
         super().__init__(
-            name="Early Bird",
-            description="Awarded for completing 10 tasks early.",
+            name=info.name,
+            description=info.description,
             date_earned=datetime.date.today(),
-            xp_reward=50
+            xp_reward=info.xp_reward,
+            achievement_id=info.id
         )
 
 
@@ -62,7 +77,8 @@ class RankUpAchievement(Achievement):
             name=f"Rank Up: {rank_name}",
             description=f"Reached the {rank_name} rank!",
             date_earned=datetime.date.today(),
-            xp_reward=50
+            xp_reward=achievements.RANK_UP_XP,
+            achievement_id=achievements.rank_up_id(rank_name)
         )
         self.rank_name = rank_name
 
@@ -74,6 +90,8 @@ class Player:
         self.xp = xp
         self.level = level
         self.achievements = []
+        # bit i set = catalogue achievement i earned, see achievements.py
+        self.achievements_earned = 0
         self.tasks_completed = 0
         self.current_streak = 0
         self.longest_streak = 0
@@ -81,59 +99,119 @@ class Player:
         self.previous_rank = None
         self.tasks_completed_early = 0
         self.critical_tasks_completed = 0
+        # date ordinal of the last day a task was completed, used by streaks.py
+        self.last_active_day = None
 
     def add_xp(self, amount):
-        self.xp = max(config.xp_config.xp_floor, self.xp + amount)
+        self.xp = max(current_config().xp_floor, self.xp + amount)
         self._check_level_up()
 
     def _check_level_up(self):
-        new_level = (self.xp // config.xp_per_level) + 1
+        new_level = (self.xp // current_config().xp_per_level) + 1
         if new_level > self.level:
             self.level = new_level
             return True
         return False
 
     def get_rank(self):
-        for rank in reversed(config.ranks):
-            if self.xp >= rank.xp_min:
-                return rank.name
-        return config.ranks[0].name
+        return current_config().rank_for(self.xp)
 
     def get_progress_to_next_level(self):
-        xp_into_current_level = self.xp % config.xp_per_level
-        return (xp_into_current_level / config.xp_per_level) * 100
+        per_level = current_config().xp_per_level
+        xp_into_current_level = self.xp % per_level
+        return (xp_into_current_level / per_level) * 100
+
+    def has_achievement(self, achievement_id):
+        return achievements.has(self.achievements_earned, achievement_id)
 
     def award_achievement(self, achievement):
+        """Give the player an achievement and its XP. False if they already have it."""
+        if achievement.id is not None:
+            if self.has_achievement(achievement.id):
+                return False
+            self.achievements_earned |= 1 << achievement.id
         self.achievements.append(achievement)
         if hasattr(achievement, 'xp_reward'):
             self.add_xp(achievement.xp_reward)
+        return True
 
 
 class XPCalculator:
 
-    def __init__(self, xp_config):
+    #how many (priority, bonus tier) previews to keep
+    PREVIEW_CACHE_SIZE = 256
+
+    def __init__(self, xp_config=None):
+        # with no xp_config the calculator follows the live config snapshot, so a
+        # reloaded config file takes effect straight away (see config.ConfigWatcher)
         self.config = xp_config
+        self._compiled = None
+        self._compiled_version = None
+        self._preview_cache = OrderedDict()
+        self._preview_snapshot = None
+
+    def _snapshot(self):
+        if self.config is None:
+            return current_config()
+        # a fixed XPConfig is compiled once, and again only if it is edited
+        if self._compiled_version != self.config.version:
+            self._compiled = compile_config(Config(xp_config=self.config))
+            self._compiled_version = self.config.version
+        return self._compiled
 
     def calculate_completion_xp(self, task, completion_time=None):
-        base_xp = self.config.base_rewards[task.priority]
+        snapshot = self._snapshot()
+        base_xp = getattr(snapshot.rewards, task.priority)
 
         if task.due_date and completion_time:
-            bonus = self._calculate_early_bonus(task.due_date, completion_time, base_xp)
+            bonus = snapshot.early_bonus(base_xp, (task.due_date - completion_time).total_seconds())
             return base_xp + bonus
 
         return base_xp
 
     def calculate_failure_penalty(self, task):
-        return self.config.base_penalties[task.priority]
-
-    def _calculate_early_bonus(self, due_date, completion_time, base_xp):
-        time_early = due_date - completion_time
-
-        for threshold in self.config.early_bonus_thresholds:
-            if 'days_early' in threshold and time_early.days >= threshold['days_early']:
-                return int(base_xp * threshold['bonus_pct'] / 100)
-
-        return 0
+        return getattr(self._snapshot().penalties, task.priority)
+
+    def preview(self, priority, due_date=None, now=None):
+        """What a task would be worth if it were completed now, for the Add Task form.
+
+        Returns a dict with the reward (base + early bonus), the base and bonus,
+        every early-bonus tier with its XP and whether it is reached, and the
+        failure penalty. Results are cached by priority and bonus tier.
+        """
+        snapshot = self._snapshot()
+        if snapshot is not self._preview_snapshot:
+            # snapshots are immutable, a different one means the config changed
+            self._preview_cache.clear()
+            self._preview_snapshot = snapshot
+
+        # bucket = how many tiers the time left reaches, -1 for no due date
+        tier_bucket = -1
+        if due_date is not None:
+            seconds_early = (due_date - (now or datetime.datetime.now())).total_seconds()
+            tier_bucket = bisect.bisect_right(snapshot.bonus_seconds, seconds_early)
+
+        key = (priority, tier_bucket)
+        cached = self._preview_cache.get(key)
+        if cached is not None:
+            self._preview_cache.move_to_end(key)
+            return dict(cached)
+
+        base_xp = getattr(snapshot.rewards, priority)
+        reached_from = len(snapshot.bonus_seconds) - max(tier_bucket, 0)
+        tiers = []
+        for i, (seconds, pct) in enumerate(snapshot.bonus_tiers):
+            tiers.append({'hours_early': seconds / 3600, 'bonus_pct': pct,
+                          'xp': int(base_xp * pct / 100), 'reached': i >= reached_from})
+        # the largest reached tier wins, same as calculate_completion_xp
+        bonus = next((t['xp'] for t in tiers if t['reached']), 0)
+        result = {'reward': base_xp + bonus, 'base': base_xp, 'bonus': bonus, 'tiers': tiers,
+                  'penalty': getattr(snapshot.penalties, priority)}
+
+        self._preview_cache[key] = result
+        if len(self._preview_cache) > self.PREVIEW_CACHE_SIZE:
+            self._preview_cache.popitem(last=False)
+        return dict(result)
 
 
 class TaskManager:
@@ -141,29 +219,83 @@ class TaskManager:
         self.player = player
         self.user_id = user_id
         self.player_id = player_id
-        self.xp_calculator = xp_calculator or XPCalculator(config.xp_config)
+        self.xp_calculator = xp_calculator or XPCalculator()
         self.active_tasks = []
         self.completed_tasks = []
         self.failed_tasks = []
+        self.templates = []
+        # every change is published here, see events.py
+        self.events = EventBus()
+        # adds, completions and failures that can be undone, see journal.py
+        self.journal = journal.Journal()
+        # which tasks wait for which, see taskgraph.py
+        self.graph = taskgraph.TaskGraph()
+        # picks tasks for a block of free time, made on first use, see planner.py
+        self._planner = None
+        # the user's change_counter when this was loaded, and how much of it this process's own
+        # writes had added by then; session.current_counter tells from them whether it is stale
+        self.change_counter = None
+        self.own_changes = 0
 
     def add_task(self, task):
+        self._store_task(task)
+        self.journal.record(journal.JournalEntry("add", task, task.status, task.status, None, False,
+                                                 None, None, ()))
+        return task
+
+    def _store_task(self, task):
         # in this defined function we need to give it the ability to save to DB
         task_id = database.insert_task(task, self.user_id)  # used to save to database
         task.id = task_id  # used to save the users id
 
         # --- UPDATED: removed override of created_at to use what's in the object
         self.active_tasks.append(task)
-        return task
+        self.graph.add_task(task.id)
+        self.events.publish(TaskAdded(task))
+
+    def add_template(self, template):
+        template.id = database.insert_template(template, self.user_id)
+        self.templates.append(template)
+        self.events.publish(TemplateAdded(template))
+        return template
+
+    def get_occurrences(self, start, end):
+        # occurrences of the recurring templates due in [start, end) that haven't
+        # been completed or failed yet; they only get a task row once they are
+        if not self.templates:
+            return []
+        done = database.get_materialized_occurrences(self.user_id, start, end)
+        occurrences = []
+        for template in self.templates:
+            for due in template.occurrences(start, end):
+                if (template.id, due) not in done:
+                    occurrences.append(template.make_task(due))
+        return occurrences
+
+    def _materialize(self, task):
+        # an occurrence from get_occurrences gets its row right before it is completed/failed,
+        # returns True if it did (undoing the completion removes the row again)
+        if task.id is None and task.template_id is not None and task not in self.active_tasks:
+            self._store_task(task)
+            return True
+        return False
 
-    def complete_task(self, task):
+    def complete_task(self, task, completed_at=None):
+        # completed_at defaults to now, simulate.py passes its simulated clock
+        status_before = task.status
+        materialized = self._materialize(task)
         if task not in self.active_tasks:
             raise ValueError("Task not found in active tasks")
 
+        stats_before = journal.capture(self.player)
+        achievements_before = len(self.player.achievements)
         task.mark_completed()
-        task.completed_at = datetime.datetime.now()
+        task.completed_at = completed_at or datetime.datetime.now()
+        xp_before = self.player.xp
+        rank_before = self.player.previous_rank
 
         # used to update the database
-        database.update_task_status(task.id, TaskStatus.COMPLETED, task.completed_at)
+        database.update_task_status(task.id, TaskStatus.COMPLETED, task.completed_at, self.user_id)
 
         # Calculate XP
         xp_earned = self.xp_calculator.calculate_completion_xp(task, task.completed_at)
@@ -171,7 +303,8 @@ class TaskManager:
 
         # Update player stats
         self.player.tasks_completed += 1
-        self.player.current_streak += 1
+        # the streak only moves once per day, see streaks.py
+        streaks.record_completion(self.player, task.completed_at.date())
 
         # Track early completion
         if task.priority == TaskPriority.CRITICAL:  # TaskPriority from config.py
@@ -180,6 +313,7 @@ class TaskManager:
         # Move task to completed
         self.active_tasks.remove(task)
         self.completed_tasks.append(task)
+        self.graph.finish(task.id)
 
         # Check for achievements
         new_achievements = self._check_achievements()
@@ -190,18 +324,23 @@ class TaskManager:
         if self.player.previous_rank != current_rank:
             rank_changed = True
             if self.player.previous_rank is not None:
-                self.player.award_achievement(RankUpAchievement(current_rank))
-                new_achievements.append(RankUpAchievement(current_rank))
+                achievement = RankUpAchievement(current_rank)
+                if self.player.award_achievement(achievement):
+                    new_achievements.append(achievement)
             self.player.previous_rank = current_rank
 
         # used at the end of the block to save all players stats
-        database.update_player_stats(
-            self.player_id, self.player.xp, self.player.level,
-            self.player.tasks_completed, self.player.tasks_failed,
-            self.player.current_streak, self.player.longest_streak,
-            self.player.tasks_completed_early, self.player.critical_tasks_completed,
-            self.player.previous_rank
-        )
+        with database.transaction():
+            self._save_player()
+            database.insert_achievements(self.player_id, new_achievements)
+        self.journal.record(journal.JournalEntry(
+            "complete", task, status_before, task.status, task.completed_at, materialized,
+            stats_before, journal.capture(self.player), tuple(self.player.achievements[achievements_before:])))
+
+        self.events.publish(TaskCompleted(task, xp_earned))
+        self._publish_xp(xp_before)
+        if rank_changed:
+            self.events.publish(RankChanged(rank_before, current_rank))
 
         return {
             'xp_earned': xp_earned,
@@ -211,10 +350,162 @@ class TaskManager:
             'new_rank': current_rank if rank_changed else None
         }
 
+    def fail_task(self, task):
+        status_before = task.status
+        materialized = self._materialize(task)
+        if task not in self.active_tasks:
+            raise ValueError("Task not found in active tasks")
+
+        stats_before = journal.capture(self.player)
+        task.status = TaskStatus.FAILED
+        database.update_task_status(task.id, TaskStatus.FAILED, None, self.user_id)
+        xp_before = self.player.xp
+
+        # apply the XP penalty, the xp floor in add_xp keeps it from going negative
+        xp_lost = self.xp_calculator.calculate_failure_penalty(task)
+        self.player.add_xp(-xp_lost)
+        self.player.tasks_failed += 1
+
+        self.active_tasks.remove(task)
+        self.failed_tasks.append(task)
+        self.graph.finish(task.id)
+
+        self._save_player()
+        self.journal.record(journal.JournalEntry(
+            "fail", task, status_before, task.status, None, materialized,
+            stats_before, journal.capture(self.player), ()))
+
+        self.events.publish(TaskFailed(task, xp_lost))
+        self._publish_xp(xp_before)
+
+        return {'xp_lost': xp_lost}
+
+    def undo(self):
+        """Undo the newest add/complete/fail. Returns what was undone, or None if there is nothing."""
+        entry = self.journal.undo(lambda entry: self._apply_entry(entry, undone=True))
+        return entry and {'action': entry.action, 'task': entry.task, 'xp_delta': entry.xp_delta}
+
+    def redo(self):
+        """Redo the newest undone operation, with the XP it gave the first time."""
+        entry = self.journal.redo(lambda entry: self._apply_entry(entry, undone=False))
+        return entry and {'action': entry.action, 'task': entry.task, 'xp_delta': entry.xp_delta}
+
+    def _apply_entry(self, entry, undone):
+        # puts back the recorded before (undone=True) or after values, nothing is recalculated;
+        # returns the entry for the journal to keep, with the edges an undone row took with it
+        task = entry.task
+        task_id = task.id
+        xp_before = self.player.xp
+        rank_before = self.player.previous_rank
+        if undone:
+            task.status, task.completed_at = entry.status_before, None
+        else:
+            task.status, task.completed_at = entry.status_after, entry.completed_at
+
+        edges = []
+        with database.transaction():
+            if entry.action == "add" or entry.materialized:
+                # the task row itself is what gets taken out / put back
+                if undone:
+                    entry = entry._replace(edges=self._task_edges(task))
+                    database.delete_task(task.id, self.user_id)
+                    task.id = None
+                else:
+                    task.id = database.insert_task(task, self.user_id)
+                    edges = self._restore_edges(entry.edges)
+            else:
+                database.update_task_status(task.id, task.status, task.completed_at, self.user_id)
+            if entry.stats_before is not None:
+                journal.restore(self.player, entry.stats_before if undone else entry.stats_after)
+                # the earned bits came back with the stats, the achievement rows follow them
+                if undone and entry.achievements:
+                    del self.player.achievements[-len(entry.achievements):]
+                    database.delete_achievements(self.player_id, [a.id for a in entry.achievements])
+                elif not undone:
+                    self.player.achievements.extend(entry.achievements)
+                    database.insert_achievements(self.player_id, entry.achievements)
+                # restore: a last_active_day put back to None has to reach the database as NULL
+                self._save_player(restore=True)
+
+        # the in-memory lists follow once the database has the change
+        done_list = self.completed_tasks if entry.action == "complete" else self.failed_tasks
+        if entry.action == "add" and undone:
+            self._move(task, self.active_tasks, None)
+        elif entry.action == "add":
+            self.active_tasks.append(task)
+        elif undone:
+            # an occurrence without its row is back to being generated by get_occurrences
+            self._move(task, done_list, None if entry.materialized else self.active_tasks)
+        else:
+            self._move(task, self.active_tasks, done_list)
+        # and so does the dependency graph; a deleted row took its edges with it
+        if undone and (entry.action == "add" or entry.materialized):
+            self.graph.remove_task(task_id)
+        elif entry.action == "add":
+            self.graph.add_task(task.id)
+        elif undone:
+            self.graph.reopen(task.id)
+        elif not entry.materialized:
+            self.graph.finish(task.id)
+        for before_id, after_id in edges:
+            self.graph.add_edge(before_id, after_id)
+
+        self.events.publish(journal.task_event(entry.action, task, undone, entry.xp_delta))
+        self._publish_xp(xp_before)
+        if self.player.previous_rank != rank_before:
+            self.events.publish(RankChanged(rank_before, self.player.previous_rank))
+        return entry
+
+    def _task_edges(self, task):
+        # as task objects: a task re-added by redo comes back with a new id
+        edges = self.graph.edges_of(task.id)
+        if not edges:
+            return ()
+        loaded = {t.id: t for t in self.active_tasks + self.completed_tasks + self.failed_tasks}
+        loaded[task.id] = task
+        return tuple((loaded[before_id], loaded[after_id]) for before_id, after_id in edges
+                     if before_id in loaded and after_id in loaded)
+
+    def _restore_edges(self, edges):
+        restored = []
+        for before, after in edges:
+            if before.id is None or after.id is None:
+                continue  # the other task has no row of its own at the moment
+            try:
+                database.add_task_edge(self.user_id, before.id, after.id)
+            except ValueError:
+                continue  # the other task is gone, or the edge would close a cycle by now
+            restored.append((before.id, after.id))
+        return restored
+
+    @staticmethod
+    def _move(task, source, target):
+        # undo works newest first, so the task is almost always at the end of source
+        if source and source[-1] is task:
+            source.pop()
+        elif task in source:
+            source.remove(task)
+        if target is not None:
+            target.append(task)
+
+    def _publish_xp(self, xp_before):
+        if self.player.xp != xp_before:
+            self.events.publish(XPChanged(self.player.xp, self.player.level, self.player.xp - xp_before))
+
+    def _save_player(self, restore=False):
+        database.update_player_stats(
+            self.player_id, self.player.xp, self.player.level,
+            self.player.tasks_completed, self.player.tasks_failed,
+            self.player.current_streak, self.player.longest_streak,
+            self.player.tasks_completed_early, self.player.critical_tasks_completed,
+            self.player.previous_rank, self.player.last_active_day, self.player.achievements_earned,
+            restore=restore
+        )
+
     def _check_achievements(self):
         new_achievements = []
 
-        #This is the first task achievement
+        #This is the first task achievement (award_achievement refuses one the player already has)
         if self.player.tasks_completed == 1:
             achievement = FirstTaskCompleted()
             if self.player.award_achievement(achievement):
@@ -232,7 +523,45 @@ class TaskManager:
 
         return new_achievements
 
-    def get_active_tasks(self, sort_by='priority'):
+    def count_tasks_by(self, group_by, status=None):
+        # counted in SQL, see database.count_tasks_by
+        return database.count_tasks_by(self.user_id, group_by, status)
+
+    def get_history(self, start=None, end=None):
+        # completed tasks in [start, end), archived ones included for old enough dates
+        return database.get_task_history(self.user_id, start, end)
+
+    def search_tasks(self, query, status=None, limit=20, offset=0, conn=None):
+        # ranked full-text search, see database.search_tasks
+        results = database.search_tasks(self.user_id, query, status, limit, offset, conn)
+        # hand back the loaded task objects so the results can be completed/failed directly
+        loaded = {t.id: t for t in self.active_tasks + self.completed_tasks}
+        return [loaded.get(t.id, t) for t in results]
+
+    def add_dependency(self, before, after):
+        """Make `after` wait until `before` is finished. Raises ValueError if that would make a cycle."""
+        database.add_task_edge(self.user_id, before.id, after.id)
+        self.graph.add_edge(before.id, after.id)
+
+    def remove_dependency(self, before, after):
+        database.delete_task_edge(self.user_id, before.id, after.id)
+        self.graph.remove_edge(before.id, after.id)
+
+    def is_blocked(self, task):
+        return not self.graph.is_ready(task.id)
+
+    def plan(self, minutes, exact=False, now=None):
+        """The unblocked tasks worth the most XP in `minutes` of free time, as a planner.Plan."""
+        if self._planner is None:
+            self._planner = planner.Planner(self)
+        return self._planner.plan(minutes, exact, now)
+
+    def get_active_tasks(self, sort_by='priority', unblocked=False):
+        # unblocked=True leaves out the tasks still waiting for another one
+        tasks = self.active_tasks
+        if unblocked:
+            is_ready = self.graph.is_ready
+            tasks = [t for t in tasks if is_ready(t.id)]
         if sort_by == 'priority':
             priority_order = {
                 TaskPriority.CRITICAL: 0,
@@ -240,8 +569,8 @@ class TaskManager:
                 TaskPriority.MEDIUM: 2,
                 TaskPriority.LOW: 3
             }
-            return sorted(self.active_tasks, key=lambda t: priority_order[t.priority])
+            return sorted(tasks, key=lambda t: priority_order[t.priority])
         elif sort_by == 'due_date':
-            return sorted(self.active_tasks, key=lambda t: t.due_date if t.due_date else datetime.datetime.max)
+            return sorted(tasks, key=lambda t: t.due_date if t.due_date else datetime.datetime.max)
         else:
-            return self.active_tasks
+            return tasks
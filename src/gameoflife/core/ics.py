@@ -0,0 +1,262 @@
+"""Import deadlines from iCalendar (.ics) files as tasks.
+
+The file is read one line at a time: each VEVENT or VTODO becomes a Task as
+soon as its END line is read, and tasks are written IMPORT_CHUNK at a time
+through database.insert_tasks, so memory stays flat however big the export
+is (bench_ics.py: 100k events in about 9 s, a re-import in 3.5 s).
+
+Mapping:
+    SUMMARY / DESCRIPTION   title / description
+    DUE, else DTSTART       due_date (UTC and TZID times are turned into local time)
+    DTEND - DTSTART, or DURATION   estimated_duration in minutes (timed entries only)
+    PRIORITY                task priority through config.ics_priorities, or priority_rule
+    UID                     tasks.external_uid (a hash of the entry's date and summary if it has none)
+
+Every entry's UID is kept in tasks.external_uid, which has a unique index per
+user, so importing the same file again (or an updated export) only adds the
+entries that are new. Completed or cancelled to-dos are skipped, and so are
+entries already past unless include_past is set (they would just be swept as
+failed). A recurring entry is imported once, at its first date.
+
+    python ics.py --user alice calendar.ics
+"""
+import argparse
+import datetime
+import hashlib
+import re
+from typing import NamedTuple
+
+from config import config, Task, TaskPriority
+import database
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:  # Python < 3.9, TZID times are then read as local time
+    ZoneInfo = None
+
+#tasks per insert_tasks call (and transaction)
+IMPORT_CHUNK = 1000
+
+_COMPONENTS = ("VEVENT", "VTODO")
+#properties that are read, everything else is skipped without being parsed
+_WANTED = {"UID", "SUMMARY", "DESCRIPTION", "DUE", "DTSTART", "DTEND", "DURATION", "PRIORITY", "STATUS"}
+_DURATION = re.compile(r"([+-])?P(?:(\d+)W)?(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?$")
+_UNESCAPE = re.compile(r"\\([\\;,nN])")
+
+
+class ImportResult(NamedTuple):
+    read: int           # VEVENT/VTODO entries in the file
+    imported: int
+    duplicates: int     # already imported before (same UID)
+    skipped: int        # done, cancelled, past or without a date
+
+
+def read_entries(lines):
+    """Yield (component, {property: (params, value)}) for each VEVENT/VTODO in the lines.
+
+    Long lines folded over several lines (RFC 5545 3.1) are joined back first.
+    """
+    component = None
+    props = None
+    current = None
+    nested = 0          # depth inside a component within the entry (e.g. a VALARM), skipped
+    for line in lines:
+        line = line.rstrip("\r\n")
+        if line[:1] in (" ", "\t"):
+            #continuation of the previous line
+            if current is not None:
+                current += line[1:]
+            continue
+        if current is not None and props is not None:
+            _add_property(props, current)
+        current = None
+        if line.startswith("BEGIN:"):
+            if component is not None:
+                nested += 1
+            elif line[6:] in _COMPONENTS:
+                component, props = line[6:], {}
+            continue
+        if line.startswith("END:"):
+            if nested:
+                nested -= 1
+            elif line[4:] == component:
+                yield component, props
+                component = props = None
+            continue
+        if props is not None and not nested:
+            current = line
+    if current is not None and props is not None:
+        _add_property(props, current)
+
+
+def _add_property(props, line):
+    colon = line.find(":")
+    if colon < 0:
+        return
+    head = line[:colon]
+    if '"' in head:
+        #a quoted parameter value may contain a colon itself
+        quoted = False
+        for i, char in enumerate(line):
+            if char == '"':
+                quoted = not quoted
+            elif char == ":" and not quoted:
+                colon = i
+                break
+        head = line[:colon]
+    name, _, params = head.partition(";")
+    name = name.upper()
+    if name in _WANTED and name not in props:
+        props[name] = (params, line[colon + 1:])
+
+
+def _params(params):
+    found = {}
+    for part in params.split(";") if params else ():
+        key, _, value = part.partition("=")
+        found[key.upper()] = value.strip('"')
+    return found
+
+
+def _text(value):
+    return _UNESCAPE.sub(lambda m: "\n" if m.group(1) in "nN" else m.group(1), value).strip()
+
+
+_zones = {}
+
+
+def parse_datetime(params, value):
+    """A DATE or DATE-TIME value as a naive local datetime, and whether it had a time. None if invalid."""
+    value = value.strip()
+    try:
+        if len(value) == 8:
+            return datetime.datetime.strptime(value, "%Y%m%d"), False
+        when = datetime.datetime(int(value[0:4]), int(value[4:6]), int(value[6:8]),
+                                 int(value[9:11]), int(value[11:13]), int(value[13:15]))
+    except ValueError:
+        return None, False
+    if value.endswith("Z"):
+        return when.replace(tzinfo=datetime.timezone.utc).astimezone().replace(tzinfo=None), True
+    tzid = _params(params).get("TZID") if params else None
+    if tzid and ZoneInfo is not None:
+        if tzid not in _zones:
+            try:
+                _zones[tzid] = ZoneInfo(tzid)
+            except (KeyError, ValueError, OSError):
+                #Windows-style or made-up zone names, the time is taken as local
+                _zones[tzid] = None
+        zone = _zones[tzid]
+        if zone is not None:
+            return when.replace(tzinfo=zone).astimezone().replace(tzinfo=None), True
+    return when, True
+
+
+def parse_duration(value):
+    """An RFC 5545 duration (e.g. PT1H30M) as a timedelta, None if invalid."""
+    match = _DURATION.match(value.strip())
+    if not match:
+        return None
+    sign, weeks, days, hours, minutes, seconds = match.groups()
+    delta = datetime.timedelta(weeks=int(weeks or 0), days=int(days or 0), hours=int(hours or 0),
+                               minutes=int(minutes or 0), seconds=int(seconds or 0))
+    return -delta if sign == "-" else delta
+
+
+def default_priority(props):
+    """The task priority for an entry's PRIORITY property, through config.ics_priorities."""
+    try:
+        level = int(props["PRIORITY"][1]) if "PRIORITY" in props else 0
+    except ValueError:
+        level = 0
+    return config.ics_priorities.get(level, TaskPriority.MEDIUM)
+
+
+def to_task(component, props, priority_rule=default_priority):
+    """(Task, uid) for an entry, or None if it has no date or is already done."""
+    if component == "VTODO" and props.get("STATUS", ("", ""))[1].strip().upper() in ("COMPLETED", "CANCELLED"):
+        return None
+    date_prop = props.get("DUE") or props.get("DTSTART")
+    if date_prop is None:
+        return None
+    due, timed = parse_datetime(*date_prop)
+    if due is None:
+        return None
+
+    minutes = None
+    if "DTSTART" in props and timed:
+        start = due if date_prop is props["DTSTART"] else parse_datetime(*props["DTSTART"])[0]
+        length = None
+        if "DURATION" in props:
+            length = parse_duration(props["DURATION"][1])
+        elif component == "VEVENT" and "DTEND" in props:
+            end, _ = parse_datetime(*props["DTEND"])
+            length = end - start if end and start else None
+        if length is not None and length > datetime.timedelta(0):
+            minutes = max(1, int(length.total_seconds() // 60))
+
+    title = _text(props["SUMMARY"][1]) if "SUMMARY" in props else ""
+    description = _text(props["DESCRIPTION"][1]) if "DESCRIPTION" in props else ""
+    task = Task(title or "(untitled)", priority_rule(props), due_date=due, description=description,
+                estimated_duration=minutes)
+    uid = props["UID"][1].strip() if "UID" in props else ""
+    if not uid:
+        #UID is required by RFC 5545 but some exports leave it out, the entry's own fields stand in for it
+        key = "\x1f".join((component, date_prop[0], date_prop[1], props.get("SUMMARY", ("", ""))[1]))
+        uid = "sha1:" + hashlib.sha1(key.encode("utf-8")).hexdigest()
+    return task, uid
+
+
+def import_ics(lines, user_id, include_past=False, priority_rule=default_priority, now=None,
+               chunk_size=IMPORT_CHUNK):
+    """Import the VEVENTs and VTODOs in lines (e.g. an open file) for user_id. Returns an ImportResult."""
+    now = now or datetime.datetime.now()
+    read = imported = duplicates = skipped = 0
+    tasks, uids = [], []
+
+    def flush():
+        nonlocal imported, duplicates
+        #archived tasks no longer have a row in tasks for the unique index to find
+        archived = database.get_archived_external_uids(user_id, uids)
+        keep = [(task, uid) for task, uid in zip(tasks, uids) if uid not in archived]
+        added = database.insert_tasks([task for task, _ in keep], user_id, [uid for _, uid in keep]) if keep else 0
+        imported += added
+        duplicates += len(tasks) - added
+        tasks.clear()
+        uids.clear()
+
+    for component, props in read_entries(lines):
+        read += 1
+        entry = to_task(component, props, priority_rule)
+        if entry is None or (not include_past and entry[0].due_date < now):
+            skipped += 1
+            continue
+        tasks.append(entry[0])
+        uids.append(entry[1])
+        if len(tasks) >= chunk_size:
+            flush()
+    if tasks:
+        flush()
+    return ImportResult(read, imported, duplicates, skipped)
+
+
+def main():
+    from game import User
+    parser = argparse.ArgumentParser(description="Import the events and to-dos of an .ics file as tasks.")
+    parser.add_argument("file")
+    parser.add_argument("--user", required=True)
+    parser.add_argument("--db", help="database path (defaults to the app database)")
+    parser.add_argument("--include-past", action="store_true", help="also import entries that are already past")
+    args = parser.parse_args()
+
+    database.init_db(args.db)
+    row = database.get_user_by_username(args.user)
+    user_id = row[0] if row else database.insert_user(User(args.user, ""))
+    with open(args.file, encoding="utf-8", errors="replace") as source:
+        result = import_ics(source, user_id, include_past=args.include_past)
+    print(f"{result.imported} imported, {result.duplicates} already there, {result.skipped} skipped "
+          f"({result.read} entries)")
+    database.close_db()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Undo/redo history for TaskManager.
+
+Every add, complete and fail is recorded with what it changed: the task's
+status before and after, the player's stats before and after (XP, level,
+streak, rank, counters) and the achievements it awarded. Undo puts the
+"before" values back and redo the "after" ones, so neither recalculates XP or
+looks at the task history. Undoing an add deletes the task row, and its
+dependencies go with it, so the entry keeps them for redo to add back. Only the last JOURNAL_SIZE operations are kept; older ones are
+dropped as new ones come in.
+
+    result = task_manager.undo()   # None if there is nothing to undo
+    result = task_manager.redo()
+"""
+from collections import deque
+from typing import Any, NamedTuple, Optional
+
+from events import TaskAdded, TaskCompleted, TaskFailed, TaskRemoved, TaskRestored
+
+#how many operations can be undone
+JOURNAL_SIZE = 50
+
+#the player stats an add/complete/fail can change, same ones TaskManager._save_player writes
+PLAYER_STATS = ("xp", "level", "tasks_completed", "tasks_failed", "current_streak", "longest_streak",
+                "tasks_completed_early", "critical_tasks_completed", "previous_rank", "last_active_day",
+                "achievements_earned")
+
+
+class JournalEntry(NamedTuple):
+    action: str                  # "add", "complete" or "fail"
+    task: Any
+    status_before: str
+    status_after: str
+    completed_at: Any            # after the operation
+    materialized: bool           # a recurring occurrence that got its task row from this operation
+    stats_before: Optional[tuple]  # PLAYER_STATS values, None for "add"
+    stats_after: Optional[tuple]
+    achievements: tuple          # awarded by this operation
+    #(before, after) task pairs of the dependencies the task row took with it when undone
+    edges: tuple = ()
+
+    @property
+    def xp_delta(self):
+        if self.stats_before is None:
+            return 0
+        return self.stats_after[0] - self.stats_before[0]
+
+
+def capture(player):
+    return tuple(getattr(player, name) for name in PLAYER_STATS)
+
+
+def restore(player, stats):
+    for name, value in zip(PLAYER_STATS, stats):
+        setattr(player, name, value)
+
+
+def task_event(action, task, undone, xp_delta):
+    """The event telling subscribers what undoing (or redoing) an action did to the task."""
+    if undone:
+        return TaskRemoved(task) if action == "add" else TaskRestored(task)
+    if action == "add":
+        return TaskAdded(task)
+    if action == "complete":
+        return TaskCompleted(task, xp_delta)
+    return TaskFailed(task, -xp_delta)
+
+
+class Journal:
+
+    def __init__(self, size=JOURNAL_SIZE):
+        #deques with maxlen drop the oldest entry when a new one is added
+        self._done = deque(maxlen=size)
+        self._undone = deque(maxlen=size)
+
+    def record(self, entry):
+        self._done.append(entry)
+        #a new operation makes the undone ones impossible to redo
+        self._undone.clear()
+
+    def can_undo(self):
+        return bool(self._done)
+
+    def can_redo(self):
+        return bool(self._undone)
+
+    def undo(self, apply):
+        """Call apply(entry) on the newest entry, then move the entry it returns to the redo side."""
+        if not self._done:
+            return None
+        entry = apply(self._done[-1])  # the entry stays put if apply raises
+        self._done.pop()
+        self._undone.append(entry)
+        return entry
+
+    def redo(self, apply):
+        if not self._undone:
+            return None
+        entry = apply(self._undone[-1])
+        self._undone.pop()
+        self._done.append(entry)
+        return entry
@@ -0,0 +1,83 @@
+"""Load test: many concurrent asyncio clients against one AsyncTaskManager setup.
+
+Each simulated client logs in as one of --users profiles and loops over
+add / list / complete / stats calls. Reports throughput and latency percentiles.
+
+    python loadtest_async.py --clients 2000 --ops 10
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+from config import config, Task, TaskPriority
+from game import User
+import async_manager
+import database
+
+_PRIORITIES = (TaskPriority.LOW, TaskPriority.MEDIUM, TaskPriority.HIGH, TaskPriority.CRITICAL)
+
+
+async def client(async_tm, ops, rng, latencies):
+    for i in range(ops):
+        started = time.perf_counter()
+        choice = rng.random()
+        if choice < 0.4:
+            await async_tm.add_task(Task(f"load task {i}", rng.choice(_PRIORITIES)))
+        elif choice < 0.7:
+            await async_tm.get_active_tasks()
+        elif choice < 0.9:
+            tasks = await async_tm.get_active_tasks()
+            if tasks:
+                try:
+                    await async_tm.complete_task(rng.choice(tasks))
+                except ValueError:
+                    #another client of the same profile completed it first
+                    pass
+        else:
+            await async_tm.load_player_stats()
+        latencies.append(time.perf_counter() - started)
+
+
+async def run(args):
+    executor = async_manager.DBExecutor(max_pending=args.max_pending)
+    managers = []
+    for i in range(args.users):
+        user = User(f"load{i}", "")
+        user_id = await executor.run(database.insert_user, user)
+        managers.append(await async_manager.load_session(user, user_id, executor))
+
+    rng = random.Random(0)
+    latencies = []
+    started = time.perf_counter()
+    await asyncio.gather(*(client(managers[i % args.users], args.ops, random.Random(rng.random()), latencies)
+                           for i in range(args.clients)))
+    elapsed = time.perf_counter() - started
+    executor.shutdown()
+
+    latencies.sort()
+    pct = lambda p: latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+    print(f"{args.clients} clients x {args.ops} ops on {args.users} profiles: "
+          f"{len(latencies)} ops in {elapsed:.2f}s ({len(latencies) / elapsed:,.0f} ops/s)")
+    print(f"latency p50 {pct(0.5):.1f} ms  p99 {pct(0.99):.1f} ms  max {latencies[-1] * 1000:.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--clients", type=int, default=2000)
+    parser.add_argument("--ops", type=int, default=10)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--max-pending", type=int, default=async_manager.DEFAULT_MAX_PENDING)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        config.db_path = os.path.join(tmp, "load.db")
+        database.init_db()
+        asyncio.run(run(args))
+        database.conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+""""What should I do next": picking tasks for a block of free time.
+
+Given how many minutes are free, plan() picks the active tasks that earn the
+most XP in that time and puts them in the order to do them. A task is worth
+its reward if completed when the plan says it will be (base XP plus the
+early-completion bonus, same as XPCalculator), plus the penalty it avoids
+when it is due before the free time is over (it would fail otherwise). Tasks
+take their estimated_duration, DEFAULT_MINUTES if they have none. Only
+unblocked tasks are planned (see taskgraph.py), and every planned task must
+be finished before it is due.
+
+Two ways to pick them:
+  heuristic  tasks by XP per minute, each one kept if the tasks picked so far
+             still all meet their deadlines in due-date order. Fast enough
+             to run on every change (bench_planner.py: 10k tasks well under
+             50 ms).
+  exact      a knapsack over the tasks in due-date order, with time counted
+             in EXACT_STEP minute steps. Finds the best set of tasks for the
+             budget, but takes a lot longer on big task lists.
+
+Planner keeps each task's duration, deadline and value between calls and
+follows the TaskManager's events, so a small change to the task list only
+updates those tasks. It recomputes everything when the XP config changes or
+VALUES_TTL seconds have passed (the early bonus depends on the time).
+Completing or removing a task the last plan didn't pick gives back the same
+plan without computing anything.
+"""
+import bisect
+import heapq
+import datetime
+from typing import List, NamedTuple
+
+from config import TaskStatus
+from events import TaskAdded, TaskCompleted, TaskFailed, TaskRemoved, TaskRestored
+
+#minutes assumed for a task without an estimated_duration
+DEFAULT_MINUTES = 30
+#the exact mode's time resolution, durations are rounded up to it
+EXACT_STEP = 5
+#how long task values are reused before they are worked out again for the current time
+VALUES_TTL = 60.0
+
+
+class Plan(NamedTuple):
+    tasks: List              # in the order to do them
+    finish_times: List       # when each one will be done
+    minutes: int             # planned time, at most the budget
+    xp: int                  # expected XP, rewards plus avoided penalties
+    exact: bool
+
+
+class _Entry(NamedTuple):
+    density: float           # XP per minute if started now, the heuristic's sort key
+    due: float               # seconds from the planning time, inf without a due date
+    minutes: int
+    task: object
+
+
+class Planner:
+
+    def __init__(self, task_manager):
+        self.task_manager = task_manager
+        self._entries = {}       # id(task) -> _Entry
+        self._order = []         # entries sorted by density, best first
+        self._now = None         # the time the entries were computed for
+        self._snapshot = None    # the config snapshot they were computed with
+        self._last = None        # (budget, exact, ready ids, plan) of the previous call
+        events = task_manager.events
+        for event in (TaskAdded, TaskRestored):
+            events.subscribe(event, lambda e: self._task_opened(e.task))
+        for event in (TaskCompleted, TaskFailed, TaskRemoved):
+            events.subscribe(event, lambda e: self._task_closed(e.task))
+
+    def plan(self, minutes, exact=False, now=None):
+        now = now or datetime.datetime.now()
+        #the same XP economy XPCalculator uses, so plan values match what completing pays
+        snapshot = self.task_manager.xp_calculator._snapshot()
+        if (self._snapshot is not snapshot or self._now is None
+                or abs((now - self._now).total_seconds()) > VALUES_TTL):
+            self._rebuild(now, snapshot)
+
+        is_ready = self.task_manager.graph.is_ready
+        #the entries are only kept for active tasks; blocked ones wait until they are ready
+        ready = frozenset(key for key, entry in self._entries.items() if is_ready(entry.task.id))
+        if self._last is not None:
+            budget, was_exact, last_ready, last_plan = self._last
+            if budget == minutes and was_exact == exact and last_ready == ready:
+                return last_plan
+        if exact:
+            plan = self._exact(minutes, ready)
+        else:
+            plan = self._greedy(minutes, ready)
+        self._last = (minutes, exact, ready, plan)
+        return plan
+
+    # ---- keeping the entries up to date ----
+
+    def _rebuild(self, now, snapshot):
+        self._now = now
+        self._snapshot = snapshot
+        self._entries = {}
+        for task in self.task_manager.active_tasks:
+            self._entries[id(task)] = self._entry(task)
+        self._order = sorted(self._entries.values(), key=_order_key)
+        self._last = None
+
+    def _task_opened(self, task):
+        #an undone recurring occurrence (no id) is generated again rather than active
+        if (self._now is None or task.id is None
+                or task.status not in (TaskStatus.PENDING, TaskStatus.IN_PROGRESS)):
+            return
+        self._drop(task)
+        entry = self._entry(task)
+        self._entries[id(task)] = entry
+        bisect.insort(self._order, entry, key=_order_key)
+        self._last = None
+
+    def _task_closed(self, task):
+        if self._now is None:
+            return
+        self._drop(task)
+        #the same plan still holds if the task wasn't part of it: the greedy pass never used
+        #it and the exact one would have picked it if it made the plan better
+        if self._last is not None and task not in self._last[3].tasks:
+            budget, exact, ready, plan = self._last
+            self._last = (budget, exact, ready - {id(task)}, plan)
+        else:
+            self._last = None
+
+    def _drop(self, task):
+        entry = self._entries.pop(id(task), None)
+        if entry is not None:
+            i = bisect.bisect_left(self._order, _order_key(entry), key=_order_key)
+            while self._order[i] is not entry:
+                i += 1
+            del self._order[i]
+
+    def _entry(self, task):
+        minutes = task.estimated_duration or DEFAULT_MINUTES
+        if task.due_date is None:
+            due = float("inf")
+        else:
+            due = (task.due_date - self._now).total_seconds()
+        value = self._value(task, due, minutes * 60)
+        return _Entry(value / minutes, due, minutes, task)
+
+    def _value(self, task, due, finish):
+        #XP for completing the task `finish` seconds after the planning time
+        snapshot = self._snapshot
+        base = getattr(snapshot.rewards, task.priority)
+        if due == float("inf"):
+            return base
+        return base + snapshot.early_bonus(base, due - finish)
+
+    def _penalty(self, entry, minutes):
+        #a task due before the free time is over fails if it isn't done in it
+        if entry.due <= minutes * 60:
+            return getattr(self._snapshot.penalties, entry.task.priority)
+        return 0
+
+    # ---- the two planners ----
+
+    def _greedy(self, minutes, ready):
+        #tasks due within the free time are also worth the penalty they avoid, so they are
+        #sorted again with it and merged into the cached order of the rest
+        window = minutes * 60
+        key = lambda e: -(e.density + self._penalty(e, minutes) / e.minutes)
+        urgent = sorted((e for e in self._order if e.due <= window), key=key)
+        rest = (e for e in self._order if e.due > window)
+        chosen = []              # (due, minutes) in due-date order
+        entries = []
+        used = 0
+        for entry in heapq.merge(urgent, rest, key=key):
+            if used + entry.minutes > minutes:
+                continue
+            if id(entry.task) not in ready or entry.due < entry.minutes * 60:
+                continue
+            i = bisect.bisect_right(chosen, (entry.due, entry.minutes))
+            if self._fits(chosen, i, entry):
+                chosen.insert(i, (entry.due, entry.minutes))
+                entries.insert(i, entry)
+                used += entry.minutes
+                if used == minutes:
+                    break
+        plan = self._make_plan(entries, minutes, exact=False)
+        #by XP per minute a few short tasks can crowd out one long task worth more than all of them
+        fitting = [e for e in self._order if id(e.task) in ready and e.minutes <= minutes
+                   and e.due >= e.minutes * 60]
+        if fitting:
+            single = self._make_plan([max(fitting, key=lambda e: -key(e) * e.minutes)], minutes, exact=False)
+            if single.xp > plan.xp:
+                return single
+        return plan
+
+    @staticmethod
+    def _fits(chosen, i, entry):
+        #in due-date order every task after position i finishes entry.minutes later
+        start = sum(m for _, m in chosen[:i])
+        if (start + entry.minutes) * 60 > entry.due:
+            return False
+        finish = start + entry.minutes
+        for due, m in chosen[i:]:
+            finish += m
+            if finish * 60 > due:
+                return False
+        return True
+
+    def _exact(self, minutes, ready):
+        steps = minutes // EXACT_STEP
+        candidates = []
+        for entry in self._order:
+            if id(entry.task) not in ready:
+                continue
+            size = -(-entry.minutes // EXACT_STEP)
+            deadline = min(steps, int(entry.due // (EXACT_STEP * 60)) if entry.due != float("inf") else steps)
+            if size <= deadline:
+                candidates.append((entry.due, size, deadline, entry))
+        #doing the picked tasks in due-date order meets every deadline a feasible order could
+        candidates.sort(key=lambda c: c[0])
+
+        unset = float("-inf")
+        best = [0.0] + [unset] * steps      # best[t]: most XP with the picked tasks ending at step t
+        taken = []
+        for _, size, deadline, entry in candidates:
+            penalty = self._penalty(entry, minutes)
+            row = bytearray(steps + 1)
+            for t in range(deadline, size - 1, -1):
+                if best[t - size] == unset:
+                    continue
+                value = (best[t - size] + penalty
+                         + self._value(entry.task, entry.due, t * EXACT_STEP * 60))
+                if value > best[t]:
+                    best[t] = value
+                    row[t] = 1
+            taken.append(row)
+
+        t = max(range(steps + 1), key=lambda step: best[step])
+        entries = []
+        for (_, size, _, entry), row in zip(reversed(candidates), reversed(taken)):
+            if row[t]:
+                entries.append(entry)
+                t -= size
+        entries.reverse()
+        return self._make_plan(entries, minutes, exact=True)
+
+    def _make_plan(self, entries, minutes, exact):
+        tasks, finish_times = [], []
+        xp = used = 0
+        for entry in entries:
+            used += entry.minutes
+            tasks.append(entry.task)
+            finish_times.append(self._now + datetime.timedelta(minutes=used))
+            xp += self._value(entry.task, entry.due, used * 60) + self._penalty(entry, minutes)
+        return Plan(tasks, finish_times, used, xp, exact)
+
+
+def _order_key(entry):
+    #best XP per minute first, the sooner due first among equals
+    return (-entry.density, entry.due)
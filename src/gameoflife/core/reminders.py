@@ -0,0 +1,211 @@
+"""Deadline reminders: "due in 24 hours", "due in 1 hour", "due now".
+
+Each active task with a due date gets one timer per config.reminder_minutes
+in a hierarchical timer wheel (TimerWheel). Adding or cancelling a timer is a
+dict insert or delete, and moving the clock on only looks at the slots it
+passes, so a tick costs the same with ten tasks or ten thousand; nothing ever
+walks the task list on a timer. The scheduler follows TaskManager's events:
+new and restored tasks get their timers, completed, failed and removed ones
+lose them.
+
+Whoever drives it calls poll() now and then, the GUI from one Tk after loop,
+and gets back the reminders that came due. The time up to which reminders
+have been handed out is kept in the reminder_state table. On the next start,
+start() returns every reminder that fell between then and now as a single
+batch, one per task (the most urgent one), instead of replaying them one by one.
+
+    scheduler = ReminderScheduler(task_manager)
+    missed = scheduler.start()
+    ...
+    for reminder in scheduler.poll():
+        print(reminder.task.title, reminder.before)
+"""
+import datetime
+from typing import Any, NamedTuple
+
+from config import config
+from events import TaskAdded, TaskCompleted, TaskFailed, TaskRemoved, TaskRestored
+import database
+
+#slots per wheel and number of wheels: 64**4 one-second ticks reach about 194 days ahead,
+#timers further out wait in an overflow bucket and are placed again each time it turns
+WHEEL_SLOTS = 64
+WHEEL_LEVELS = 4
+
+
+class TimerWheel:
+    """Hierarchical timing wheel keyed by whole-second ticks.
+
+    Level 0 has one slot per tick, each slot of level n covers a whole turn of
+    level n-1. A timer goes in the lowest level whose turn reaches its tick;
+    when the clock enters a higher-level slot, its timers drop down a level.
+    """
+
+    def __init__(self, now, slots=WHEEL_SLOTS, levels=WHEEL_LEVELS):
+        self.now = now
+        self.slots = slots
+        self._wheels = [[{} for _ in range(slots)] for _ in range(levels)]
+        self._overflow = {}
+        self._due = {}          # timers at or before now, handed out by the next advance
+        self._where = {}        # key -> the bucket (dict) holding it
+
+    def __len__(self):
+        return len(self._where)
+
+    def __contains__(self, key):
+        return key in self._where
+
+    def add(self, key, tick, value):
+        """Fire value at tick. Replaces a timer already under key."""
+        self.cancel(key)
+        self._place(key, tick, value)
+
+    def cancel(self, key):
+        bucket = self._where.pop(key, None)
+        if bucket is not None:
+            del bucket[key]
+
+    def advance(self, now):
+        """Move the clock to now. Returns the values of the timers that fired, earliest first."""
+        fired = list(self._take(self._due))
+        while self.now < now:
+            if not self._where:
+                #nothing left to fire, jump straight there
+                self.now = now
+                break
+            self.now += 1
+            self._cascade()
+            #a timer cascaded down on its own tick lands in _due
+            fired.extend(self._take(self._due) + self._take(self._wheels[0][self.now % self.slots]))
+        return fired
+
+    def _place(self, key, tick, value):
+        delta = tick - self.now
+        if delta <= 0:
+            bucket = self._due
+        else:
+            bucket = self._overflow
+            span = self.slots
+            for wheel in self._wheels:
+                if delta < span:
+                    bucket = wheel[tick // (span // self.slots) % self.slots]
+                    break
+                span *= self.slots
+        bucket[key] = (tick, value)
+        self._where[key] = bucket
+
+    def _cascade(self):
+        #entering a new slot of level n (n >= 1) moves its timers down, from the top level down
+        span = self.slots ** len(self._wheels)
+        if self.now % span == 0:
+            self._replace(self._overflow)
+        for level in range(len(self._wheels) - 1, 0, -1):
+            span //= self.slots
+            if self.now % span == 0:
+                self._replace(self._wheels[level][self.now // span % self.slots])
+
+    def _replace(self, bucket):
+        timers = list(bucket.items())
+        bucket.clear()
+        for key, (tick, value) in timers:
+            self._place(key, tick, value)
+
+    def _take(self, bucket):
+        timers = sorted(bucket.values(), key=lambda timer: timer[0])
+        for key in bucket:
+            del self._where[key]
+        bucket.clear()
+        return [value for _, value in timers]
+
+
+class Reminder(NamedTuple):
+    task: Any
+    before: datetime.timedelta      # how long before the due date, 0 for "due now"
+    at: datetime.datetime           # when the reminder was meant to go off
+
+
+def message(reminder):
+    """One line for a reminder, e.g. 'Write report is due in 1 hour'."""
+    minutes = int(reminder.before.total_seconds() // 60)
+    if minutes == 0:
+        return f"{reminder.task.title} is due now"
+    if minutes % 60:
+        return f"{reminder.task.title} is due in {minutes} minutes"
+    hours = minutes // 60
+    return f"{reminder.task.title} is due in {hours} hour{'s' if hours != 1 else ''}"
+
+
+def _tick(when):
+    return int(when.timestamp())
+
+
+class ReminderScheduler:
+
+    def __init__(self, task_manager, minutes=None):
+        self.task_manager = task_manager
+        #largest first, so a task's reminders are kept in the order they go off
+        self.offsets = sorted((datetime.timedelta(minutes=m) for m in (minutes or config.reminder_minutes)),
+                              reverse=True)
+        self.wheel = None
+        events = task_manager.events
+        self._unsubscribe = [events.subscribe(TaskAdded, lambda e: self.schedule(e.task)),
+                             events.subscribe(TaskRestored, lambda e: self.schedule(e.task)),
+                             events.subscribe(TaskCompleted, lambda e: self.cancel(e.task)),
+                             events.subscribe(TaskFailed, lambda e: self.cancel(e.task)),
+                             events.subscribe(TaskRemoved, lambda e: self.cancel(e.task))]
+
+    def start(self, now=None):
+        """Schedule every active task. Returns the reminders missed since the last run, one per task."""
+        now = now or datetime.datetime.now()
+        self.wheel = TimerWheel(_tick(now))
+        fired_until = database.get_reminders_fired_until(self.task_manager.user_id)
+        missed = []
+        for task in self.task_manager.active_tasks:
+            latest = None
+            for reminder in self._reminders(task):
+                if reminder.at > now:
+                    self.wheel.add((id(task), reminder.before), _tick(reminder.at), reminder)
+                elif fired_until is not None and reminder.at > fired_until:
+                    latest = reminder
+            if latest is not None:
+                missed.append(latest)
+        missed.sort(key=lambda reminder: reminder.task.due_date)
+        database.set_reminders_fired_until(self.task_manager.user_id, now)
+        return missed
+
+    def stop(self):
+        for unsubscribe in self._unsubscribe:
+            unsubscribe()
+        self._unsubscribe = []
+
+    def schedule(self, task):
+        #reminders that are already past when the task is added or restored are skipped
+        if self.wheel is None:
+            return
+        self.cancel(task)
+        now = datetime.datetime.fromtimestamp(self.wheel.now)
+        for reminder in self._reminders(task):
+            if reminder.at > now:
+                self.wheel.add((id(task), reminder.before), _tick(reminder.at), reminder)
+
+    def cancel(self, task):
+        if self.wheel is None:
+            return
+        for before in self.offsets:
+            self.wheel.cancel((id(task), before))
+
+    def poll(self, now=None):
+        """The reminders that came due since the last poll, oldest first."""
+        now = now or datetime.datetime.now()
+        fired = self.wheel.advance(_tick(now))
+        if fired:
+            database.set_reminders_fired_until(self.task_manager.user_id, now)
+        return fired
+
+    def _reminders(self, task):
+        #a task gets no reminders from before it was created, e.g. "due in 24h" for one added an hour before
+        if task.due_date is None:
+            return []
+        created = task.created_at or datetime.datetime.min
+        return [Reminder(task, before, task.due_date - before) for before in self.offsets
+                if task.due_date - before >= created]
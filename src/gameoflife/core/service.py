@@ -0,0 +1,301 @@
+"""Local task service: one process owns the database, everyone else talks to it.
+
+The GUI and scripts can share a database without each opening a sqlite3
+connection and fighting over the write lock. Clients (see client.py) send one
+JSON object per line over a Unix socket or localhost TCP:
+
+    {"id": 1, "op": "add_task", "args": {"user_id": 3, "task": {...}}}
+
+and get back {"id": 1, "ok": true, "result": ...} or {"id": 1, "ok": false, "error": "..."}.
+
+Writes that arrive within BATCH_WINDOW seconds of each other run as a single
+transaction (each request in its own savepoint, so one failure doesn't undo the
+others). Reads are answered from the loaded TaskManager sessions and a small
+result cache that is cleared for a user whenever they write.
+
+    python service.py --address 127.0.0.1:8765
+    python service.py --address unix:/tmp/gameoflife.sock
+"""
+import argparse
+import asyncio
+import json
+import os
+
+import datetime
+from collections import OrderedDict
+
+from config import config, Task, TaskTemplate, ConfigWatcher, default_config_path
+from game import User
+from client import parse_address
+import async_manager
+import database
+import session
+
+#how long to wait for more writes before committing a batch, and the most per batch
+BATCH_WINDOW = 0.002
+MAX_BATCH = 500
+#read results kept, least recently used dropped first
+READ_CACHE_SIZE = 1000
+
+WRITE_OPS = {"login", "add_task", "complete_task", "fail_task", "add_template", "undo", "redo",
+             "add_dependency", "remove_dependency"}
+READ_OPS = {"get_active_tasks", "get_player", "count_tasks_by", "get_occurrences", "search_tasks",
+            "get_history"}
+
+
+class TaskService:
+
+    def __init__(self, batch_window=BATCH_WINDOW, max_batch=MAX_BATCH):
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.executor = None
+        self.sessions = {}      # user_id -> TaskManager
+        self._read_cache = OrderedDict()   # (user_id, op, args) -> result, most recently used last
+        self._generation = {}   # user_id -> bumped on every write, guards the read cache
+        self._writes = None
+        self.stats = {'requests': 0, 'batches': 0, 'batched_writes': 0, 'cache_hits': 0}
+
+    async def start(self, address):
+        self.executor = async_manager.DBExecutor()
+        self._writes = asyncio.Queue()
+        asyncio.get_running_loop().create_task(self._write_loop())
+        kind, where = parse_address(address)
+        if kind == "unix":
+            if os.path.exists(where):
+                os.remove(where)
+            return await asyncio.start_unix_server(self._handle_client, path=where)
+        return await asyncio.start_server(self._handle_client, *where)
+
+    async def _handle_client(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                request = json.loads(line)
+                response = await self.dispatch(request)
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+        except (ConnectionError, json.JSONDecodeError):
+            pass
+        finally:
+            writer.close()
+
+    async def dispatch(self, request):
+        self.stats['requests'] += 1
+        op = request.get("op")
+        args = request.get("args", {})
+        try:
+            if op in WRITE_OPS:
+                future = asyncio.get_running_loop().create_future()
+                await self._writes.put((op, args, future))
+                result = await future
+            elif op in READ_OPS:
+                result = await self._read(op, args)
+            else:
+                raise ValueError(f"Unknown op: {op}")
+            return {'id': request.get('id'), 'ok': True, 'result': result}
+        except Exception as exc:
+            return {'id': request.get('id'), 'ok': False, 'error': f"{type(exc).__name__}: {exc}"}
+
+    # ---- writes ----
+
+    async def _write_loop(self):
+        while True:
+            batch = [await self._writes.get()]
+            #give other clients a moment to add their writes to the same commit
+            await asyncio.sleep(self.batch_window)
+            while not self._writes.empty() and len(batch) < self.max_batch:
+                batch.append(self._writes.get_nowait())
+            try:
+                results = await self.executor.run(self._apply_batch, batch)
+            except Exception as exc:
+                #the commit itself failed (e.g. database is locked): the whole batch was rolled
+                #back, so its clients get the error and their sessions are reloaded next time
+                for op, args, future in batch:
+                    self._forget(args.get('user_id'))
+                    if not future.done():
+                        future.set_exception(exc)
+                continue
+            self.stats['batches'] += 1
+            self.stats['batched_writes'] += len(batch)
+            for (_, _, future), (ok, value) in zip(batch, results):
+                if future.done():
+                    continue
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+
+    def _apply_batch(self, batch):
+        #runs on the DB thread, one commit for the whole batch
+        results = []
+        with database.transaction():
+            for op, args, _ in batch:
+                try:
+                    with database.transaction():
+                        results.append((True, getattr(self, f"_op_{op}")(**args)))
+                except Exception as exc:
+                    #the savepoint undid the SQL, the cached TaskManager may still have the change
+                    self._forget(args.get('user_id'))
+                    results.append((False, exc))
+        return results
+
+    def _session(self, user_id):
+        task_manager = self.sessions.get(user_id)
+        if task_manager is None:
+            #raises ValueError for an unknown user_id
+            task_manager = session.load_session(None, user_id)
+            self.sessions[user_id] = task_manager
+        return task_manager
+
+    def _forget(self, user_id):
+        #drop a session whose memory may no longer match the database, it is loaded again when needed
+        if user_id is not None:
+            self.sessions.pop(user_id, None)
+            self._invalidate(user_id)
+
+    def _invalidate(self, user_id):
+        self._generation[user_id] = self._generation.get(user_id, 0) + 1
+        for key in [k for k in self._read_cache if k[0] == user_id]:
+            del self._read_cache[key]
+
+    def _find_active(self, task_manager, task_id, task=None):
+        if task_id is None and task and task.get('template_id') is not None:
+            #an occurrence of a recurring task, TaskManager gives it a row when it is done
+            return Task.from_dict(task)
+        for task in task_manager.active_tasks:
+            if task.id == task_id:
+                return task
+        raise ValueError(f"Task {task_id} is not active")
+
+    def _op_login(self, username, email=""):
+        user_row = database.get_user_by_username(username)
+        user_id = user_row[0] if user_row else database.insert_user(User(username, email))
+        self._session(user_id)
+        return user_id
+
+    def _op_add_task(self, user_id, task):
+        task_manager = self._session(user_id)
+        self._invalidate(user_id)
+        return task_manager.add_task(Task.from_dict(task)).to_dict()
+
+    def _op_complete_task(self, user_id, task_id, task=None):
+        task_manager = self._session(user_id)
+        self._invalidate(user_id)
+        result = task_manager.complete_task(self._find_active(task_manager, task_id, task))
+        result['new_achievements'] = [a.name for a in result['new_achievements']]
+        return result
+
+    def _op_fail_task(self, user_id, task_id, task=None):
+        task_manager = self._session(user_id)
+        self._invalidate(user_id)
+        return task_manager.fail_task(self._find_active(task_manager, task_id, task))
+
+    def _op_add_template(self, user_id, template):
+        task_manager = self._session(user_id)
+        self._invalidate(user_id)
+        parse = lambda value: datetime.datetime.fromisoformat(value) if value else None
+        new_template = TaskTemplate(template['title'], template['frequency'], parse(template['start']),
+                                    priority=template['priority'], interval=template.get('interval', 1),
+                                    until=parse(template.get('until')),
+                                    description=template.get('description', ""))
+        return task_manager.add_template(new_template).id
+
+    def _op_undo(self, user_id):
+        task_manager = self._session(user_id)
+        self._invalidate(user_id)
+        return self._journal_result(task_manager.undo())
+
+    def _op_redo(self, user_id):
+        task_manager = self._session(user_id)
+        self._invalidate(user_id)
+        return self._journal_result(task_manager.redo())
+
+    def _op_add_dependency(self, user_id, before_id, after_id):
+        task_manager = self._session(user_id)
+        self._invalidate(user_id)
+        task_manager.add_dependency(self._find_active(task_manager, before_id, None),
+                                    self._find_active(task_manager, after_id, None))
+
+    def _op_remove_dependency(self, user_id, before_id, after_id):
+        task_manager = self._session(user_id)
+        self._invalidate(user_id)
+        database.delete_task_edge(user_id, before_id, after_id)
+        task_manager.graph.remove_edge(before_id, after_id)
+
+    @staticmethod
+    def _journal_result(result):
+        if result is not None:
+            result['task'] = result['task'].to_dict()
+        return result
+
+    # ---- reads ----
+
+    async def _read(self, op, args):
+        key = (args.get("user_id"), op, json.dumps(args, sort_keys=True))
+        if key in self._read_cache:
+            self.stats['cache_hits'] += 1
+            self._read_cache.move_to_end(key)
+            return self._read_cache[key]
+        generation = self._generation.get(key[0], 0)
+        result = await self.executor.run(getattr(self, f"_op_{op}"), **args)
+        #don't cache a result that a write may have made stale while it was computed
+        if self._generation.get(key[0], 0) == generation:
+            self._read_cache[key] = result
+            if len(self._read_cache) > READ_CACHE_SIZE:
+                self._read_cache.popitem(last=False)
+        return result
+
+    def _op_get_active_tasks(self, user_id, sort_by='priority', unblocked=False):
+        return [t.to_dict() for t in self._session(user_id).get_active_tasks(sort_by, unblocked)]
+
+    def _op_get_player(self, user_id):
+        player = self._session(user_id).player
+        stats = {name: value for name, value in vars(player).items()
+                 if name not in ('user', 'achievements')}
+        stats['username'] = player.user.username
+        stats['email'] = player.user.email
+        return stats
+
+    def _op_get_occurrences(self, user_id, start, end):
+        occurrences = self._session(user_id).get_occurrences(datetime.datetime.fromisoformat(start),
+                                                             datetime.datetime.fromisoformat(end))
+        return [t.to_dict() for t in occurrences]
+
+    def _op_get_history(self, user_id, start=None, end=None):
+        parse = lambda value: datetime.datetime.fromisoformat(value) if value else None
+        return [t.to_dict() for t in self._session(user_id).get_history(parse(start), parse(end))]
+
+    def _op_count_tasks_by(self, user_id, group_by, status=None):
+        return self._session(user_id).count_tasks_by(group_by, status)
+
+    def _op_search_tasks(self, user_id, query, status=None, limit=20, offset=0):
+        results = self._session(user_id).search_tasks(query, status, limit, offset)
+        return [t.to_dict() for t in results]
+
+
+async def serve(address, db_path=None):
+    database.init_db(db_path)
+    #pick up XP economy changes from the config file without restarting the service
+    ConfigWatcher(default_config_path()).start()
+    service = TaskService()
+    server = await service.start(address)
+    print(f"Task service listening on {address}")
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the local Game of Life task service.")
+    parser.add_argument("--address", default=config.service_address or "127.0.0.1:8765")
+    parser.add_argument("--db", help="database path (defaults to the app database)")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.address, args.db))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+"""Loading a logged-in user's Player and TaskManager.
+
+This used to live in WelcomePage._begin. The user, their player stats and
+achievements come from one statement (database.get_session_row). A valid
+snapshot (see snapshot.py) is used when the user's change_counter hasn't
+moved since it was written, otherwise the tasks are read with one more query
+and a fresh snapshot is saved for next time. With the templates that makes
+three queries per login however many tasks the user has (test_session.py
+holds it to that).
+
+With sharded storage (config.shard_dir, see shards.py) login first switches
+the database over to the user's own file.
+
+SessionCache keeps the sessions of users the app switched away from, so
+switching back to one is a single change_counter check instead of a login.
+"""
+import json
+import sys
+from collections import OrderedDict
+from typing import Any, NamedTuple
+
+from config import config, TaskStatus
+from game import Achievement, Player, TaskManager, User
+import database
+import shards
+import snapshot
+import streaks
+import timestamps
+
+#failed tasks aren't part of a session
+SESSION_STATUSES = (TaskStatus.PENDING, TaskStatus.IN_PROGRESS, TaskStatus.COMPLETED)
+
+#rough bytes for a TaskManager and Player before any tasks, for SessionCache's budget
+SESSION_OVERHEAD = 16 * 1024
+
+
+def login(username, email=""):
+    """Load the session of the user called username, creating the user if it's new."""
+    if config.shard_dir:
+        shards.open_user(User(username, email))
+        task_manager = _login(username, email)
+        shards.track(task_manager)
+        return task_manager
+    return _login(username, email)
+
+
+def _login(username, email):
+    row = database.get_session_row(username=username)
+    if row is not None:
+        return _load(User(row['username'], row['email']), row)
+
+    #a new user has no tasks, templates or snapshot to read
+    user_obj = User(username, email)
+    user_id = database.insert_user(user_obj)
+    print(f"Created New User ID: {user_id}")
+    p_obj = Player(user_obj)
+    p_obj.id = database.insert_player(user_id)
+    task_manager = TaskManager(p_obj, user_id, p_obj.id)
+    #nothing has bumped a new user's counter yet
+    task_manager.change_counter, task_manager.own_changes = 0, 0
+    return task_manager
+
+
+def load_session(user_obj, user_id):
+    """Build the TaskManager (and its Player) for an existing user.
+
+    user_obj may be None, the User is then made from the session row.
+    """
+    row = database.get_session_row(user_id=user_id)
+    if row is None:
+        raise ValueError(f"No user with id {user_id}")
+    return _load(user_obj or User(row['username'], row['email']), row)
+
+
+def load_player(user_obj, user_id):
+    """Just the Player, e.g. for the command line tools. None if there is no such user."""
+    row = database.get_session_row(user_id=user_id)
+    return _player_from_row(user_obj, row) if row else None
+
+
+def _load(user_obj, row):
+    user_id = row['user_id']
+    counter = row['change_counter']
+    cached = snapshot.load(user_id, counter)
+
+    p_obj = _player_from_row(user_obj, row)
+    if cached:
+        stats, tasks = cached
+        for name, value in stats.items():
+            setattr(p_obj, name, value)
+        print("Loaded player from snapshot.")
+    else:
+        tasks = database.get_tasks_by_user(user_id, SESSION_STATUSES)
+
+    #zero the streak if a day was missed since the last login
+    streaks.refresh_player(p_obj)
+
+    #p_obj.id: used as a save file
+    task_manager = TaskManager(p_obj, user_id, p_obj.id)
+    task_manager.change_counter, task_manager.own_changes = counter, row['own_changes']
+    task_manager.templates = database.get_templates_by_user(user_id)
+    for t in tasks:
+        #We removed OVERDUE and FAILED from before, so we only check for active or completed
+        if t.status in [TaskStatus.PENDING, TaskStatus.IN_PROGRESS]:
+            task_manager.active_tasks.append(t)
+        elif t.status == TaskStatus.COMPLETED:
+            task_manager.completed_tasks.append(t)
+    task_manager.graph.load(json.loads(row['edges']), [t.id for t in task_manager.active_tasks])
+
+    if not cached:
+        save_session(task_manager, counter)
+    return task_manager
+
+
+def current_counter(task_manager):
+    """The user's change_counter if the session still matches the database, otherwise None.
+
+    Since the session was loaded the counter may only have moved by this
+    process's own writes (database.get_change_counters); anything more means
+    someone else wrote to the user and the session is stale.
+    """
+    if task_manager.change_counter is None:
+        return None
+    row = database.get_change_counters(task_manager.user_id)
+    if row is None:
+        return None
+    counter, own_changes = row
+    if counter - task_manager.change_counter != own_changes - task_manager.own_changes:
+        return None
+    task_manager.change_counter, task_manager.own_changes = counter, own_changes
+    return counter
+
+
+def save_session(task_manager, counter=None):
+    """Write a snapshot of the session as it is now, e.g. when the app closes.
+
+    counter is the user's change_counter if the caller already knows the
+    session matches it. Otherwise nothing is written if the session is stale
+    (see current_counter): a snapshot under the latest counter would make
+    an outdated session look current to the next login.
+    """
+    if counter is None:
+        counter = current_counter(task_manager)
+    if counter is None:
+        return None
+    tasks = task_manager.active_tasks + task_manager.completed_tasks
+    return snapshot.save(task_manager.user_id, counter, task_manager.player, tasks)
+
+
+def _player_from_row(user_obj, row):
+    #maps the session row onto a Player by column name, see database.get_session_row
+    p_obj = Player(user_obj)
+    if row['player_id'] is None:  #a user without stats yet gets a default player
+        p_obj.id = database.insert_player(row['user_id'])
+        print("Created new player stats.")
+        return p_obj
+
+    p_obj.id = row['player_id']
+    for name in database.PLAYER_STATS_COLUMNS:
+        setattr(p_obj, name, row[name])
+    for a in json.loads(row['achievements']):
+        p_obj.achievements.append(Achievement(a['name'], a['description'],
+                                              timestamps.decode(a['date_earned']).date(), a['xp_reward'],
+                                              a['achievement_id']))
+    return p_obj
+
+
+def session_bytes(task_manager):
+    """Rough memory held by a session: the TaskManager's overhead plus its task objects."""
+    total = SESSION_OVERHEAD
+    for task in task_manager.active_tasks + task_manager.completed_tasks + task_manager.templates:
+        fields = vars(task)
+        total += sys.getsizeof(task) + sys.getsizeof(fields) + sum(sys.getsizeof(v) for v in fields.values())
+    return total
+
+
+class _Cached(NamedTuple):
+    task_manager: Any
+    counter: int        # the user's change_counter the session matched when it was put away
+    size: int
+
+
+class SessionCache:
+    """Loaded sessions of recently used profiles, least recently used evicted first.
+
+    put() keeps the session being switched away from, with the user's
+    change_counter it matches (current_counter), and drops it if something
+    else wrote to the user while it was loaded. login() hands it back if the
+    counter hasn't moved since, i.e. nothing (the command line, the task
+    service, a second window) wrote to that user in between; otherwise the
+    session is dropped and loaded again. Sessions are evicted once their estimated size
+    (session_bytes) goes over budget_mb, writing their snapshot first so the
+    next login of that user is still fast.
+    """
+
+    def __init__(self, budget_mb=None):
+        budget_mb = config.session_cache_mb if budget_mb is None else budget_mb
+        self.budget = int(budget_mb * 1024 * 1024)
+        self.size = 0
+        self._entries = OrderedDict()   # username -> _Cached, most recently put last
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, username):
+        return username in self._entries
+
+    def usernames(self):
+        """The cached profiles, most recently used first."""
+        return list(reversed(self._entries))
+
+    def put(self, task_manager):
+        username = task_manager.player.user.username
+        self._pop(username)
+        counter = current_counter(task_manager)
+        if counter is None:
+            #already stale, the next login loads it again anyway
+            return
+        entry = _Cached(task_manager, counter, session_bytes(task_manager))
+        if config.shard_dir:
+            #the next login switches the database to another shard, so save while this one is open
+            save_session(task_manager, entry.counter)
+        self._entries[username] = entry
+        self.size += entry.size
+        while self.size > self.budget and self._entries:
+            self._flush(self._pop(next(iter(self._entries))))
+
+    def login(self, username, email=""):
+        """Like login(), but reuses the cached session when it is still current."""
+        entry = self._pop(username)
+        if entry is None:
+            return login(username, email)
+        task_manager = entry.task_manager
+        if config.shard_dir:
+            shards.open_user(task_manager.player.user)
+        row = database.get_change_counters(task_manager.user_id)
+        if row is None or row[0] != entry.counter:
+            #written to since it was put away, the cached copy is stale
+            return login(username, email)
+        #with shards this is a new connection, whose own writes are counted from here
+        task_manager.change_counter, task_manager.own_changes = row
+        #the day may have changed while the session waited here
+        streaks.refresh_player(task_manager.player)
+        return task_manager
+
+    def clear(self):
+        """Forget every cached session, saving their snapshots (e.g. when the app closes)."""
+        while self._entries:
+            self._flush(self._pop(next(iter(self._entries))))
+
+    def _pop(self, username):
+        entry = self._entries.pop(username, None)
+        if entry is not None:
+            self.size -= entry.size
+        return entry
+
+    def _flush(self, entry):
+        #with shards the snapshot was written by put, and the evicted user's database isn't open
+        if not config.shard_dir:
+            save_session(entry.task_manager, entry.counter)
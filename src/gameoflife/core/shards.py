@@ -0,0 +1,181 @@
+"""Sharded storage: one database file per user.
+
+With a single gamelife.db every profile shares one write lock, so a big
+import or bulk edit for one user holds up everyone else's commits. Setting
+config.shard_dir gives each user their own file instead,
+<shard_dir>/user-<id>.db, with the usual schema (database.init_db). A small
+<shard_dir>/catalog.db holds what is shared between users: the user list,
+which hands out the user ids, and a leaderboard summary.
+
+A process works with one user's shard at a time: open_user points config.db_path
+and the global database connection at it, and the rest of the code
+(sessions, snapshots, backups) carries on unchanged. session.login does that
+in sharded mode, and track() keeps the user's leaderboard row up to date from
+their TaskManager's XPChanged events. The summary is written after the
+shard's commit through the catalog's own connection, so no transaction holds
+both files. rebuild_leaderboard() recomputes it from the shards themselves by
+ATTACHing them one at a time, e.g. after batch jobs changed players' XP.
+
+The task service and the nightly batch still work on a single database file.
+
+    python shards.py --dir path/to/shards --leaderboard
+    python shards.py --dir path/to/shards --rebuild
+"""
+import argparse
+import datetime
+import sqlite3
+from pathlib import Path
+
+from config import config
+from events import XPChanged
+import database
+
+CATALOG = "catalog.db"
+
+#the catalog connection, opened on first use
+_catalog = None
+
+
+def shard_path(user_id, shard_dir=None):
+    return Path(shard_dir or config.shard_dir) / f"user-{user_id}.db"
+
+
+def catalog():
+    """The connection to <shard_dir>/catalog.db, creating its tables the first time."""
+    global _catalog
+    if _catalog is None:
+        folder = Path(config.shard_dir)
+        folder.mkdir(parents=True, exist_ok=True)
+        #used from the Tk thread and from AsyncTaskManager's DB thread, one call at a time
+        _catalog = sqlite3.connect(folder / CATALOG, timeout=30, check_same_thread=False)
+        _catalog.execute("PRAGMA journal_mode = WAL")
+        _catalog.execute("""CREATE TABLE IF NOT EXISTS users (
+                            id INTEGER PRIMARY KEY AUTOINCREMENT,
+                            username TEXT UNIQUE NOT NULL,
+                            email TEXT NOT NULL,
+                            created_at TEXT NOT NULL
+                            )""")
+        #one row per player, written whenever their XP changes (see track)
+        _catalog.execute("""CREATE TABLE IF NOT EXISTS leaderboard (
+                            user_id INTEGER PRIMARY KEY REFERENCES users(id),
+                            xp INTEGER NOT NULL,
+                            level INTEGER NOT NULL,
+                            tasks_completed INTEGER NOT NULL,
+                            rank TEXT,
+                            updated_at TEXT NOT NULL
+                            )""")
+        _catalog.execute("CREATE INDEX IF NOT EXISTS idx_leaderboard_xp ON leaderboard (xp DESC)")
+        _catalog.commit()
+    return _catalog
+
+
+def close_catalog():
+    global _catalog
+    if _catalog is not None:
+        _catalog.close()
+        _catalog = None
+
+
+def open_user(user):
+    """Point the database module at user's shard, registering them in the catalog if they're new.
+
+    user is a game.User. Returns their user_id.
+    """
+    cat = catalog()
+    row = cat.execute("SELECT id FROM users WHERE username = ?", (user.username,)).fetchone()
+    if row is None:
+        with cat:
+            user_id = cat.execute("INSERT INTO users (username, email, created_at) VALUES (?, ?, ?)",
+                                  (user.username, user.email, user.created_at.isoformat())).lastrowid
+    else:
+        user_id = row[0]
+
+    database.close_db()
+    config.db_path = shard_path(user_id)
+    database.init_db()
+    #the shard keeps its own users row, for the foreign keys and the change_counter triggers
+    if database.get_user_by_id(user_id) is None:
+        database.insert_user(user, user_id=user_id)
+    return user_id
+
+
+def update_leaderboard(user_id, player):
+    cat = catalog()
+    with cat:
+        cat.execute("""INSERT INTO leaderboard (user_id, xp, level, tasks_completed, rank, updated_at)
+                       VALUES (:user_id, :xp, :level, :tasks_completed, :rank, :now)
+                       ON CONFLICT (user_id) DO UPDATE SET
+                           xp = excluded.xp, level = excluded.level,
+                           tasks_completed = excluded.tasks_completed,
+                           rank = excluded.rank, updated_at = excluded.updated_at""",
+                    {'user_id': user_id, 'xp': player.xp, 'level': player.level,
+                     'tasks_completed': player.tasks_completed, 'rank': player.previous_rank,
+                     'now': datetime.datetime.now().isoformat()})
+
+
+def track(task_manager):
+    """Keep task_manager's player on the leaderboard. Returns the unsubscribe function."""
+    update_leaderboard(task_manager.user_id, task_manager.player)
+    return task_manager.events.subscribe(
+        XPChanged, lambda event: update_leaderboard(task_manager.user_id, task_manager.player))
+
+
+def get_leaderboard(limit=10):
+    """The top players by XP, from the catalog's summary. Same rows as database.get_leaderboard."""
+    cur = catalog().cursor()
+    cur.row_factory = sqlite3.Row
+    cur.execute("""SELECT u.id AS user_id, u.username, l.xp, l.level, l.tasks_completed, l.rank
+                   FROM leaderboard l JOIN users u ON u.id = l.user_id
+                   ORDER BY l.xp DESC LIMIT ?""", (limit,))
+    return [dict(row) for row in cur]
+
+
+def rebuild_leaderboard():
+    """Recompute every leaderboard row from the players tables in the shards. Returns how many were read."""
+    cat = catalog()
+    now = datetime.datetime.now().isoformat()
+    user_ids = [row[0] for row in cat.execute("SELECT id FROM users")]
+    rebuilt = 0
+    for user_id in user_ids:
+        path = shard_path(user_id)
+        if not path.exists():
+            continue
+        #ATTACH can't run inside a transaction, and only a handful of databases can be attached at once
+        cat.execute("ATTACH DATABASE ? AS shard", (str(path),))
+        try:
+            with cat:
+                rebuilt += cat.execute("""INSERT INTO leaderboard (user_id, xp, level, tasks_completed, rank, updated_at)
+                                          SELECT user_id, xp, level, tasks_completed, previous_rank, ?
+                                          FROM shard.players WHERE user_id = ?
+                                          ON CONFLICT (user_id) DO UPDATE SET
+                                              xp = excluded.xp, level = excluded.level,
+                                              tasks_completed = excluded.tasks_completed,
+                                              rank = excluded.rank, updated_at = excluded.updated_at""",
+                                       (now, user_id)).rowcount
+        finally:
+            cat.execute("DETACH DATABASE shard")
+    return rebuilt
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sharded storage: show or rebuild the leaderboard.")
+    parser.add_argument("--dir", help="shard folder (defaults to config.shard_dir)")
+    parser.add_argument("--rebuild", action="store_true", help="recompute the leaderboard from the shards")
+    parser.add_argument("--leaderboard", type=int, nargs="?", const=10, metavar="N",
+                        help="print the top N players (default 10)")
+    args = parser.parse_args()
+    if args.dir:
+        config.shard_dir = args.dir
+    if not config.shard_dir:
+        parser.error("no shard folder, pass --dir")
+
+    if args.rebuild:
+        print(f"Rebuilt {rebuild_leaderboard()} leaderboard rows")
+    if args.leaderboard or not args.rebuild:
+        for n, row in enumerate(get_leaderboard(args.leaderboard or 10), start=1):
+            print(f"{n}\t{row['username']}\t{row['xp']} XP\tlevel {row['level']}\t{row['rank'] or ''}")
+    close_catalog()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+"""Headless simulation of the XP economy, for tuning rewards and the rank ladder.
+
+A population is a mix of PlayerProfiles (how many tasks a player creates,
+which priorities, how often they finish them and how early). Every simulated
+player gets a year (or --days) of task events drawn from their profile, and
+the events are replayed to find where the player ends up: level, rank and the
+day each rank was first reached.
+
+Two ways to replay the events:
+  fast   the TaskManager rules applied directly to numbers, using the same
+         ConfigSnapshot as XPCalculator. Pure Python, ~1.5µs per task.
+  exact  real TaskManager and XPCalculator objects on an in-memory database,
+         for checking the fast path (--check) or small populations.
+
+Sweeps run every (config, chunk of players) pair on a process pool.
+
+    python simulate.py --players 100000 --days 365
+    python simulate.py --config cheap.toml --config generous.toml --players 20000
+    python simulate.py --check 200
+"""
+import argparse
+import bisect
+import datetime
+import math
+import os
+import random
+import statistics
+import time
+from multiprocessing import Pool
+from typing import NamedTuple
+
+from config import config, compile_config, apply_config, load_config, PriorityTable, Task
+from game import User, Player, TaskManager
+import database
+import achievements
+
+#XP given by achievements that TaskManager hands out on completion (see game.py)
+FIRST_TASK_XP = achievements.CATALOGUE[achievements.FIRST_TASK].xp_reward
+RANK_UP_XP = achievements.RANK_UP_XP
+
+#players per pool job
+CHUNK_SIZE = 2000
+
+
+class PlayerProfile(NamedTuple):
+    """How one kind of player behaves."""
+    name: str
+    tasks_per_day: float = 3.0
+    #share of tasks created at each priority
+    priority_mix: PriorityTable = PriorityTable(low=0.3, medium=0.4, high=0.2, critical=0.1)
+    #chance a task is completed at all, the rest are failed at their due date
+    completion_rate: float = 0.8
+    #tasks are due this many days after they are created
+    due_in_days: float = 3.0
+    #completed tasks are done on average this many hours before they are due
+    mean_hours_early: float = 24.0
+
+
+#a rough mix of casual, regular and very engaged players
+DEFAULT_POPULATION = (
+    (PlayerProfile("casual", tasks_per_day=0.8, completion_rate=0.6, mean_hours_early=6.0), 0.5),
+    (PlayerProfile("regular"), 0.35),
+    (PlayerProfile("power", tasks_per_day=8.0, completion_rate=0.92, due_in_days=7.0,
+                   mean_hours_early=72.0), 0.15),
+)
+
+
+def generate_events(profile, days, rng):
+    """One player's tasks as (seconds since start, priority index, completed, seconds early), in time order.
+
+    The priority index is into PriorityTable._fields. Failed tasks happen at
+    their due date with seconds early 0.
+    """
+    expected = profile.tasks_per_day * days
+    count = max(0, round(rng.gauss(expected, expected ** 0.5)))
+    if not count:
+        return []
+    due_seconds = profile.due_in_days * 86400
+    span = days * 86400
+    priorities = rng.choices(range(len(PriorityTable._fields)), weights=profile.priority_mix, k=count)
+    mean_early = profile.mean_hours_early * 3600
+    completion_rate = profile.completion_rate
+    random_ = rng.random
+    events = []
+    for priority in priorities:
+        start = random_() * span
+        if random_() < completion_rate:
+            #exponential time early, capped since a task can't be finished before it was created
+            early = min(-mean_early * math.log(1.0 - random_()), due_seconds)
+            events.append((start + due_seconds - early, priority, True, early))
+        else:
+            events.append((start + due_seconds, priority, False, 0.0))
+    events.sort()
+    return events
+
+
+def _completion_table(snapshot):
+    #xp for a completed task by [priority index][number of bonus tiers reached],
+    #the same numbers XPCalculator.calculate_completion_xp gives
+    pcts = [pct for _, pct in reversed(snapshot.bonus_tiers)]
+    return tuple(tuple(base + (int(base * pcts[k - 1] / 100) if k else 0) for k in range(len(pcts) + 1))
+                 for base in snapshot.rewards)
+
+
+def replay_fast(events, snapshot):
+    """Apply TaskManager's XP rules to a player's events.
+
+    Returns (xp, level, rank index, tuple of the day each rank was first reached or None).
+    """
+    completion_xp = _completion_table(snapshot)
+    penalties, bonus_seconds = snapshot.penalties, snapshot.bonus_seconds
+    floor, rank_xp = snapshot.xp_floor, snapshot.rank_xp
+    bisect_right = bisect.bisect_right
+    xp = 0
+    #levels never go down, so the level is set by the highest xp ever held
+    peak = 0
+    completed = 0
+    previous_rank = None
+    rank_ups = 0
+    reached = [None] * len(rank_xp)
+    reached[0] = 0
+    next_rank = 1
+    for when, priority, done, early in events:
+        if done:
+            xp = max(floor, xp + completion_xp[priority][bisect_right(bonus_seconds, early)])
+            completed += 1
+            if completed == 1:
+                xp += FIRST_TASK_XP
+            #rank is checked after each completion, like TaskManager.complete_task
+            rank = bisect_right(rank_xp, xp) - 1
+            if rank != previous_rank:
+                #each rank's achievement is only awarded the first time
+                if previous_rank is not None and not rank_ups >> rank & 1:
+                    xp += RANK_UP_XP
+                    rank_ups |= 1 << rank
+                previous_rank = rank
+            if xp > peak:
+                peak = xp
+                while next_rank < len(rank_xp) and xp >= rank_xp[next_rank]:
+                    reached[next_rank] = int(when // 86400)
+                    next_rank += 1
+        else:
+            xp = max(floor, xp - penalties[priority])
+    return xp, peak // snapshot.xp_per_level + 1, bisect_right(rank_xp, xp) - 1, tuple(reached)
+
+
+def replay_exact(events, snapshot, start=datetime.datetime(2025, 1, 1)):
+    """Replay a player's events through a real TaskManager on the in-memory database."""
+    user = User(f"sim{random.getrandbits(48)}", "sim@example.com")
+    user_id = database.insert_user(user)
+    player = Player(user)
+    player.id = database.insert_player(user_id)
+    task_manager = TaskManager(player, user_id, player.id)
+    reached = [None] * len(snapshot.rank_xp)
+    reached[0] = 0
+    next_rank = 1
+    for when, priority, done, early in events:
+        at = start + datetime.timedelta(seconds=when)
+        task = task_manager.add_task(Task("sim", PriorityTable._fields[priority],
+                                          due_date=at + datetime.timedelta(seconds=early)))
+        if done:
+            task_manager.complete_task(task, completed_at=at)
+        else:
+            task_manager.fail_task(task)
+        while next_rank < len(snapshot.rank_xp) and player.xp >= snapshot.rank_xp[next_rank]:
+            reached[next_rank] = int(when // 86400)
+            next_rank += 1
+    return (player.xp, player.level, bisect.bisect_right(snapshot.rank_xp, player.xp) - 1,
+            tuple(reached))
+
+
+def _profiles_for(population, first_player, count, seed):
+    #which profile each player gets depends only on the seed and the player number
+    profiles = [p for p, _ in population]
+    weights = [w for _, w in population]
+    for number in range(first_player, first_player + count):
+        rng = random.Random(f"{seed}:{number}")
+        yield rng.choices(profiles, weights=weights)[0], rng
+
+
+def simulate_chunk(job):
+    """Pool entry point: simulate players [first, first + count) under one config."""
+    cfg, population, first, count, days, seed, exact = job
+    snapshot = compile_config(cfg)
+    if exact:
+        apply_config(cfg)
+        database.init_db(":memory:")
+    results = []
+    for profile, rng in _profiles_for(population, first, count, seed):
+        events = generate_events(profile, days, rng)
+        replay = replay_exact if exact else replay_fast
+        results.append((profile.name,) + replay(events, snapshot) + (len(events),))
+    if exact:
+        database.close_db()
+    return results
+
+
+def summarize(results, snapshot, days):
+    """Level and rank distributions and time-to-rank for a list of simulate_chunk results."""
+    players = len(results)
+    levels = [r[2] for r in results]
+    rank_counts = [0] * len(snapshot.rank_names)
+    for r in results:
+        rank_counts[r[3]] += 1
+    time_to_rank = []
+    for i, name in enumerate(snapshot.rank_names):
+        reached = sorted(r[4][i] for r in results if r[4][i] is not None)
+        time_to_rank.append({
+            'rank': name,
+            'reached_pct': 100 * len(reached) / players if players else 0.0,
+            'median_days': statistics.median(reached) if reached else None,
+            'p90_days': reached[int(0.9 * (len(reached) - 1))] if reached else None,
+        })
+    profiles = {}
+    for r in results:
+        profiles.setdefault(r[0], []).append(r[1])
+    return {
+        'players': players,
+        'days': days,
+        'tasks': sum(r[5] for r in results),
+        'level': {'mean': statistics.fmean(levels) if levels else 0,
+                  'median': statistics.median(levels) if levels else 0,
+                  'max': max(levels, default=0)},
+        'level_histogram': _histogram(levels),
+        'final_rank': {name: 100 * n / players if players else 0.0
+                       for name, n in zip(snapshot.rank_names, rank_counts)},
+        'time_to_rank': time_to_rank,
+        'mean_xp_by_profile': {name: statistics.fmean(xps) for name, xps in profiles.items()},
+    }
+
+
+def _histogram(levels, buckets=10):
+    if not levels:
+        return {}
+    top = max(levels)
+    width = max(1, -(-top // buckets))
+    hist = {}
+    for level in levels:
+        lo = (level - 1) // width * width + 1
+        key = f"{lo}-{lo + width - 1}"
+        hist[key] = hist.get(key, 0) + 1
+    return dict(sorted(hist.items(), key=lambda kv: int(kv[0].split('-')[0])))
+
+
+def sweep(variants, players, days=365, population=DEFAULT_POPULATION, workers=None, seed=0,
+          exact=False, chunk_size=CHUNK_SIZE):
+    """Simulate the same population under each (name, Config) variant.
+
+    Every variant sees the same players with the same events, so differences in
+    the reports come from the config alone. Returns {name: summary}.
+    """
+    jobs = []
+    for name, cfg in variants:
+        for first in range(0, players, chunk_size):
+            jobs.append((name, (cfg, population, first, min(chunk_size, players - first),
+                                days, seed, exact)))
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        outputs = [simulate_chunk(job) for _, job in jobs]
+    else:
+        with Pool(workers) as pool:
+            outputs = pool.map(simulate_chunk, [job for _, job in jobs])
+    merged = {}
+    for (name, _), output in zip(jobs, outputs):
+        merged.setdefault(name, []).extend(output)
+    return {name: summarize(merged[name], compile_config(cfg), days) for name, cfg in variants}
+
+
+def check_exact(players=100, days=90, seed=0):
+    """Run the same players through both replays, returns the ones that came out differently."""
+    fast = simulate_chunk((config, DEFAULT_POPULATION, 0, players, days, seed, False))
+    exact = simulate_chunk((config, DEFAULT_POPULATION, 0, players, days, seed, True))
+    return [(i, f, e) for i, (f, e) in enumerate(zip(fast, exact)) if f != e]
+
+
+def print_report(name, report):
+    print(f"== {name}: {report['players']:,} players, {report['days']} days, {report['tasks']:,} tasks")
+    level = report['level']
+    print(f"   level mean {level['mean']:.1f}, median {level['median']}, max {level['max']}")
+    print("   levels: " + "  ".join(f"{k}: {v}" for k, v in report['level_histogram'].items()))
+    print("   profiles (mean xp): " + "  ".join(f"{k}: {v:,.0f}"
+                                               for k, v in report['mean_xp_by_profile'].items()))
+    print(f"   {'rank':<16}{'final %':>9}{'reached %':>11}{'median day':>12}{'p90 day':>9}")
+    for row in report['time_to_rank']:
+        median = "-" if row['median_days'] is None else f"{row['median_days']:.0f}"
+        p90 = "-" if row['p90_days'] is None else str(row['p90_days'])
+        print(f"   {row['rank']:<16}{report['final_rank'][row['rank']]:>9.1f}"
+              f"{row['reached_pct']:>11.1f}{median:>12}{p90:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate the XP economy over a synthetic population.")
+    parser.add_argument("--players", type=int, default=100000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--config", action="append", default=[], metavar="FILE",
+                        help="config file (.toml/.json) to simulate, repeat to sweep several")
+    parser.add_argument("--exact", action="store_true",
+                        help="replay through TaskManager on an in-memory database (slow)")
+    parser.add_argument("--check", type=int, metavar="N",
+                        help="compare the fast and exact replays on N players and exit")
+    args = parser.parse_args()
+
+    if args.check:
+        mismatches = check_exact(args.check, min(args.days, 90), args.seed)
+        print(f"{len(mismatches)} of {args.check} players differ between fast and exact replay")
+        for i, fast, exact in mismatches[:10]:
+            print(f"  player {i}: fast {fast[1:5]} exact {exact[1:5]}")
+        return
+
+    variants = [(path, load_config(path)) for path in args.config] or [("current config", config)]
+    started = time.perf_counter()
+    reports = sweep(variants, args.players, args.days, workers=args.workers, seed=args.seed,
+                    exact=args.exact)
+    elapsed = time.perf_counter() - started
+    for name, report in reports.items():
+        print_report(name, report)
+    print(f"simulated {len(variants)} x {args.players:,} players in {elapsed:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""Binary snapshot of a player's session for fast logins.
+
+A snapshot holds the player's stats and their active and completed tasks in
+a packed layout that is read back through mmap, so a login whose snapshot is
+still valid needs no task query and no datetime.fromisoformat per row.
+
+Validity is checked against users.change_counter, which database triggers
+bump on every task or player write. If the stored counter doesn't match the
+one in the DB, the snapshot is ignored and rebuilt after the normal load.
+
+File layout (little endian):
+    header    magic, version, user_id, change_counter
+    player    id, 9 int stats, previous_rank (offset/length into strings)
+    counts    number of task records, size of the string table
+    records   one fixed-size struct per task
+    strings   UTF-8 titles, descriptions and the rank name
+"""
+import datetime
+import math
+import mmap
+import os
+import struct
+from pathlib import Path
+
+from config import config, Task, TaskPriority, TaskStatus
+
+MAGIC = b"GOLS"
+VERSION = 3
+
+_HEADER = struct.Struct("<4sHxxqq")
+# id, xp, level, tasks_completed, tasks_failed, current_streak, longest_streak,
+# tasks_completed_early, critical_tasks_completed, last_active_day, rank offset, rank length
+_PLAYER = struct.Struct("<qqqqqqqqqqII")
+_COUNTS = struct.Struct("<II")
+# id, template id, priority code, status code, due/created/completed timestamps,
+# title and description spans, estimated duration in minutes
+_TASK = struct.Struct("<qqBBxxxxxxdddIIIIi")
+
+_PRIORITIES = (TaskPriority.LOW, TaskPriority.MEDIUM, TaskPriority.HIGH, TaskPriority.CRITICAL)
+_STATUSES = (TaskStatus.PENDING, TaskStatus.IN_PROGRESS, TaskStatus.COMPLETED,
+             TaskStatus.OVERDUE, TaskStatus.FAILED)
+_PRIORITY_CODES = {p: i for i, p in enumerate(_PRIORITIES)}
+_STATUS_CODES = {s: i for i, s in enumerate(_STATUSES)}
+
+#stand-ins for None in integer and timestamp fields
+_NO_DAY = -1
+_NO_ID = -1
+_NO_TIME = math.nan
+_NO_DURATION = -1
+
+_PLAYER_FIELDS = ("xp", "level", "tasks_completed", "tasks_failed", "current_streak",
+                  "longest_streak", "tasks_completed_early", "critical_tasks_completed")
+
+
+def snapshot_path(user_id):
+    """Where a user's snapshot lives, next to the database file. None for in-memory DBs."""
+    db_path = str(config.db_path)
+    if db_path == ":memory:":
+        return None
+    db_path = Path(db_path)
+    return db_path.parent / "snapshots" / f"{db_path.stem}-user{user_id}.snap"
+
+
+def _timestamp(value):
+    return value.timestamp() if value else _NO_TIME
+
+
+def _datetime(value):
+    # NaN is the only float that isn't equal to itself
+    return None if value != value else datetime.datetime.fromtimestamp(value)
+
+
+def save(user_id, change_counter, player, tasks):
+    """Write the snapshot for user_id atomically (temp file + rename)."""
+    path = snapshot_path(user_id)
+    if path is None:
+        return None
+
+    strings = bytearray()
+
+    def add_string(text):
+        data = (text or "").encode("utf-8")
+        offset = len(strings)
+        strings.extend(data)
+        return offset, len(data)
+
+    rank_offset, rank_len = add_string(player.previous_rank)
+    records = bytearray()
+    for task in tasks:
+        title = add_string(task.title)
+        description = add_string(task.description)
+        template_id = task.template_id if task.template_id is not None else _NO_ID
+        records += _TASK.pack(task.id, template_id,
+                              _PRIORITY_CODES[task.priority], _STATUS_CODES[task.status],
+                              _timestamp(task.due_date), _timestamp(task.created_at),
+                              _timestamp(task.completed_at), *title, *description,
+                              _NO_DURATION if task.estimated_duration is None else task.estimated_duration)
+
+    last_active_day = player.last_active_day if player.last_active_day is not None else _NO_DAY
+    body = b"".join((
+        _HEADER.pack(MAGIC, VERSION, user_id, change_counter),
+        _PLAYER.pack(player.id, *(getattr(player, f) for f in _PLAYER_FIELDS),
+                     last_active_day, rank_offset, rank_len),
+        _COUNTS.pack(len(tasks), len(strings)),
+        records,
+        strings,
+    ))
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(body)
+    os.replace(tmp_path, path)
+    return path
+
+
+def load(user_id, change_counter):
+    """Return (player_stats, tasks) if a snapshot matching change_counter exists, else None.
+
+    player_stats is a dict of Player attribute names to values.
+    """
+    path = snapshot_path(user_id)
+    if path is None or change_counter is None:
+        return None
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return None
+
+    with f:
+        if os.fstat(f.fileno()).st_size == 0:
+            #mmap refuses empty files
+            return None
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            return _decode(buf, user_id, change_counter)
+
+
+def _decode(buf, user_id, change_counter):
+    if len(buf) < _HEADER.size + _PLAYER.size + _COUNTS.size:
+        return None
+    magic, version, snap_user, snap_counter = _HEADER.unpack_from(buf, 0)
+    if magic != MAGIC or version != VERSION or snap_user != user_id or snap_counter != change_counter:
+        return None
+
+    offset = _HEADER.size
+    player_values = _PLAYER.unpack_from(buf, offset)
+    offset += _PLAYER.size
+    task_count, strings_len = _COUNTS.unpack_from(buf, offset)
+    offset += _COUNTS.size
+    records_end = offset + task_count * _TASK.size
+    if len(buf) != records_end + strings_len:
+        return None
+    strings = buf[records_end:records_end + strings_len]
+
+    stats = dict(zip(_PLAYER_FIELDS, player_values[1:9]))
+    stats["id"] = player_values[0]
+    stats["last_active_day"] = None if player_values[9] == _NO_DAY else player_values[9]
+    rank_offset, rank_len = player_values[10:12]
+    stats["previous_rank"] = strings[rank_offset:rank_offset + rank_len].decode("utf-8") or None
+
+    tasks = []
+    for (task_id, template_id, priority, status, due, created, completed,
+         title_off, title_len, desc_off, desc_len, duration) in _TASK.iter_unpack(buf[offset:records_end]):
+        task = Task(strings[title_off:title_off + title_len].decode("utf-8"),
+                    _PRIORITIES[priority], _STATUSES[status], _datetime(due),
+                    strings[desc_off:desc_off + desc_len].decode("utf-8"))
+        task.id = task_id
+        task.created_at = _datetime(created)
+        task.completed_at = _datetime(completed)
+        task.template_id = None if template_id == _NO_ID else template_id
+        task.estimated_duration = None if duration == _NO_DURATION else duration
+        tasks.append(task)
+
+    return stats, tasks
+
+
+def discard(user_id):
+    """Delete a user's snapshot, e.g. after restoring a backup."""
+    path = snapshot_path(user_id)
+    if path is not None:
+        path.unlink(missing_ok=True)
+
+
+def discard_all(db_path=None):
+    """Delete every user's snapshot of a database.
+
+    Needed after restoring a backup: the change counters go back to older values,
+    which a snapshot written since could match again.
+    """
+    db_path = Path(str(db_path or config.db_path))
+    for path in (db_path.parent / "snapshots").glob(f"{db_path.stem}-user*.snap"):
+        path.unlink(missing_ok=True)
@@ -0,0 +1,123 @@
+"""Daily streaks computed from task completion days.
+
+Each player keeps two numbers: last_active_day (a date ordinal, see
+datetime.date.toordinal) and current_streak. A completion only needs to
+compare today with last_active_day, so updating is O(1) and never looks at
+the task history. backfill() rebuilds both numbers for every player from
+tasks.completed_at in one SQL statement, and rollover() resets everyone whose
+streak broke overnight.
+"""
+import datetime
+
+from config import TaskStatus
+import database
+import timestamps
+
+#julianday() of 0001-01-01 is 1721425.5, subtracting this turns a julian day into a date ordinal
+_JULIAN_OFFSET = 1721424.5
+
+
+def record_completion(player, day=None):
+    """Count a completion on `day` towards the player's streak."""
+    today = (day or datetime.date.today()).toordinal()
+    last = player.last_active_day
+
+    if last == today:
+        #already counted today
+        return player.current_streak
+    if last is not None and last == today - 1:
+        player.current_streak += 1
+    else:
+        player.current_streak = 1
+
+    player.last_active_day = today
+    if player.current_streak > player.longest_streak:
+        player.longest_streak = player.current_streak
+    return player.current_streak
+
+
+def is_broken(last_active_day, today=None):
+    """True if a streak last extended on last_active_day can no longer continue."""
+    today = (today or datetime.date.today()).toordinal()
+    return last_active_day is None or last_active_day < today - 1
+
+
+def refresh_player(player, today=None):
+    """Zero the in-memory streak if the player missed a day, e.g. after loading from the DB."""
+    if player.current_streak and is_broken(player.last_active_day, today):
+        player.current_streak = 0
+    return player.current_streak
+
+
+def backfill(conn=None, today=None):
+    """Recompute current/longest streak and last_active_day for all players in one pass.
+
+    Completion days are deduplicated per user, then consecutive days are grouped
+    with the usual day - row_number() trick. Returns the number of players updated.
+    """
+    conn = conn or database.conn
+    yesterday = (today or datetime.date.today()).toordinal() - 1
+    completed_day = timestamps.day_sql("completed_at", timestamps.detect_mode(conn))
+    with conn:
+        conn.execute(f"""
+            WITH days AS (
+                SELECT DISTINCT user_id,
+                       CAST(julianday({completed_day}) - {_JULIAN_OFFSET} AS INTEGER) AS day
+                FROM tasks
+                WHERE status = :completed AND completed_at IS NOT NULL
+            ),
+            runs AS (
+                SELECT user_id, day,
+                       day - ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY day) AS grp
+                FROM days
+            ),
+            islands AS (
+                SELECT user_id, COUNT(*) AS length, MAX(day) AS last_day
+                FROM runs GROUP BY user_id, grp
+            ),
+            ranked AS (
+                SELECT user_id, length, last_day,
+                       FIRST_VALUE(length) OVER (PARTITION BY user_id ORDER BY last_day DESC) AS latest
+                FROM islands
+            ),
+            summary AS (
+                SELECT user_id, MAX(length) AS longest, MAX(last_day) AS last_day, MAX(latest) AS latest
+                FROM ranked GROUP BY user_id
+            )
+            UPDATE players SET
+                current_streak = CASE WHEN summary.last_day >= :yesterday THEN summary.latest ELSE 0 END,
+                longest_streak = summary.longest,
+                last_active_day = summary.last_day
+            FROM summary
+            WHERE players.user_id = summary.user_id""",
+            {'completed': TaskStatus.COMPLETED, 'yesterday': yesterday})
+        #rowcount is -1 for statements starting with WITH, and changes() leaves out trigger writes
+        return conn.execute("SELECT changes()").fetchone()[0]
+
+
+def rollover(cur=None, today=None, user_range=None):
+    """Reset every streak that was not extended yesterday or today.
+
+    Meant to run just after midnight. The batch runner passes its cursor and
+    user_range=(lo, hi) for a shard, and commits itself; without a cursor
+    the reset is its own transaction. Returns the number of players reset.
+    """
+    if cur is None:
+        with database.transaction():
+            return rollover(database.c, today, user_range)
+    yesterday = (today or datetime.date.today()).toordinal() - 1
+    query = """UPDATE players SET current_streak = 0
+               WHERE current_streak > 0
+               AND (last_active_day IS NULL OR last_active_day < :yesterday)"""
+    params = {'yesterday': yesterday}
+    if user_range:
+        query += " AND user_id BETWEEN :lo AND :hi"
+        params['lo'], params['hi'] = user_range
+    return cur.execute(query, params).rowcount
+
+
+def ms_until_midnight(now=None):
+    """Milliseconds until the next local midnight, for scheduling rollover with Tk's after()."""
+    now = now or datetime.datetime.now()
+    midnight = datetime.datetime.combine(now.date() + datetime.timedelta(days=1), datetime.time())
+    return int((midnight - now).total_seconds() * 1000)
@@ -0,0 +1,102 @@
+"""Task dependencies ("finish A before B") for TaskManager.
+
+The edges are stored in the task_edges table; database.add_task_edge refuses
+an edge that would close a cycle, so they always form a DAG. TaskGraph keeps
+them in memory along with how many unfinished prerequisites each open task
+is still waiting on. Completing (or failing) a task only visits its direct
+dependents and counts each of them down, so the set of ready tasks stays up
+to date without a topological sort, however long the chains get.
+
+A task is ready when nothing it depends on is still open. Blocked tasks can
+still be completed; the graph only decides what get_active_tasks(unblocked=True)
+shows.
+"""
+from collections import defaultdict
+
+
+class TaskGraph:
+
+    def __init__(self):
+        self._dependents = defaultdict(set)     # task id -> ids of the tasks that wait for it
+        self._prerequisites = defaultdict(set)  # task id -> ids of the tasks it waits for
+        self._open = set()                      # ids of active tasks
+        self._waiting = {}                      # open task id -> unfinished prerequisites, only if > 0
+
+    def load(self, edges, open_ids):
+        """Set the graph from (before_id, after_id) pairs and the ids of the active tasks."""
+        self.__init__()
+        self._open.update(open_ids)
+        for before_id, after_id in edges:
+            self.add_edge(before_id, after_id)
+
+    def add_task(self, task_id):
+        self._open.add(task_id)
+
+    def add_edge(self, before_id, after_id):
+        if after_id in self._dependents[before_id]:
+            return
+        self._dependents[before_id].add(after_id)
+        self._prerequisites[after_id].add(before_id)
+        if before_id in self._open and after_id in self._open:
+            self._waiting[after_id] = self._waiting.get(after_id, 0) + 1
+
+    def remove_edge(self, before_id, after_id):
+        if after_id not in self._dependents.get(before_id, ()):
+            return
+        self._dependents[before_id].discard(after_id)
+        self._prerequisites[after_id].discard(before_id)
+        if before_id in self._open and after_id in self._open:
+            self._count_down(after_id)
+
+    def finish(self, task_id):
+        """The task was completed or failed. Returns the ids of the tasks that became ready."""
+        if task_id not in self._open:
+            return []
+        self._open.discard(task_id)
+        self._waiting.pop(task_id, None)
+        ready = []
+        for dependent in self._dependents.get(task_id, ()):
+            if dependent in self._open and self._count_down(dependent):
+                ready.append(dependent)
+        return ready
+
+    def reopen(self, task_id):
+        """The opposite of finish, for undo."""
+        if task_id in self._open:
+            return
+        self._open.add(task_id)
+        waiting = sum(1 for before_id in self._prerequisites.get(task_id, ()) if before_id in self._open)
+        if waiting:
+            self._waiting[task_id] = waiting
+        for dependent in self._dependents.get(task_id, ()):
+            if dependent in self._open:
+                self._waiting[dependent] = self._waiting.get(dependent, 0) + 1
+
+    def edges_of(self, task_id):
+        """The (before_id, after_id) edges the task is part of."""
+        return ([(before_id, task_id) for before_id in self._prerequisites.get(task_id, ())]
+                + [(task_id, after_id) for after_id in self._dependents.get(task_id, ())])
+
+    def remove_task(self, task_id):
+        """Forget a deleted task and its edges (the database drops them with ON DELETE CASCADE)."""
+        self.finish(task_id)
+        for dependent in self._dependents.pop(task_id, ()):
+            self._prerequisites[dependent].discard(task_id)
+        for before_id in self._prerequisites.pop(task_id, ()):
+            self._dependents[before_id].discard(task_id)
+
+    def is_ready(self, task_id):
+        return task_id not in self._waiting
+
+    def waiting_on(self, task_id):
+        """Ids of the open tasks this one is still waiting for."""
+        return [before_id for before_id in self._prerequisites.get(task_id, ()) if before_id in self._open]
+
+    def _count_down(self, task_id):
+        # True if that was the task's last open prerequisite
+        left = self._waiting[task_id] - 1
+        if left:
+            self._waiting[task_id] = left
+            return False
+        del self._waiting[task_id]
+        return True
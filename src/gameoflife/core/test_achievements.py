@@ -0,0 +1,139 @@
+"""Achievements: the earned bitsets, the per-id counts, rank-up ids that survive config changes and the backfill.
+
+Run it directly or with pytest; every test gets its own throwaway database.
+"""
+import os
+import tempfile
+
+from config import config, RankConfig, Task, TaskPriority
+import achievements
+import database
+import session
+
+_tmp = None
+_ranks = config.ranks
+
+
+def setup_function(function):
+    global _tmp
+    _tmp = tempfile.TemporaryDirectory()
+    config.db_path = os.path.join(_tmp.name, "achievements.db")
+    database.init_db(config.db_path)
+
+
+def teardown_function(function):
+    database.close_db()
+    config.db_path = None
+    config.ranks = _ranks
+    _tmp.cleanup()
+
+
+def complete(task_manager, title, priority=TaskPriority.LOW):
+    task = task_manager.add_task(Task(title, priority))
+    return task_manager.complete_task(task)['new_achievements']
+
+
+def test_bitsets():
+    earned = achievements.mask([achievements.FIRST_TASK, achievements.RANK_UP + 2])
+    assert earned == 0b10000000001
+    assert achievements.ids(earned) == [achievements.FIRST_TASK, achievements.RANK_UP + 2]
+    assert achievements.has(earned, achievements.FIRST_TASK)
+    assert not achievements.has(earned, achievements.EARLY_BIRD)
+    assert achievements.ids(0) == [] and achievements.mask([]) == 0
+
+
+def test_first_task_once():
+    task_manager = session.login("starter")
+    first = complete(task_manager, "one")
+    assert [a.id for a in first] == [achievements.FIRST_TASK]
+    assert complete(task_manager, "two") == []
+    assert task_manager.player.has_achievement(achievements.FIRST_TASK)
+    session.login("idle")
+    assert database.count_players_with([achievements.FIRST_TASK]) == 1
+    assert database.count_players_with([]) == 2
+    assert database.get_achievement_counts() == {achievements.FIRST_TASK: 1}
+
+    other = session.login("second")
+    complete(other, "one")
+    assert database.count_players_with([achievements.FIRST_TASK]) == 2
+    assert database.get_achievement_counts() == {achievements.FIRST_TASK: 2}
+    #undoing the completion takes the achievement back, and the count with it
+    other.undo()
+    assert not other.player.has_achievement(achievements.FIRST_TASK)
+    assert database.get_achievement_counts() == {achievements.FIRST_TASK: 1}
+    assert database.count_players_with([achievements.FIRST_TASK]) == 1
+
+
+def test_rank_ids_survive_config_changes():
+    dabbler = achievements.rank_up_id("Dabbler")
+    assert dabbler == achievements.RANK_UP + 1
+    task_manager = session.login("climber")
+    complete(task_manager, "first")
+    task_manager.player.xp = 190
+    rank_ups = [a for a in complete(task_manager, "over the line", TaskPriority.MEDIUM)
+                if a.id != achievements.FIRST_TASK]
+    assert [a.id for a in rank_ups] == [dabbler]
+    assert achievements.get(dabbler).name == "Rank Up: Dabbler"
+
+    #a new lowest rank, Dabbler renamed and the rest reordered: the ids already given stay put
+    config.ranks = [RankConfig("Sleeper", 0), RankConfig("Procrastinator", 100), RankConfig("Tinkerer", 200),
+                    RankConfig("Legend", 600), RankConfig("Doer", 5000)]
+    database.close_db()
+    database.init_db(config.db_path)
+    assert achievements.rank_up_id("Procrastinator") == achievements.RANK_UP
+    assert achievements.rank_up_id("Legend") == achievements.RANK_UP + 6
+    assert achievements.rank_up_id("Doer") == achievements.RANK_UP + 2
+    #new names get the next free ids, in the order they are first met
+    assert achievements.rank_up_id("Tinkerer") == achievements.RANK_UP + 7
+    assert achievements.rank_up_id("Sleeper") == achievements.RANK_UP + 8
+    assert achievements.rank_up_id("Tinkerer") == achievements.RANK_UP + 7
+    assert achievements.rank_up_id("not a rank") is None
+    #Dabbler's id isn't handed to anyone else, and its achievement still has its name
+    assert achievements.get(dabbler).name == "Rank Up: Dabbler"
+    assert database.get_achievement_counts()[dabbler] == 1
+
+
+def test_backfill_old_database():
+    task_manager = session.login("veteran")
+    complete(task_manager, "first")
+    player_id = task_manager.player_id
+    #what a database from before the catalogue looks like: achievements with only a name,
+    #once twice over, and no bitsets, counts or rank table
+    with database.transaction():
+        database.c.execute("""INSERT INTO achievements (player_id, name, description, date_earned, xp_reward)
+                              VALUES (?, 'First Task Completed', '', '2026-01-01 00:00:00', 25),
+                                     (?, 'Rank Up: Doer', '', '2026-01-02 00:00:00', 50),
+                                     (?, 'Something retired', '', '2026-01-03 00:00:00', 10)""",
+                           (player_id, player_id, player_id))
+        database.c.execute("UPDATE achievements SET achievement_id = NULL")
+        database.c.execute("UPDATE players SET achievements_earned = 0")
+        database.c.execute("DELETE FROM achievement_counts")
+        database.c.execute("DROP TABLE rank_achievements")
+    database.close_db()
+
+    database.init_db(config.db_path)
+    rows = database.conn.execute("""SELECT name, achievement_id FROM achievements
+                                    WHERE player_id = ? ORDER BY id""", (player_id,)).fetchall()
+    doer = achievements.RANK_UP + 2
+    assert rows == [("First Task Completed", achievements.FIRST_TASK), ("First Task Completed", None),
+                    ("Rank Up: Doer", doer), ("Something retired", None)]
+    assert database.get_achievement_counts() == {achievements.FIRST_TASK: 1, doer: 1}
+    assert database.count_players_with([achievements.FIRST_TASK, doer]) == 1
+    reloaded = session.login("veteran")
+    assert reloaded.player.has_achievement(doer)
+
+
+def run_all():
+    for test in (test_bitsets, test_first_task_once, test_rank_ids_survive_config_changes,
+                 test_backfill_old_database):
+        setup_function(test)
+        try:
+            test()
+        finally:
+            teardown_function(test)
+        print(f"{test.__name__} passed")
+
+
+if __name__ == "__main__":
+    run_all()
+    print("\nAchievement tests passed!")
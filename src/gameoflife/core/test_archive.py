@@ -0,0 +1,103 @@
+"""Archiving old completed tasks: the rollups keeping the counts, history reaching into the archive.
+
+Run it directly or with pytest; every test gets its own throwaway database.
+"""
+import datetime
+import os
+import tempfile
+
+from config import config, Task, TaskPriority, TaskStatus
+import archive
+import database
+import session
+import timestamps
+
+NOW = datetime.datetime.now().replace(microsecond=0)
+
+_tmp = None
+
+
+def setup_function(function):
+    global _tmp
+    _tmp = tempfile.TemporaryDirectory()
+    config.db_path = os.path.join(_tmp.name, "archive.db")
+
+
+def teardown_function(function):
+    database.close_db()
+    config.db_path = None
+    config.timestamp_mode = timestamps.ISO
+    _tmp.cleanup()
+
+
+def completed(user_id, title, priority, days_ago, due=True):
+    task = Task(title, priority, TaskStatus.COMPLETED)
+    task.completed_at = NOW - datetime.timedelta(days=days_ago)
+    if due:
+        task.due_date = task.completed_at + datetime.timedelta(days=1)
+    return database.insert_task(task, user_id)
+
+
+def all_counts(user_id):
+    return {group_by: database.count_tasks_by(user_id, group_by) for group_by in ("priority", "status", "due_day")}
+
+
+def check_archive():
+    database.init_db(config.db_path)
+    task_manager = session.login("archivist")
+    user_id = task_manager.user_id
+    for i in range(4):
+        completed(user_id, f"old high {i}", TaskPriority.HIGH, 200 + i % 2)
+    completed(user_id, "old, no due date", TaskPriority.LOW, 300, due=False)
+    recent = completed(user_id, "recent", TaskPriority.HIGH, 5)
+    task_manager.add_task(Task("still to do", TaskPriority.LOW))
+    other = session.login("other").user_id
+    completed(other, "someone else's old task", TaskPriority.LOW, 400)
+    before = all_counts(user_id)
+
+    assert archive.archive_completed(days=90, now=NOW) == 6
+    #the archived tasks are gone from tasks, but the counts still include them
+    assert [t.id for t in database.get_tasks_by_user(user_id, TaskStatus.COMPLETED)] == [recent]
+    assert all_counts(user_id) == before
+    assert database.count_tasks_by(other, "priority") == {"low": 1}
+
+    #nothing left to move: the rollups aren't added twice
+    assert archive.archive_completed(days=90, now=NOW) == 0
+    assert all_counts(user_id) == before
+    #a second batch of old tasks adds onto the same rollup rows
+    completed(user_id, "another old high", TaskPriority.HIGH, 200)
+    assert archive.archive_completed(days=90, now=NOW) == 1
+    assert database.count_tasks_by(user_id, "priority") == {"high": 6, "low": 2}
+
+    #history only reads the archive for dates that old
+    titles = [t.title for t in database.get_task_history(user_id, start=NOW - datetime.timedelta(days=30))]
+    assert titles == ["recent"]
+    assert len(database.get_task_history(user_id)) == 7
+    old = database.get_task_history(user_id, start=NOW - datetime.timedelta(days=250),
+                                    end=NOW - datetime.timedelta(days=100))
+    assert len(old) == 5 and all(t.title.startswith(("old high", "another")) for t in old)
+    assert archive.compact() >= 0
+
+
+def test_archive():
+    check_archive()
+
+
+def test_archive_epoch():
+    config.timestamp_mode = timestamps.EPOCH
+    check_archive()
+
+
+def run_all():
+    for test in (test_archive, test_archive_epoch):
+        setup_function(test)
+        try:
+            test()
+        finally:
+            teardown_function(test)
+        print(f"{test.__name__} passed")
+
+
+if __name__ == "__main__":
+    run_all()
+    print("\nArchive tests passed!")
@@ -0,0 +1,81 @@
+"""batch.py: splitting players into shards and running the nightly jobs over them in worker processes.
+
+Run it directly or with pytest; every test gets its own throwaway database.
+"""
+import datetime
+import os
+import tempfile
+
+from config import config, Task, TaskPriority, TaskStatus
+import batch
+import database
+import session
+
+NOW = datetime.datetime(2026, 6, 10, 3, 0)
+
+_tmp = None
+
+
+def setup_function(function):
+    global _tmp
+    _tmp = tempfile.TemporaryDirectory()
+    config.db_path = os.path.join(_tmp.name, "batch.db")
+    database.init_db(config.db_path)
+
+
+def teardown_function(function):
+    database.close_db()
+    config.db_path = None
+    _tmp.cleanup()
+
+
+def test_make_shards():
+    shards = batch.make_shards(3, 12, 4)
+    assert shards == [(3, 5), (6, 8), (9, 11), (12, 12)]
+    #every id in exactly one shard, whatever the count
+    for count in (1, 3, 7, 50):
+        ids = [i for lo, hi in batch.make_shards(1, 20, count) for i in range(lo, hi + 1)]
+        assert ids == list(range(1, 21)), count
+    assert batch.make_shards(None, None, 4) == []
+
+
+def test_run_batch():
+    players = []
+    for i in range(5):
+        task_manager = session.login(f"player {i}")
+        task_manager.player.xp = 500
+        task_manager._save_player()
+        for hours in (-48, -1, 24):
+            task_manager.add_task(Task(f"due in {hours}h", TaskPriority.HIGH,
+                                       due_date=NOW + datetime.timedelta(hours=hours)))
+        players.append(task_manager)
+    database.close_db()
+
+    report = batch.run_batch(config.db_path, workers=2, shards=3, batch_size=2,
+                             jobs=("sweep_overdue", "recompute_levels"), now=NOW)
+    assert report['players'] == 5
+    assert report['rows']['sweep_overdue'] == 10
+    assert sum(stats['shards'] for stats in report['workers'].values()) == 3
+
+    database.init_db(config.db_path)
+    for task_manager in players:
+        player = session.load_player(None, task_manager.user_id)
+        #two overdue high priority tasks at 75 XP each, then level and rank follow the new XP
+        assert (player.xp, player.tasks_failed, player.level, player.previous_rank) == (350, 2, 2, "Dabbler")
+        statuses = database.count_tasks_by(task_manager.user_id, "status")
+        assert statuses == {TaskStatus.FAILED: 2, TaskStatus.PENDING: 1}
+
+
+def run_all():
+    for test in (test_make_shards, test_run_batch):
+        setup_function(test)
+        try:
+            test()
+        finally:
+            teardown_function(test)
+        print(f"{test.__name__} passed")
+
+
+if __name__ == "__main__":
+    run_all()
+    print("\nBatch tests passed!")
@@ -0,0 +1,68 @@
+"""Import-time regression test for the headless CLI (python -m gameoflife).
+
+Runs real commands against a throwaway database in fresh interpreters and
+checks that they start within STARTUP_BUDGET and never import the GUI
+libraries. Run it directly or with pytest.
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+#best of a few runs, so one slow run on a busy machine doesn't fail it
+STARTUP_BUDGET = 0.100
+RUNS = 5
+GUI_MODULES = ("tkinter", "matplotlib", "tkcalendar")
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def run_cli(*args, db_path, python_flags=()):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [SRC_DIR, os.environ.get("PYTHONPATH")])))
+    #time startup the way users get it, with the modules' bytecode cached after the first run
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    return subprocess.run([sys.executable, *python_flags, "-m", "gameoflife", "--db", db_path,
+                           "--user", "cli_test", *args], env=env, capture_output=True, text=True, check=True)
+
+
+def best_time(*args, db_path):
+    times = []
+    for _ in range(RUNS):
+        started = time.perf_counter()
+        run_cli(*args, db_path=db_path)
+        times.append(time.perf_counter() - started)
+    return min(times)
+
+
+def imported_modules(*args, db_path):
+    #-X importtime lists every module the command imported on stderr
+    result = run_cli(*args, db_path=db_path, python_flags=("-X", "importtime"))
+    return {line.split("|")[-1].strip() for line in result.stderr.splitlines() if line.startswith("import time:")}
+
+
+def test_cli_startup():
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "cli.db")
+        run_cli("add", "warm up", "--priority", "high", db_path=db_path)
+        #the interpreter alone is part of the budget, report it so a failure is easy to read
+        python_only = min(_time_python() for _ in range(RUNS))
+        for command in (("list",), ("stats",), ("add", "another")):
+            elapsed = best_time(*command, db_path=db_path)
+            print(f"{' '.join(command):<12} {elapsed * 1000:6.1f} ms (bare python {python_only * 1000:.1f} ms)")
+            assert elapsed < STARTUP_BUDGET, f"'{' '.join(command)}' took {elapsed * 1000:.1f} ms"
+
+            modules = imported_modules(*command, db_path=db_path)
+            gui = [name for name in modules if name.split(".")[0] in GUI_MODULES]
+            assert not gui, f"'{' '.join(command)}' imported {gui}"
+
+
+def _time_python():
+    started = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "pass"], check=True)
+    return time.perf_counter() - started
+
+
+if __name__ == "__main__":
+    test_cli_startup()
+    print("\nCLI startup test passed!")
@@ -0,0 +1,74 @@
+"""The live config snapshot: edits reaching it, and reloads swapping it in whole.
+
+Run it directly or with pytest. No database is needed.
+"""
+import threading
+
+from config import Config, RankConfig, XPConfig, TaskPriority, apply_config, current_config, config
+
+
+def make_config(xp_per_level, archive_after_days, rank_name):
+    return Config(xp_per_level=xp_per_level, archive_after_days=archive_after_days,
+                  ranks=[RankConfig(rank_name, 0)], xp_config=XPConfig())
+
+
+def teardown_function(function):
+    apply_config(Config())
+
+
+def test_edits_reach_the_snapshot():
+    apply_config(Config())
+    config.xp_per_level = 300
+    assert current_config().xp_per_level == 300
+    config.xp_config.base_rewards[TaskPriority.LOW] = 11
+    config.xp_config.changed()
+    assert current_config().rewards.low == 11
+
+
+class _ReadMidway(Config):
+    """A config that has another thread read the live snapshot whenever apply_config looks at it."""
+
+    def __init__(self, *args, **kwargs):
+        self.seen = []
+        super().__init__(*args, **kwargs)
+
+    @property
+    def xp_config(self):
+        reader = threading.Thread(target=lambda: self.seen.append(current_config()))
+        reader.start()
+        #the reader may have to wait for apply_config to finish, don't wait for it here
+        reader.join(0.1)
+        self._readers.append(reader)
+        return self._xp_config
+
+    @xp_config.setter
+    def xp_config(self, value):
+        self._readers = []
+        self._xp_config = value
+
+
+def test_reload_is_never_seen_half_done():
+    apply_config(make_config(100, 10, "First"))
+    second = _ReadMidway(xp_per_level=300, archive_after_days=30, ranks=[RankConfig("Second", 0)],
+                         xp_config=XPConfig())
+    apply_config(second)
+    for reader in second._readers:
+        reader.join()
+    #every read, even one made while the fields were being copied, is one whole config
+    allowed = {(100, 10, ("First",)), (300, 30, ("Second",))}
+    seen = {(s.xp_per_level, s.archive_after_days, s.rank_names) for s in second.seen}
+    assert second.seen and seen <= allowed, seen
+
+
+def run_all():
+    for test in (test_edits_reach_the_snapshot, test_reload_is_never_seen_half_done):
+        try:
+            test()
+        finally:
+            teardown_function(test)
+        print(f"{test.__name__} passed")
+
+
+if __name__ == "__main__":
+    run_all()
+    print("\nConfig tests passed!")
@@ -0,0 +1,91 @@
+"""database.count_tasks_by: the GROUP BY counts behind the priority chart, and their cache.
+
+Run it directly or with pytest; every test gets its own throwaway database.
+"""
+import datetime
+import os
+import tempfile
+
+from config import config, Task, TaskPriority, TaskStatus
+import database
+import session
+
+DAY = datetime.datetime(2026, 7, 1, 9, 0)
+
+_tmp = None
+
+
+def setup_function(function):
+    global _tmp
+    _tmp = tempfile.TemporaryDirectory()
+    config.db_path = os.path.join(_tmp.name, "counts.db")
+    database.init_db(config.db_path)
+
+
+def teardown_function(function):
+    database.close_db()
+    config.db_path = None
+    _tmp.cleanup()
+
+
+def make_tasks():
+    task_manager = session.login("counter")
+    for priority, count in ((TaskPriority.LOW, 3), (TaskPriority.HIGH, 2), (TaskPriority.CRITICAL, 1)):
+        for i in range(count):
+            task_manager.add_task(Task(f"{priority} {i}", priority, due_date=DAY + datetime.timedelta(days=i)))
+    task_manager.add_task(Task("no due date", TaskPriority.MEDIUM))
+    return task_manager
+
+
+def test_group_by():
+    task_manager = make_tasks()
+    user_id = task_manager.user_id
+    assert database.count_tasks_by(user_id, "priority") == {"low": 3, "high": 2, "critical": 1, "medium": 1}
+    assert database.count_tasks_by(user_id, "status") == {TaskStatus.PENDING: 7}
+    #tasks without a due date have no day to be counted under
+    assert database.count_tasks_by(user_id, "due_day") == {"2026-07-01": 3, "2026-07-02": 2, "2026-07-03": 1}
+    try:
+        database.count_tasks_by(user_id, "title")
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("only priority, status and due_day can be grouped by")
+
+
+def test_status_filter_and_cache():
+    task_manager = make_tasks()
+    user_id = task_manager.user_id
+    active = database.count_tasks_by(user_id, "priority", status=database.ACTIVE_STATUSES)
+    assert active == {"low": 3, "high": 2, "critical": 1, "medium": 1}
+
+    #a write drops the user's cached counts straight away, not after COUNT_CACHE_TTL
+    task_manager.complete_task(task_manager.active_tasks[0])
+    task_manager.fail_task(task_manager.active_tasks[-1])
+    assert database.count_tasks_by(user_id, "priority", status=database.ACTIVE_STATUSES) == \
+        {"low": 2, "high": 2, "critical": 1}
+    assert database.count_tasks_by(user_id, "status") == \
+        {TaskStatus.PENDING: 5, TaskStatus.COMPLETED: 1, TaskStatus.FAILED: 1}
+    assert database.count_tasks_by(user_id, "status", status=TaskStatus.COMPLETED) == {TaskStatus.COMPLETED: 1}
+    #and the TaskManager wrapper gives the same
+    assert task_manager.count_tasks_by("priority", status=TaskStatus.FAILED) == {"medium": 1}
+
+    #another user's tasks are counted apart
+    other = session.login("someone else")
+    other.add_task(Task("theirs", TaskPriority.LOW))
+    assert database.count_tasks_by(other.user_id, "priority") == {"low": 1}
+    assert database.count_tasks_by(user_id, "priority")["low"] == 3
+
+
+def run_all():
+    for test in (test_group_by, test_status_filter_and_cache):
+        setup_function(test)
+        try:
+            test()
+        finally:
+            teardown_function(test)
+        print(f"{test.__name__} passed")
+
+
+if __name__ == "__main__":
+    run_all()
+    print("\nCount tests passed!")
@@ -0,0 +1,117 @@
+"""Calendar import: entries mapped to tasks, and the same UID never imported twice.
+
+Run it directly or with pytest; every test gets its own throwaway database.
+"""
+import datetime
+import os
+import tempfile
+
+from config import config, TaskPriority
+import archive
+import database
+import ics
+import session
+
+NOW = datetime.datetime(2026, 9, 1, 9, 0)
+
+_tmp = None
+
+
+def setup_function(function):
+    global _tmp
+    _tmp = tempfile.TemporaryDirectory()
+    config.db_path = os.path.join(_tmp.name, "ics.db")
+    database.init_db(config.db_path)
+
+
+def teardown_function(function):
+    database.close_db()
+    config.db_path = None
+    _tmp.cleanup()
+
+
+def calendar(*entries):
+    lines = ["BEGIN:VCALENDAR", "VERSION:2.0", "PRODID:-//test//EN"]
+    for entry in entries:
+        lines.extend(entry)
+    lines.append("END:VCALENDAR")
+    return [line + "\r\n" for line in lines]
+
+
+def event(uid, summary, start, *extra):
+    return ["BEGIN:VEVENT"] + ([f"UID:{uid}"] if uid else []) + \
+        [f"SUMMARY:{summary}", f"DTSTART:{start}", *extra, "END:VEVENT"]
+
+
+ENTRIES = (
+    event("standup@test", "Standup", "20260902T093000", "DTEND:20260902T094500", "PRIORITY:1"),
+    event("review@test", "Code review", "20260903T140000", "DURATION:PT1H30M",
+          "DESCRIPTION:the parser\\, th", " en the tests"),
+    #the same UID again further down the file, e.g. an edited copy of the event
+    event("standup@test", "Standup (moved)", "20260902T100000"),
+    #no UID, its date and summary stand in for one
+    event(None, "Dentist", "20260910"),
+    event("old@test", "Already over", "20260801T090000"),
+    ["BEGIN:VTODO", "UID:done@test", "SUMMARY:Done already", "DUE:20260905T120000", "STATUS:COMPLETED",
+     "END:VTODO"],
+)
+
+
+def imported(user_id):
+    return {t.title: t for t in database.get_tasks_by_user(user_id)}
+
+
+def test_import_and_reimport():
+    user_id = session.login("calendar").user_id
+    result = ics.import_ics(calendar(*ENTRIES), user_id, now=NOW, chunk_size=2)
+    assert result == ics.ImportResult(read=6, imported=3, duplicates=1, skipped=2)
+    tasks = imported(user_id)
+    assert sorted(tasks) == ["Code review", "Dentist", "Standup"]
+    assert tasks["Standup"].priority == TaskPriority.CRITICAL and tasks["Standup"].estimated_duration == 15
+    assert tasks["Code review"].estimated_duration == 90
+    assert tasks["Code review"].description == "the parser, then the tests"
+    assert tasks["Dentist"].due_date == datetime.datetime(2026, 9, 10)
+
+    #importing the file again adds nothing, in one chunk or several
+    for chunk_size in (1, ics.IMPORT_CHUNK):
+        again = ics.import_ics(calendar(*ENTRIES), user_id, now=NOW, chunk_size=chunk_size)
+        assert again == ics.ImportResult(read=6, imported=0, duplicates=4, skipped=2)
+    #an updated export only brings its new entries, the old ones are left as they were
+    updated = ics.import_ics(calendar(event("standup@test", "Standup, renamed", "20260902T093000"),
+                                      event("retro@test", "Retro", "20260904T160000")), user_id, now=NOW)
+    assert (updated.imported, updated.duplicates) == (1, 1)
+    assert sorted(imported(user_id)) == ["Code review", "Dentist", "Retro", "Standup"]
+
+    #the UIDs are per user, someone else importing the same file gets all of it
+    other = session.login("colleague").user_id
+    assert ics.import_ics(calendar(*ENTRIES), other, now=NOW).imported == 3
+    #and include_past brings in the one that is over
+    assert ics.import_ics(calendar(*ENTRIES), other, include_past=True, now=NOW).imported == 1
+
+
+def test_archived_tasks_not_imported_again():
+    task_manager = session.login("archived")
+    ics.import_ics(calendar(*ENTRIES), task_manager.user_id, now=NOW)
+    task_manager = session.load_session(task_manager.player.user, task_manager.user_id)
+    for task in list(task_manager.active_tasks):
+        task_manager.complete_task(task)
+    #once the completed tasks have moved to tasks_archive, only the archive still has their UIDs
+    assert archive.archive_completed(days=90, now=datetime.datetime.now() + datetime.timedelta(days=365)) == 3
+    assert database.get_tasks_by_user(task_manager.user_id) == []
+    again = ics.import_ics(calendar(*ENTRIES), task_manager.user_id, now=NOW)
+    assert (again.imported, again.duplicates) == (0, 4)
+
+
+def run_all():
+    for test in (test_import_and_reimport, test_archived_tasks_not_imported_again):
+        setup_function(test)
+        try:
+            test()
+        finally:
+            teardown_function(test)
+        print(f"{test.__name__} passed")
+
+
+if __name__ == "__main__":
+    run_all()
+    print("\nCalendar import tests passed!")
@@ -0,0 +1,116 @@
+"""Undo/redo: the database, the in-memory lists and the dependency graph all going back and forth.
+
+Run it directly or with pytest; every test gets its own throwaway database.
+"""
+import datetime
+import os
+import tempfile
+
+from config import config, Task, TaskPriority, TaskStatus
+import achievements
+import database
+import session
+
+_tmp = None
+
+
+def setup_function(function):
+    global _tmp
+    _tmp = tempfile.TemporaryDirectory()
+    config.db_path = os.path.join(_tmp.name, "journal.db")
+    database.init_db(config.db_path)
+
+
+def teardown_function(function):
+    database.close_db()
+    config.db_path = None
+    _tmp.cleanup()
+
+
+def stored_player(task_manager):
+    """What a fresh login sees."""
+    return session.load_player(task_manager.player.user, task_manager.user_id)
+
+
+def stored_edges(user_id):
+    return set(database.c.execute("SELECT before_id, after_id FROM task_edges WHERE user_id = ?", (user_id,)))
+
+
+def test_undo_redo_complete():
+    task_manager = session.login("undoer")
+    task = task_manager.add_task(Task("essay", TaskPriority.HIGH,
+                                      due_date=datetime.datetime.now() + datetime.timedelta(days=10)))
+    result = task_manager.complete_task(task)
+    earned = task_manager.player.xp
+    assert earned == result['xp_earned'] + sum(a.xp_reward for a in result['new_achievements'])
+    assert achievements.has(task_manager.player.achievements_earned, achievements.FIRST_TASK)
+
+    undone = task_manager.undo()
+    assert undone['action'] == "complete" and undone['xp_delta'] == earned
+    assert task in task_manager.active_tasks and task.status == TaskStatus.PENDING
+    player = stored_player(task_manager)
+    assert (player.xp, player.tasks_completed, player.achievements) == (0, 0, [])
+    #the first completion of the day was undone, so nothing was active that day any more
+    assert player.last_active_day is None
+    assert not achievements.has(player.achievements_earned, achievements.FIRST_TASK)
+
+    redone = task_manager.redo()
+    assert redone['xp_delta'] == earned and task in task_manager.completed_tasks
+    player = stored_player(task_manager)
+    assert (player.xp, player.tasks_completed, len(player.achievements)) == (earned, 1, 1)
+    assert task_manager.redo() is None
+
+
+def test_new_operation_clears_redo():
+    task_manager = session.login("brancher")
+    first = task_manager.add_task(Task("first"))
+    task_manager.undo()
+    assert task_manager.journal.can_redo()
+    task_manager.add_task(Task("second"))
+    assert not task_manager.journal.can_redo()
+    assert [t.title for t in database.get_tasks_by_user(task_manager.user_id)] == ["second"]
+    assert first.id is None
+
+
+def test_redo_add_brings_back_dependencies():
+    task_manager = session.login("planner")
+    research = task_manager.add_task(Task("research"))
+    outline = task_manager.add_task(Task("outline"))
+    draft = task_manager.add_task(Task("draft"))
+    task_manager.add_dependency(research, outline)
+    task_manager.add_dependency(outline, draft)
+    assert task_manager.is_blocked(draft)
+
+    #undoing the add deletes the row, and ON DELETE CASCADE its edges with it
+    task_manager.undo()
+    task_manager.undo()
+    assert stored_edges(task_manager.user_id) == set()
+    assert [t.title for t in task_manager.get_active_tasks(unblocked=True)] == ["research"]
+
+    task_manager.redo()
+    task_manager.redo()
+    #re-added rows get new ids, the edges follow them
+    assert stored_edges(task_manager.user_id) == {(research.id, outline.id), (outline.id, draft.id)}
+    assert task_manager.is_blocked(outline) and task_manager.is_blocked(draft)
+    task_manager.complete_task(research)
+    assert not task_manager.is_blocked(outline) and task_manager.is_blocked(draft)
+
+    #a fresh login builds the same graph from the database
+    reloaded = session.load_session(task_manager.player.user, task_manager.user_id)
+    ready = [t.title for t in reloaded.get_active_tasks(unblocked=True)]
+    assert ready == ["outline"]
+
+
+def run_all():
+    for test in (test_undo_redo_complete, test_new_operation_clears_redo, test_redo_add_brings_back_dependencies):
+        setup_function(test)
+        try:
+            test()
+        finally:
+            teardown_function(test)
+        print(f"{test.__name__} passed")
+
+
+if __name__ == "__main__":
+    run_all()
+    print("\nUndo/redo tests passed!")
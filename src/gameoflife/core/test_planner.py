@@ -0,0 +1,102 @@
+"""The planner: every planned task done before it is due, within the budget, blocked tasks left out.
+
+Run it directly or with pytest; every test gets its own throwaway database.
+"""
+import datetime
+import os
+import random
+import tempfile
+
+from config import config, Task, TaskPriority
+import database
+import session
+
+NOW = datetime.datetime(2026, 9, 1, 9, 0)
+PRIORITIES = (TaskPriority.LOW, TaskPriority.MEDIUM, TaskPriority.HIGH, TaskPriority.CRITICAL)
+
+_tmp = None
+
+
+def setup_function(function):
+    global _tmp
+    _tmp = tempfile.TemporaryDirectory()
+    config.db_path = os.path.join(_tmp.name, "planner.db")
+    database.init_db(config.db_path)
+
+
+def teardown_function(function):
+    database.close_db()
+    config.db_path = None
+    _tmp.cleanup()
+
+
+def add(task_manager, title, priority, minutes, due_in=None):
+    task = Task(title, priority, due_date=None if due_in is None else NOW + datetime.timedelta(minutes=due_in))
+    task.estimated_duration = minutes
+    return task_manager.add_task(task)
+
+
+def check_feasible(plan, budget):
+    assert plan.minutes <= budget
+    assert plan.minutes == sum(t.estimated_duration for t in plan.tasks)
+    for task, finish in zip(plan.tasks, plan.finish_times):
+        assert task.due_date is None or finish <= task.due_date, (task.title, finish, task.due_date)
+
+
+def test_deadlines_are_met():
+    task_manager = session.login("busy")
+    rng = random.Random(7)
+    for i in range(60):
+        due_in = rng.choice((None, rng.randrange(5, 600)))
+        add(task_manager, f"task {i}", rng.choice(PRIORITIES), rng.choice((5, 10, 15, 30, 45, 60, 90)), due_in)
+    for budget in (15, 60, 120, 240, 480):
+        greedy = task_manager.plan(budget, now=NOW)
+        exact = task_manager.plan(budget, exact=True, now=NOW)
+        check_feasible(greedy, budget)
+        check_feasible(exact, budget)
+        #the exact planner finds the best set, the heuristic can only match it
+        assert exact.xp >= greedy.xp and exact.exact and not greedy.exact
+
+
+def test_impossible_and_blocked_tasks():
+    task_manager = session.login("careful")
+    too_late = add(task_manager, "due before it can be done", TaskPriority.CRITICAL, 30, due_in=20)
+    first = add(task_manager, "first", TaskPriority.LOW, 10)
+    second = add(task_manager, "second", TaskPriority.CRITICAL, 10)
+    task_manager.add_dependency(first, second)
+    for exact in (False, True):
+        plan = task_manager.plan(60, exact=exact, now=NOW)
+        assert plan.tasks == [first], exact
+
+    #finishing the prerequisite makes the next one plannable straight away
+    task_manager.complete_task(first)
+    assert task_manager.plan(60, now=NOW).tasks == [second]
+    assert too_late not in task_manager.plan(600, exact=True, now=NOW).tasks
+
+
+def test_urgent_task_first():
+    task_manager = session.login("urgent")
+    add(task_manager, "worth more per minute", TaskPriority.LOW, 20)
+    urgent = add(task_manager, "due at the end of the free time", TaskPriority.LOW, 30, due_in=30)
+    #failing the urgent one would cost its penalty, so it is picked even though it pays less per minute
+    for exact in (False, True):
+        plan = task_manager.plan(30, exact=exact, now=NOW)
+        assert plan.tasks == [urgent], exact
+    plan = task_manager.plan(50, now=NOW)
+    assert plan.tasks[0] is urgent and len(plan.tasks) == 2
+    check_feasible(plan, 50)
+
+
+def run_all():
+    for test in (test_deadlines_are_met, test_impossible_and_blocked_tasks, test_urgent_task_first):
+        setup_function(test)
+        try:
+            test()
+        finally:
+            teardown_function(test)
+        print(f"{test.__name__} passed")
+
+
+if __name__ == "__main__":
+    run_all()
+    print("\nPlanner tests passed!")
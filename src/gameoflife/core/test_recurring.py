@@ -0,0 +1,101 @@
+"""Recurring task templates: the occurrences of a window, and an occurrence getting its row when done.
+
+Run it directly or with pytest; every test gets its own throwaway database.
+"""
+import datetime
+import os
+import tempfile
+
+from config import config, Recurrence, TaskStatus, TaskTemplate
+import database
+import session
+
+START = datetime.datetime(2026, 1, 31, 8, 0)
+
+_tmp = None
+
+
+def setup_function(function):
+    global _tmp
+    _tmp = tempfile.TemporaryDirectory()
+    config.db_path = os.path.join(_tmp.name, "recurring.db")
+    database.init_db(config.db_path)
+
+
+def teardown_function(function):
+    database.close_db()
+    config.db_path = None
+    _tmp.cleanup()
+
+
+def days(template, start, end):
+    return [due.date() for due in template.occurrences(start, end)]
+
+
+def test_occurrences():
+    every_other_day = TaskTemplate("water plants", Recurrence.DAILY, START, interval=2)
+    #a window far from the start doesn't walk there from START
+    window = days(every_other_day, datetime.datetime(2027, 1, 1), datetime.datetime(2027, 1, 7))
+    assert window == [datetime.date(2027, 1, 2), datetime.date(2027, 1, 4), datetime.date(2027, 1, 6)]
+    assert days(every_other_day, datetime.datetime(2025, 1, 1), START) == []
+
+    weekly = TaskTemplate("review", Recurrence.WEEKLY, START, until=datetime.datetime(2026, 2, 14, 8, 0))
+    #until is the last occurrence, included
+    assert days(weekly, START, datetime.datetime(2026, 6, 1)) == \
+        [datetime.date(2026, 1, 31), datetime.date(2026, 2, 7), datetime.date(2026, 2, 14)]
+
+    #the 31st falls back to the last day of shorter months
+    monthly = TaskTemplate("rent", Recurrence.MONTHLY, START)
+    assert days(monthly, datetime.datetime(2026, 2, 1), datetime.datetime(2026, 6, 1)) == \
+        [datetime.date(2026, 2, 28), datetime.date(2026, 3, 31), datetime.date(2026, 4, 30),
+         datetime.date(2026, 5, 31)]
+
+    for frequency, interval in (("hourly", 1), (Recurrence.DAILY, 0)):
+        try:
+            TaskTemplate("bad", frequency, START, interval=interval)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError((frequency, interval))
+
+
+def test_completed_occurrence_gets_a_row():
+    task_manager = session.login("chores")
+    task_manager.add_template(TaskTemplate("dishes", Recurrence.DAILY, START))
+    week = (START, START + datetime.timedelta(days=7))
+    occurrences = task_manager.get_occurrences(*week)
+    assert len(occurrences) == 7 and all(task.id is None for task in occurrences)
+    #nothing is stored for an occurrence until it is done
+    assert database.get_tasks_by_user(task_manager.user_id) == []
+
+    task_manager.complete_task(occurrences[1])
+    task_manager.fail_task(occurrences[2])
+    rows = database.get_tasks_by_user(task_manager.user_id)
+    assert sorted((t.due_date, t.status) for t in rows) == \
+        [(occurrences[1].due_date, TaskStatus.COMPLETED), (occurrences[2].due_date, TaskStatus.FAILED)]
+    #and a done occurrence isn't generated again, here or after logging in again
+    assert len(task_manager.get_occurrences(*week)) == 5
+    reloaded = session.load_session(task_manager.player.user, task_manager.user_id)
+    assert [t.due_date for t in reloaded.get_occurrences(*week)] == \
+        [t.due_date for t in task_manager.get_occurrences(*week)]
+
+    #undoing the completion takes the row away again, the occurrence comes back
+    task_manager.undo()
+    task_manager.undo()
+    assert database.get_tasks_by_user(task_manager.user_id) == []
+    assert len(task_manager.get_occurrences(*week)) == 7
+
+
+def run_all():
+    for test in (test_occurrences, test_completed_occurrence_gets_a_row):
+        setup_function(test)
+        try:
+            test()
+        finally:
+            teardown_function(test)
+        print(f"{test.__name__} passed")
+
+
+if __name__ == "__main__":
+    run_all()
+    print("\nRecurring task tests passed!")
@@ -0,0 +1,121 @@
+"""Deadline reminders: the timer wheel firing on the right tick, and the reminders missed while closed.
+
+Run it directly or with pytest; every test gets its own throwaway database.
+"""
+import datetime
+import os
+import tempfile
+
+from config import config, Task
+import database
+import reminders
+import session
+
+NOW = datetime.datetime(2026, 9, 1, 9, 0)
+
+_tmp = None
+
+
+def setup_function(function):
+    global _tmp
+    _tmp = tempfile.TemporaryDirectory()
+    config.db_path = os.path.join(_tmp.name, "reminders.db")
+    database.init_db(config.db_path)
+
+
+def teardown_function(function):
+    database.close_db()
+    config.db_path = None
+    _tmp.cleanup()
+
+
+def add(task_manager, title, due_in):
+    task = Task(title, due_date=NOW + due_in)
+    task.created_at = NOW
+    return task_manager.add_task(task)
+
+
+def fired(scheduler, when):
+    return [(reminder.task.title, reminder.before) for reminder in scheduler.poll(when)]
+
+
+def test_timer_wheel():
+    #a small wheel, 4 slots on 2 levels, so timers cascade and overflow within a few dozen ticks
+    wheel = reminders.TimerWheel(0, slots=4, levels=2)
+    wheel.add("past", -3, "past")
+    wheel.add("a", 1, "a")
+    wheel.add("b", 6, "b")           # level 1, drops down at tick 4
+    wheel.add("c", 40, "c")          # past both levels, waits in the overflow bucket
+    wheel.add("cancelled", 3, "cancelled")
+    wheel.cancel("cancelled")
+    wheel.add("moved", 2, "moved")
+    wheel.add("moved", 7, "moved")   # the same key again replaces the timer
+    assert len(wheel) == 5 and "cancelled" not in wheel
+
+    assert wheel.advance(1) == ["past", "a"]
+    assert wheel.advance(5) == []
+    assert wheel.advance(7) == ["b", "moved"]
+    assert wheel.advance(39) == []
+    assert wheel.advance(40) == ["c"]
+    assert len(wheel) == 0
+    #with nothing left the clock jumps ahead, and new timers are placed from there
+    assert wheel.advance(1000) == [] and wheel.now == 1000
+    wheel.add("d", 1002, "d")
+    assert wheel.advance(1001) == [] and wheel.advance(1002) == ["d"]
+
+
+def test_reminders_fire():
+    task_manager = session.login("reminded")
+    scheduler = reminders.ReminderScheduler(task_manager)
+    assert scheduler.start(NOW) == []
+    big = add(task_manager, "big", datetime.timedelta(days=2))
+    #added half an hour before it is due: no "24 hours" or "1 hour" reminders from before it existed
+    add(task_manager, "soon", datetime.timedelta(minutes=30))
+
+    assert fired(scheduler, NOW + datetime.timedelta(minutes=29)) == []
+    reminder, = scheduler.poll(NOW + datetime.timedelta(minutes=30))
+    assert reminders.message(reminder) == "soon is due now"
+    reminder, = scheduler.poll(NOW + datetime.timedelta(days=1))
+    assert reminders.message(reminder) == "big is due in 24 hours"
+    assert database.get_reminders_fired_until(task_manager.user_id) == NOW + datetime.timedelta(days=1)
+
+    #a completed task loses the reminders it has left
+    task_manager.complete_task(big)
+    assert fired(scheduler, NOW + datetime.timedelta(days=3)) == []
+    scheduler.stop()
+
+
+def test_missed_while_closed():
+    task_manager = session.login("away")
+    first = reminders.ReminderScheduler(task_manager)
+    first.start(NOW)
+    add(task_manager, "report", datetime.timedelta(hours=2))
+    add(task_manager, "trip", datetime.timedelta(days=3))
+    first.stop()
+
+    #both of report's reminders went by while closed: one batch with the most urgent
+    later = reminders.ReminderScheduler(task_manager)
+    missed = later.start(NOW + datetime.timedelta(hours=2, minutes=5))
+    assert [(r.task.title, r.before) for r in missed] == [("report", datetime.timedelta(0))]
+    assert fired(later, NOW + datetime.timedelta(days=2)) == [("trip", datetime.timedelta(hours=24))]
+    later.stop()
+
+    #nothing missed twice
+    again = reminders.ReminderScheduler(task_manager)
+    assert again.start(NOW + datetime.timedelta(days=2, minutes=1)) == []
+    again.stop()
+
+
+def run_all():
+    for test in (test_timer_wheel, test_reminders_fire, test_missed_while_closed):
+        setup_function(test)
+        try:
+            test()
+        finally:
+            teardown_function(test)
+        print(f"{test.__name__} passed")
+
+
+if __name__ == "__main__":
+    run_all()
+    print("\nReminder tests passed!")
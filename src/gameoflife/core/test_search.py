@@ -0,0 +1,101 @@
+"""Task search: FTS5 ranking and prefixes, the index following edits, and the LIKE fallback.
+
+Run it directly or with pytest; every test gets its own throwaway database.
+"""
+import os
+import tempfile
+
+from config import config, Task, TaskStatus
+import database
+import session
+
+_tmp = None
+
+
+def setup_function(function):
+    global _tmp
+    _tmp = tempfile.TemporaryDirectory()
+    config.db_path = os.path.join(_tmp.name, "search.db")
+    database.init_db(config.db_path)
+
+
+def teardown_function(function):
+    database.close_db()
+    config.db_path = None
+    _tmp.cleanup()
+
+
+def make_tasks():
+    task_manager = session.login("searcher")
+    for title, description in (("weekly report", "numbers for the team"),
+                               ("call the bank", "ask about the weekly limit"),
+                               ("report a bug", "the OR operator"),
+                               ("water plants", "")):
+        task_manager.add_task(Task(title, description=description))
+    session.login("other user").add_task(Task("weekly report of someone else"))
+    return task_manager
+
+
+def titles(user_id, query, **kwargs):
+    return [t.title for t in database.search_tasks(user_id, query, **kwargs)]
+
+
+def test_search():
+    user_id = make_tasks().user_id
+    #a title match ranks above a description match, other users' tasks never show up
+    assert titles(user_id, "weekly") == ["weekly report", "call the bank"]
+    #the last word may still be being typed
+    assert titles(user_id, "weekly rep") == ["weekly report"]
+    assert set(titles(user_id, "rep")) == {"weekly report", "report a bug"}
+    #FTS5 syntax typed into the box is just text
+    assert titles(user_id, 'OR "bug') == ["report a bug"]
+    assert titles(user_id, "-") == []
+    assert titles(user_id, "nothing like it") == []
+    #pages of results
+    first = titles(user_id, "report", limit=1)
+    second = titles(user_id, "report", limit=1, offset=1)
+    assert len(first) == len(second) == 1 and set(first + second) == {"weekly report", "report a bug"}
+
+
+def test_index_follows_edits():
+    task_manager = make_tasks()
+    user_id = task_manager.user_id
+    bank = next(t for t in task_manager.active_tasks if t.title == "call the bank")
+    task_manager.complete_task(bank)
+    assert titles(user_id, "bank") == ["call the bank"]
+    assert titles(user_id, "bank", status=database.ACTIVE_STATUSES) == []
+    assert titles(user_id, "bank", status=TaskStatus.COMPLETED) == ["call the bank"]
+
+    with database.transaction():
+        database.c.execute("UPDATE tasks SET title = 'call the insurance' WHERE id = ?", (bank.id,))
+    assert titles(user_id, "bank") == []
+    assert titles(user_id, "insurance") == ["call the insurance"]
+    database.delete_task(bank.id, user_id)
+    assert titles(user_id, "insurance") == []
+
+
+def test_like_fallback():
+    user_id = make_tasks().user_id
+    indexed = database.fts_enabled
+    #what a SQLite built without FTS5 gets: every word anywhere, newest first
+    database.fts_enabled = False
+    try:
+        assert titles(user_id, "weekly") == ["call the bank", "weekly report"]
+        assert titles(user_id, "weekly rep") == ["weekly report"]
+    finally:
+        database.fts_enabled = indexed
+
+
+def run_all():
+    for test in (test_search, test_index_follows_edits, test_like_fallback):
+        setup_function(test)
+        try:
+            test()
+        finally:
+            teardown_function(test)
+        print(f"{test.__name__} passed")
+
+
+if __name__ == "__main__":
+    run_all()
+    print("\nSearch tests passed!")
@@ -0,0 +1,191 @@
+"""Query-count budgets for logging in and for the common task operations.
+
+Uses database.count_queries to count the SQL statements each operation runs,
+so an N+1 loop (one query per task, per achievement...) fails here instead
+of only showing up as a slow login. Run it directly or with pytest; every
+test gets its own throwaway database either way.
+"""
+import datetime
+import os
+import tempfile
+
+from config import config, Task, TaskPriority, TaskTemplate
+import database
+import session
+
+#statements per operation, however many tasks/templates/achievements the user has
+LOGIN_BUDGET = 3            # session row, tasks, templates
+SNAPSHOT_LOGIN_BUDGET = 2   # session row, templates
+COMPLETE_BUDGET = 2         # task status, player stats
+AWARD_BUDGET = 1            # per achievement a completion awards
+ADD_BUDGET = 1
+SWITCH_BACK_BUDGET = 1      # the change_counter check of a cached session
+
+
+def make_user(username, task_count, template_count=0, achievement_count=0):
+    user_manager = session.login(username)
+    user_id = user_manager.user_id
+    database.insert_tasks([Task(f"task {i}", TaskPriority.HIGH,
+                                due_date=datetime.datetime.now() + datetime.timedelta(days=1))
+                           for i in range(task_count)], user_id)
+    for i in range(template_count):
+        database.insert_template(TaskTemplate(f"repeat {i}", "daily", datetime.datetime(2026, 1, 1)), user_id)
+    with database.transaction():
+        database.c.executemany("""INSERT INTO achievements (player_id, name, description, date_earned, xp_reward)
+                                  VALUES (?, ?, ?, ?, ?)""",
+                               [(user_manager.player_id, f"achievement {i}", "test", "2026-01-01", 10)
+                                for i in range(achievement_count)])
+    return user_id
+
+
+def logged_in_queries(username):
+    with database.count_queries() as statements:
+        task_manager = session.login(username)
+    return task_manager, statements
+
+
+def check_budget(statements, budget, what):
+    assert len(statements) <= budget, f"{what} ran {len(statements)} statements:\n" + "\n".join(statements)
+
+
+_tmp = None
+
+
+def setup_function(function):
+    global _tmp
+    _tmp = tempfile.TemporaryDirectory()
+    #snapshots are written next to the database, keep them in the temp dir too
+    config.db_path = os.path.join(_tmp.name, "session.db")
+    database.init_db(config.db_path)
+
+
+def teardown_function(function):
+    database.close_db()
+    config.db_path = None
+    _tmp.cleanup()
+
+
+def test_count_queries():
+    user_id = make_user("counted", task_count=3)
+    #the same query run in a loop is counted every time, not folded into one
+    with database.count_queries() as statements:
+        for _ in range(3):
+            database.c.execute("SELECT id FROM tasks WHERE user_id = ?", (user_id,)).fetchall()
+    assert len(statements) == 3, statements
+    #the change_counter and search index triggers an UPDATE fires are part of it
+    with database.count_queries() as statements:
+        with database.transaction():
+            database.c.execute("UPDATE tasks SET title = title || '!' WHERE user_id = ?", (user_id,))
+    assert len(statements) == 1, statements
+
+
+def test_login_budget():
+    make_user("small", task_count=1)
+    make_user("large", task_count=500, template_count=5, achievement_count=20)
+    for username in ("small", "large"):
+        #first login reads the database, the second one finds a valid snapshot
+        task_manager, statements = logged_in_queries(username)
+        check_budget(statements, LOGIN_BUDGET, f"login of {username}")
+        _, statements = logged_in_queries(username)
+        check_budget(statements, SNAPSHOT_LOGIN_BUDGET, f"snapshot login of {username}")
+
+    assert len(task_manager.active_tasks) == 500
+    assert len(task_manager.templates) == 5
+    assert len(task_manager.player.achievements) == 20
+
+
+def test_new_user_login():
+    with database.count_queries() as statements:
+        task_manager = session.login("brand new", "new@example.com")
+    #the session row lookup, then the user and player inserts
+    check_budget(statements, 3, "login of a new user")
+    assert task_manager.player.id is not None and task_manager.player.xp == 0
+
+
+def test_player_columns_by_name():
+    user_id = make_user("stats", task_count=0)
+    player_id = session.login("stats").player_id
+    database.update_player_stats(player_id, xp=340, level=2, tasks_completed=12, tasks_failed=3,
+                                 current_streak=4, longest_streak=9, tasks_completed_early=5,
+                                 critical_tasks_completed=1, previous_rank="Apprentice",
+                                 last_active_day=datetime.date.today().toordinal())
+    #a column added later goes at the end of the table, nothing may depend on positions
+    database._add_column("players", "unused_extra", "TEXT")
+    player = session.load_player(None, user_id)
+    assert (player.xp, player.level, player.tasks_completed, player.tasks_failed) == (340, 2, 12, 3)
+    assert (player.current_streak, player.longest_streak, player.previous_rank) == (4, 9, "Apprentice")
+
+
+def test_task_operation_budgets():
+    make_user("ops", task_count=50)
+    task_manager = session.login("ops")
+    with database.count_queries() as statements:
+        task_manager.add_task(Task("one more"))
+    check_budget(statements, ADD_BUDGET, "add_task")
+    for task in task_manager.active_tasks[:3]:
+        with database.count_queries() as statements:
+            result = task_manager.complete_task(task)
+        check_budget(statements, COMPLETE_BUDGET + AWARD_BUDGET * len(result['new_achievements']),
+                     "complete_task")
+
+
+def test_switch_back_budget():
+    make_user("first", task_count=200)
+    make_user("second", task_count=10)
+    sessions = session.SessionCache()
+    first = sessions.login("first")
+    sessions.put(first)
+    sessions.put(sessions.login("second"))
+    with database.count_queries() as statements:
+        assert sessions.login("first") is first
+    check_budget(statements, SWITCH_BACK_BUDGET, "switching back to a cached session")
+
+    #a write from elsewhere while it was put away makes the cached copy stale
+    sessions.put(first)
+    database.insert_task(Task("added by the command line"), first.user_id)
+    reloaded = sessions.login("first")
+    assert reloaded is not first and len(reloaded.active_tasks) == 201
+
+    #over budget the least recently used session goes first
+    sessions = session.SessionCache(budget_mb=0.1)
+    sessions.put(session.login("first"))
+    sessions.put(session.login("second"))
+    assert sessions.usernames() == ["second"] and sessions.size <= sessions.budget
+
+
+def test_written_before_put():
+    make_user("stale", task_count=5)
+    sessions = session.SessionCache()
+    task_manager = sessions.login("stale")
+    #its own writes keep the session current...
+    task_manager.add_task(Task("added here"))
+    sessions.put(task_manager)
+    assert sessions.login("stale") is task_manager
+    #...but a write from another process before it is put away doesn't
+    other = database.connect()
+    other.execute("UPDATE tasks SET title = 'renamed elsewhere' WHERE user_id = ?", (task_manager.user_id,))
+    other.commit()
+    other.close()
+    sessions.put(task_manager)
+    assert "stale" not in sessions
+    reloaded = sessions.login("stale")
+    assert reloaded is not task_manager
+    assert {task.title for task in reloaded.active_tasks} == {"renamed elsewhere"}
+    #and no snapshot is saved for it when the app closes
+    assert session.save_session(task_manager) is None
+
+
+def run_all():
+    for test in (test_count_queries, test_login_budget, test_new_user_login, test_player_columns_by_name,
+                 test_task_operation_budgets, test_switch_back_budget, test_written_before_put):
+        setup_function(test)
+        try:
+            test()
+        finally:
+            teardown_function(test)
+        print(f"{test.__name__} passed")
+
+
+if __name__ == "__main__":
+    run_all()
+    print("\nSession query budget tests passed!")
@@ -0,0 +1,123 @@
+"""Daily streaks: counting completions once per day, the overnight reset, and the backfill from task history.
+
+Run it directly or with pytest; every test gets its own throwaway database.
+"""
+import datetime
+import os
+import tempfile
+
+from config import config, Task, TaskStatus
+import database
+import session
+import streaks
+import timestamps
+
+TODAY = datetime.date(2026, 8, 20)
+
+_tmp = None
+
+
+def setup_function(function):
+    global _tmp
+    _tmp = tempfile.TemporaryDirectory()
+    config.db_path = os.path.join(_tmp.name, "streaks.db")
+
+
+def teardown_function(function):
+    database.close_db()
+    config.db_path = None
+    config.timestamp_mode = timestamps.ISO
+    _tmp.cleanup()
+
+
+def completed_on(user_id, days_ago):
+    for n in days_ago:
+        task = Task(f"done {n} days ago", status=TaskStatus.COMPLETED)
+        task.completed_at = datetime.datetime.combine(TODAY - datetime.timedelta(days=n), datetime.time(21, 30))
+        database.insert_task(task, user_id)
+
+
+def streak_of(user_id):
+    player = session.load_player(None, user_id)
+    return player.current_streak, player.longest_streak, player.last_active_day
+
+
+def test_record_completion():
+    database.init_db(config.db_path)
+    player = session.login("daily").player
+    for day in (0, 0, 1, 2, 4):
+        streaks.record_completion(player, TODAY + datetime.timedelta(days=day))
+    #two completions on the first day count once, the missed day 3 starts over
+    assert (player.current_streak, player.longest_streak) == (1, 3)
+    assert player.last_active_day == (TODAY + datetime.timedelta(days=4)).toordinal()
+
+    assert streaks.refresh_player(player, TODAY + datetime.timedelta(days=5)) == 1
+    assert streaks.refresh_player(player, TODAY + datetime.timedelta(days=6)) == 0
+
+
+def test_rollover():
+    database.init_db(config.db_path)
+    kept, broken = session.login("kept"), session.login("broken")
+    for task_manager, days_ago in ((kept, 1), (broken, 2)):
+        last_day = (TODAY - datetime.timedelta(days=days_ago)).toordinal()
+        database.update_player_stats(task_manager.player_id, 0, 1, 0, 0, 5, 5, 0, 0, None,
+                                     last_active_day=last_day)
+    assert streaks.rollover(today=TODAY) == 1
+    assert streak_of(kept.user_id)[:2] == (5, 5)
+    assert streak_of(broken.user_id)[:2] == (0, 5)
+
+
+def check_backfill():
+    database.init_db(config.db_path)
+    current = session.login("current").user_id
+    lapsed = session.login("lapsed").user_id
+    idle = session.login("idle").user_id
+    completed_on(current, (12, 11, 10, 9, 1, 1, 0))
+    completed_on(lapsed, (5, 4, 3))
+    #a failed task doesn't count
+    database.insert_task(Task("failed", status=TaskStatus.FAILED), idle)
+
+    assert streaks.backfill(today=TODAY) == 2
+    assert streak_of(current) == (2, 4, TODAY.toordinal())
+    assert streak_of(lapsed) == (0, 3, (TODAY - datetime.timedelta(days=3)).toordinal())
+    assert streak_of(idle) == (0, 0, None)
+
+
+def test_backfill():
+    check_backfill()
+
+
+def test_backfill_epoch():
+    config.timestamp_mode = timestamps.EPOCH
+    check_backfill()
+
+
+def test_backfill_on_upgrade():
+    database.init_db(config.db_path)
+    user_id = session.login("veteran").user_id
+    completed_on(user_id, (2, 1, 0))
+    #a database from before last_active_day: init_db adds the column and fills it in
+    database.c.execute("ALTER TABLE players DROP COLUMN last_active_day")
+    database.conn.commit()
+    database.close_db()
+    database.init_db(config.db_path)
+    current, longest, last_day = streak_of(user_id)
+    assert (longest, last_day) == (3, TODAY.toordinal())
+    #measured against the real today, so the streak may already have lapsed
+    assert current == (3 if not streaks.is_broken(last_day) else 0)
+
+
+def run_all():
+    for test in (test_record_completion, test_rollover, test_backfill, test_backfill_epoch,
+                 test_backfill_on_upgrade):
+        setup_function(test)
+        try:
+            test()
+        finally:
+            teardown_function(test)
+        print(f"{test.__name__} passed")
+
+
+if __name__ == "__main__":
+    run_all()
+    print("\nStreak tests passed!")
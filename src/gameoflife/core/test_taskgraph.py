@@ -0,0 +1,101 @@
+"""Task dependencies: the ready set counted down as tasks finish, and cycles refused.
+
+Run it directly or with pytest; every test gets its own throwaway database.
+"""
+import os
+import tempfile
+
+from config import config, Task
+import database
+import session
+import taskgraph
+
+_tmp = None
+
+
+def setup_function(function):
+    global _tmp
+    _tmp = tempfile.TemporaryDirectory()
+    config.db_path = os.path.join(_tmp.name, "taskgraph.db")
+    database.init_db(config.db_path)
+
+
+def teardown_function(function):
+    database.close_db()
+    config.db_path = None
+    _tmp.cleanup()
+
+
+def test_ready_counts():
+    #1 and 2 both come before 3, 3 before 4
+    graph = taskgraph.TaskGraph()
+    graph.load([(1, 3), (2, 3), (3, 4)], [1, 2, 3, 4])
+    assert [graph.is_ready(i) for i in (1, 2, 3, 4)] == [True, True, False, False]
+    assert sorted(graph.waiting_on(3)) == [1, 2]
+
+    assert graph.finish(1) == []             # 3 still waits for 2
+    assert graph.waiting_on(3) == [2]
+    assert graph.finish(2) == [3]
+    assert graph.finish(2) == []             # finishing twice counts down once
+    assert graph.is_ready(3) and not graph.is_ready(4)
+
+    graph.reopen(2)                          # an undone completion blocks 3 again
+    assert not graph.is_ready(3)
+    graph.remove_edge(2, 3)
+    assert graph.is_ready(3)
+
+    #an edge between open tasks blocks, one from a finished task doesn't
+    graph.add_task(5)
+    graph.add_task(6)
+    graph.add_edge(1, 6)
+    graph.add_edge(5, 6)
+    assert graph.is_ready(5) and not graph.is_ready(6) and graph.waiting_on(6) == [5]
+    graph.remove_task(5)
+    assert graph.is_ready(6) and graph.edges_of(5) == []
+
+
+def test_task_manager_dependencies():
+    task_manager = session.login("planner")
+    a, b, c, d = (task_manager.add_task(Task(name)) for name in "abcd")
+    task_manager.add_dependency(a, b)
+    task_manager.add_dependency(b, c)
+    task_manager.add_dependency(a, d)
+    for before, after in ((c, a), (b, b)):
+        try:
+            task_manager.add_dependency(before, after)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError(f"{before.title} -> {after.title} should be refused")
+
+    def ready():
+        return sorted(t.title for t in task_manager.get_active_tasks(unblocked=True))
+
+    assert ready() == ["a"]
+    task_manager.complete_task(a)
+    assert ready() == ["b", "d"]
+    task_manager.fail_task(b)
+    assert ready() == ["c", "d"]
+    task_manager.undo()
+    assert ready() == ["b", "d"]
+    task_manager.remove_dependency(b, c)
+    assert ready() == ["b", "c", "d"]
+
+    #a fresh login rebuilds the same ready set from task_edges
+    reloaded = session.load_session(task_manager.player.user, task_manager.user_id)
+    assert sorted(t.title for t in reloaded.get_active_tasks(unblocked=True)) == ["b", "c", "d"]
+
+
+def run_all():
+    for test in (test_ready_counts, test_task_manager_dependencies):
+        setup_function(test)
+        try:
+            test()
+        finally:
+            teardown_function(test)
+        print(f"{test.__name__} passed")
+
+
+if __name__ == "__main__":
+    run_all()
+    print("\nTask graph tests passed!")
@@ -0,0 +1,157 @@
+"""Epoch timestamps: the stored mode, and a migration stopped part way then resumed.
+
+Run it directly or with pytest; every test gets its own throwaway database.
+"""
+import datetime
+import os
+import sqlite3
+import tempfile
+
+from config import config, Task, TaskPriority, TaskTemplate
+from game import User
+import database
+import timestamps
+
+DUE = datetime.datetime(2026, 3, 1, 9, 30)
+
+_tmp = None
+
+
+class Stop(Exception):
+    pass
+
+
+def setup_function(function):
+    global _tmp
+    _tmp = tempfile.TemporaryDirectory()
+    config.db_path = os.path.join(_tmp.name, "timestamps.db")
+
+
+def teardown_function(function):
+    database.close_db()
+    config.db_path = None
+    config.timestamp_mode = timestamps.ISO
+    _tmp.cleanup()
+
+
+def migrate_conn():
+    return sqlite3.connect(config.db_path, detect_types=sqlite3.PARSE_DECLTYPES)
+
+
+def make_iso_database(task_count):
+    database.init_db(config.db_path)
+    user_id = database.insert_user(User("migrated", "m@example.com"))
+    database.insert_tasks([Task(f"task {i}", TaskPriority.LOW, due_date=DUE + datetime.timedelta(hours=i))
+                           for i in range(task_count)], user_id)
+    database.insert_template(TaskTemplate("weekly", "weekly", DUE), user_id)
+    database.close_db()
+    return user_id
+
+
+def text_timestamps(conn):
+    """(table, column) of every timestamp still stored as text."""
+    found = []
+    for table, columns in timestamps.TIMESTAMP_COLUMNS.items():
+        names = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+        for col in columns:
+            if col in names and conn.execute(f"SELECT 1 FROM {table} WHERE typeof({col}) = 'text'").fetchone():
+                found.append((table, col))
+    return found
+
+
+def test_new_database_records_its_mode():
+    config.timestamp_mode = timestamps.EPOCH
+    database.init_db(config.db_path)
+    assert timestamps.detect_mode(database.conn) == timestamps.EPOCH
+    #the config only picks the mode of a new database
+    database.close_db()
+    config.timestamp_mode = timestamps.ISO
+    database.init_db(config.db_path)
+    assert database.timestamp_mode == timestamps.EPOCH
+
+
+def test_resume_after_interruption():
+    user_id = make_iso_database(task_count=25)
+
+    def stop_in_tasks(table, copied):
+        if table == "tasks":
+            raise Stop()
+
+    conn = migrate_conn()
+    try:
+        timestamps.migrate_to_epoch(conn, chunk_size=10, progress=stop_in_tasks)
+    except Stop:
+        pass
+    #users is swapped and tasks half copied, but the database is still ISO until the end
+    assert timestamps.detect_mode(conn) == timestamps.ISO
+    conn.close()
+
+    #the app keeps working in between, writing ISO text into the swapped users table
+    database.init_db(config.db_path)
+    assert database.timestamp_mode == timestamps.ISO
+    second_id = database.insert_user(User("in between", "b@example.com"))
+    database.insert_task(Task("added in between", due_date=DUE), second_id)
+    assert database.get_user_by_id(second_id) is not None
+    assert len(database.get_tasks_by_user(user_id)) == 25
+    database.close_db()
+
+    conn = migrate_conn()
+    timestamps.migrate_to_epoch(conn, chunk_size=10)
+    assert timestamps.detect_mode(conn) == timestamps.EPOCH
+    assert text_timestamps(conn) == []
+    assert conn.execute("SELECT name FROM sqlite_master WHERE name LIKE '%\\_epoch' ESCAPE '\\'").fetchall() == []
+    conn.close()
+
+    database.init_db(config.db_path)
+    assert database.timestamp_mode == timestamps.EPOCH
+    tasks = database.get_tasks_by_user(user_id)
+    assert sorted(t.due_date for t in tasks) == [DUE + datetime.timedelta(hours=i) for i in range(25)]
+    assert [t.due_date for t in database.get_tasks_by_user(second_id)] == [DUE]
+    assert database.get_templates_by_user(user_id)[0].start == DUE
+
+
+def test_database_from_before_db_meta():
+    make_iso_database(task_count=3)
+    conn = migrate_conn()
+
+    def stop_after_users(table, copied):
+        if table == "tasks":
+            raise Stop()
+
+    try:
+        timestamps.migrate_to_epoch(conn, chunk_size=10, progress=stop_after_users)
+    except Stop:
+        pass
+    #as left by a version that kept no db_meta: the schema alone says whether it got through
+    conn.execute("DROP TABLE db_meta")
+    conn.commit()
+    assert timestamps.detect_mode(conn) == timestamps.ISO
+    timestamps.migrate_to_epoch(conn)
+    conn.execute("DROP TABLE db_meta")
+    conn.commit()
+    assert timestamps.detect_mode(conn) == timestamps.EPOCH
+    conn.close()
+
+
+def test_epoch_column_holding_text():
+    config.timestamp_mode = timestamps.EPOCH
+    database.init_db(config.db_path)
+    user_id = database.insert_user(User("text", "t@example.com"))
+    database.c.execute("UPDATE users SET created_at = ? WHERE id = ?", (DUE.isoformat(), user_id))
+    assert database.conn.execute("SELECT created_at FROM users WHERE id = ?", (user_id,)).fetchone()[0] == DUE
+
+
+def run_all():
+    for test in (test_new_database_records_its_mode, test_resume_after_interruption,
+                 test_database_from_before_db_meta, test_epoch_column_holding_text):
+        setup_function(test)
+        try:
+            test()
+        finally:
+            teardown_function(test)
+        print(f"{test.__name__} passed")
+
+
+if __name__ == "__main__":
+    run_all()
+    print("\nTimestamp tests passed!")
@@ -0,0 +1,79 @@
+"""database.transaction: nesting through savepoints, and rolling back when the commit itself fails.
+
+Run it directly or with pytest; every test gets its own throwaway database.
+"""
+import os
+import sqlite3
+import tempfile
+
+from config import config, Task
+import database
+import session
+
+_tmp = None
+
+
+def setup_function(function):
+    global _tmp
+    _tmp = tempfile.TemporaryDirectory()
+    config.db_path = os.path.join(_tmp.name, "transaction.db")
+    database.init_db(config.db_path)
+
+
+def teardown_function(function):
+    database.close_db()
+    config.db_path = None
+    _tmp.cleanup()
+
+
+def task_titles(user_id):
+    return {row[0] for row in database.c.execute("SELECT title FROM tasks WHERE user_id = ?", (user_id,))}
+
+
+def test_inner_block_rolls_back_alone():
+    user_id = session.login("nested").user_id
+    with database.transaction():
+        database.insert_task(Task("outer"), user_id)
+        try:
+            with database.transaction():
+                database.insert_task(Task("inner"), user_id)
+                raise ValueError("inner block fails")
+        except ValueError:
+            pass
+    assert task_titles(user_id) == {"outer"}
+
+
+def test_failed_commit_rolls_back():
+    user_id = session.login("committed").user_id
+    try:
+        with database.transaction():
+            database.insert_task(Task("written before the bad row"), user_id)
+            #a deferred foreign key is only checked by COMMIT, which then fails
+            database.c.execute("PRAGMA defer_foreign_keys = ON")
+            database.c.execute("""INSERT INTO tasks (title, priority, status, user_id)
+                                  VALUES ('no such user', 'LOW', 'PENDING', 9999)""")
+    except sqlite3.IntegrityError:
+        pass
+    else:
+        raise AssertionError("the commit should have failed")
+    #the transaction was rolled back, not left open for the next statement to commit
+    assert not database.conn.in_transaction
+    assert task_titles(user_id) == set()
+    with database.transaction():
+        database.insert_task(Task("after"), user_id)
+    assert task_titles(user_id) == {"after"}
+
+
+def run_all():
+    for test in (test_inner_block_rolls_back_alone, test_failed_commit_rolls_back):
+        setup_function(test)
+        try:
+            test()
+        finally:
+            teardown_function(test)
+        print(f"{test.__name__} passed")
+
+
+if __name__ == "__main__":
+    run_all()
+    print("\nTransaction tests passed!")
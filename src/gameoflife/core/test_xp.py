@@ -0,0 +1,66 @@
+"""XPCalculator: completion XP with the early-bonus tiers, and the cached preview agreeing with it.
+
+Run it directly or with pytest. No database is needed.
+"""
+import datetime
+
+from config import Task, TaskPriority, XPConfig
+from game import XPCalculator
+
+NOW = datetime.datetime(2026, 5, 4, 12, 0)
+
+
+def completion_xp(calculator, early):
+    task = Task("timed", TaskPriority.MEDIUM, due_date=NOW + early)
+    return calculator.calculate_completion_xp(task, NOW)
+
+
+def test_default_tiers():
+    calculator = XPCalculator(XPConfig())
+    #medium is worth 25: +50% a week early, +25% three days early, +10% a day early
+    assert completion_xp(calculator, datetime.timedelta(days=8)) == 25 + 12
+    assert completion_xp(calculator, datetime.timedelta(days=7)) == 25 + 12
+    assert completion_xp(calculator, datetime.timedelta(days=4)) == 25 + 6
+    #the hours_early tier counts too (it was skipped when only days_early was looked at)
+    assert completion_xp(calculator, datetime.timedelta(hours=30)) == 25 + 2
+    assert completion_xp(calculator, datetime.timedelta(hours=24)) == 25 + 2
+    assert completion_xp(calculator, datetime.timedelta(hours=23)) == 25
+    assert completion_xp(calculator, datetime.timedelta(hours=-5)) == 25
+    assert calculator.calculate_completion_xp(Task("undated", TaskPriority.MEDIUM), NOW) == 25
+    assert calculator.calculate_failure_penalty(Task("failed", TaskPriority.MEDIUM)) == 38
+
+
+def test_days_only_tiers():
+    calculator = XPCalculator(XPConfig(early_bonus_thresholds=[{"days_early": 3, "bonus_pct": 20},
+                                                               {"days_early": 1, "bonus_pct": 100}]))
+    #the largest tier reached wins, whatever order the file lists them in
+    assert completion_xp(calculator, datetime.timedelta(days=5)) == 25 + 5
+    assert completion_xp(calculator, datetime.timedelta(days=2)) == 25 + 25
+    assert completion_xp(calculator, datetime.timedelta(hours=23)) == 25
+
+
+def test_preview_matches_completion():
+    calculator = XPCalculator(XPConfig())
+    for hours in (-3, 0, 23, 24, 30, 72, 100, 24 * 7, 24 * 30):
+        early = datetime.timedelta(hours=hours)
+        preview = calculator.preview(TaskPriority.MEDIUM, NOW + early, now=NOW)
+        assert preview['reward'] == completion_xp(calculator, early), hours
+        assert preview['penalty'] == 38
+    assert calculator.preview(TaskPriority.HIGH)['reward'] == 50
+
+    #editing the XP values in place drops the cached previews
+    xp_config = calculator.config
+    xp_config.base_rewards[TaskPriority.HIGH] = 60
+    xp_config.changed()
+    assert calculator.preview(TaskPriority.HIGH)['reward'] == 60
+
+
+def run_all():
+    for test in (test_default_tiers, test_days_only_tiers, test_preview_matches_completion):
+        test()
+        print(f"{test.__name__} passed")
+
+
+if __name__ == "__main__":
+    run_all()
+    print("\nXP tests passed!")
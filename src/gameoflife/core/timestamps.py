@@ -0,0 +1,242 @@
+"""Timestamp storage: ISO-8601 text (the default) or INTEGER epoch seconds.
+
+Epoch mode is opt-in with Config(timestamp_mode="epoch") for new databases,
+or migrate_to_epoch() for existing ones. Epoch columns are declared with the
+EPOCH type so the converter registered below turns them back into datetimes
+while sqlite3 reads the row, instead of calling datetime.fromisoformat per
+row in Python. Which mode a database uses is kept in its db_meta table, and
+is only switched to epoch once migrate_to_epoch has swapped the last table;
+databases from before db_meta have their mode worked out from the schema,
+so old ISO databases keep working unchanged.
+
+    python timestamps.py migrate path/to/gamelife.db
+"""
+import datetime
+import re
+import sqlite3
+import sys
+
+ISO = "iso"
+EPOCH = "epoch"
+
+#timestamp columns per table, these are the ones migrate_to_epoch rewrites
+TIMESTAMP_COLUMNS = {
+    "users": ("created_at",),
+    "tasks": ("due_date", "created_at", "completed_at"),
+    "achievements": ("date_earned",),
+    "task_templates": ("start", "until"),
+    "tasks_archive": ("due_date", "created_at", "completed_at", "archived_at"),
+    "reminder_state": ("fired_until",),
+}
+
+
+def _to_epoch(value):
+    if isinstance(value, datetime.datetime):
+        return int(value.timestamp())
+    return int(datetime.datetime.combine(value, datetime.time()).timestamp())
+
+
+def _convert_epoch(value):
+    text = value.decode()
+    if text.lstrip("-").isdigit():
+        return datetime.datetime.fromtimestamp(int(text))
+    #ISO text in an EPOCH column, written while migrate_to_epoch was part way through
+    return decode(text)
+
+
+#converters only run for columns declared EPOCH; there are no adapters, which would apply to
+#every connection in the process whatever its mode, encode turns values into epoch seconds itself
+sqlite3.register_converter("EPOCH", _convert_epoch)
+
+
+def column_type(mode):
+    """Declared type for timestamp columns in CREATE TABLE."""
+    return "EPOCH" if mode == EPOCH else "TEXT"
+
+
+def detect_mode(conn):
+    """The storage mode of an existing database, None for a new one."""
+    if _table_sql(conn, "db_meta") is not None:
+        row = conn.execute("SELECT value FROM db_meta WHERE key = 'timestamp_mode'").fetchone()
+        if row:
+            return row[0]
+    if _table_sql(conn, "tasks") is None:
+        return None
+    #a database from before db_meta is epoch only if a migration got all the way through
+    #(reminder_state was left as TEXT by migrations of that time, decode reads it either way)
+    done = all(_is_epoch(conn, table, columns) and _table_sql(conn, f"{table}_epoch") is None
+               for table, columns in TIMESTAMP_COLUMNS.items() if table != "reminder_state")
+    return EPOCH if done else ISO
+
+
+def store_mode(conn, mode, replace=False):
+    """Record the storage mode in db_meta, keeping one already recorded unless replace is set."""
+    conn.execute("CREATE TABLE IF NOT EXISTS db_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+    verb = "INSERT OR REPLACE" if replace else "INSERT OR IGNORE"
+    conn.execute(f"{verb} INTO db_meta (key, value) VALUES ('timestamp_mode', ?)", (mode,))
+
+
+def encode(value, mode):
+    """Value to bind for a timestamp parameter."""
+    if value is None:
+        return None
+    if mode == EPOCH:
+        return _to_epoch(value)
+    return value.isoformat()
+
+
+def decode(value):
+    """Turn a stored timestamp back into a datetime, whatever mode wrote it."""
+    if value is None or isinstance(value, datetime.datetime):
+        return value
+    if isinstance(value, (int, float)):
+        return datetime.datetime.fromtimestamp(value)
+    if value.isdigit():
+        #epoch seconds in a column still declared TEXT, e.g. reminder_state in a database
+        #migrated before it was in TIMESTAMP_COLUMNS
+        return datetime.datetime.fromtimestamp(int(value))
+    return datetime.datetime.fromisoformat(value)
+
+
+def day_sql(column, mode):
+    """SQL expression giving the local YYYY-MM-DD day of a timestamp column."""
+    if mode == EPOCH:
+        return f"date({column}, 'unixepoch', 'localtime')"
+    return f"substr({column}, 1, 10)"
+
+
+def migrate_to_epoch(conn, chunk_size=5000, progress=None):
+    """Rewrite an ISO database to epoch storage in place, one chunk per transaction.
+
+    Each table is copied into a new table with EPOCH columns, then swapped in
+    and has its indexes and triggers recreated in one transaction. Tables are
+    checked one by one, so if the migration is stopped part way, running it
+    again skips the tables already swapped and resumes the others from their
+    last copied chunk. The database stays in ISO mode (db_meta) until the
+    last table is swapped, so the app can use it in between.
+    """
+    #legacy_alter_table stops the rename from re-checking triggers that point at a table
+    #which is mid-swap (the change_counter triggers on tasks reference users)
+    conn.execute("PRAGMA foreign_keys = OFF")
+    conn.execute("PRAGMA legacy_alter_table = ON")
+    copied = 0
+    try:
+        with conn:
+            store_mode(conn, detect_mode(conn) or ISO)
+        for table, columns in TIMESTAMP_COLUMNS.items():
+            copied += _migrate_table(conn, table, columns, chunk_size, progress)
+        with conn:
+            store_mode(conn, EPOCH, replace=True)
+    finally:
+        conn.execute("PRAGMA legacy_alter_table = OFF")
+        conn.execute("PRAGMA foreign_keys = ON")
+    return copied
+
+
+def _table_sql(conn, table):
+    row = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?",
+                       (table,)).fetchone()
+    return row[0] if row else None
+
+
+def _is_epoch(conn, table, columns):
+    types = {row[1]: row[2].upper() for row in conn.execute(f"PRAGMA table_info({table})")}
+    return all(types[col] == "EPOCH" for col in columns if col in types)
+
+
+def _migrate_table(conn, table, columns, chunk_size, progress):
+    new_table = f"{table}_epoch"
+    table_sql = _table_sql(conn, table)
+    if table_sql is None:
+        if _table_sql(conn, new_table) is not None:
+            #stopped between the DROP and the RENAME by a version that didn't swap in one
+            #transaction; the copy is complete, init_db recreates the indexes and triggers
+            conn.execute(f"ALTER TABLE {new_table} RENAME TO {table}")
+            conn.commit()
+            table_sql = _table_sql(conn, table)
+        else:
+            return 0
+    if _is_epoch(conn, table, columns):
+        _convert_text(conn, table, columns)
+        return 0
+    pattern = rf"\b({'|'.join(columns)})\s+(TEXT|DATETIME|TIMESTAMP|DATE)\b"
+    create_sql = re.sub(pattern, r"\1 EPOCH", table_sql, flags=re.IGNORECASE)
+    #a table that was renamed before has its name quoted in sqlite_master
+    create_sql = re.sub(rf"^CREATE TABLE\s+(IF NOT EXISTS\s+)?[\"`\[]?{table}\b[\"`\]]?",
+                        f"CREATE TABLE IF NOT EXISTS {new_table}", create_sql, flags=re.IGNORECASE)
+    #indexes and triggers go away with the old table, so remember them first
+    extras = [r[0] for r in conn.execute(
+        "SELECT sql FROM sqlite_master WHERE tbl_name = ? AND type IN ('index', 'trigger') AND sql IS NOT NULL",
+        (table,))]
+
+    with conn:
+        conn.execute(create_sql)
+    names = [r[1] for r in conn.execute(f"PRAGMA table_info({table})")]
+    positions = [names.index(col) for col in columns if col in names]
+    insert_sql = f"INSERT INTO {new_table} ({', '.join(names)}) VALUES ({', '.join('?' * len(names))})"
+
+    #chunks go by rowid, which is the INTEGER PRIMARY KEY (id, or user_id for reminder_state)
+    last_id = conn.execute(f"SELECT COALESCE(MAX(rowid), 0) FROM {new_table}").fetchone()[0]
+    copied = 0
+    while True:
+        rows = conn.execute(f"SELECT rowid, * FROM {table} WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                            (last_id, chunk_size)).fetchall()
+        if not rows:
+            break
+        converted = []
+        for r in rows:
+            r = list(r[1:])
+            for pos in positions:
+                if r[pos] is not None:
+                    r[pos] = _to_epoch(decode(r[pos]))
+            converted.append(r)
+        with conn:
+            conn.executemany(insert_sql, converted)
+        last_id = rows[-1][0]
+        copied += len(rows)
+        if progress:
+            progress(table, copied)
+
+    #keep AUTOINCREMENT from handing out ids of rows that were deleted or archived
+    seq = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (table,)).fetchone()
+    #sqlite3 doesn't BEGIN before DDL by itself, without this a crash between the DROP
+    #and the RENAME would leave the data only in the _epoch table
+    conn.execute("BEGIN")
+    try:
+        conn.execute(f"DROP TABLE {table}")
+        conn.execute(f"ALTER TABLE {new_table} RENAME TO {table}")
+        if seq:
+            conn.execute("DELETE FROM sqlite_sequence WHERE name = ?", (table,))
+            conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)",
+                         (table, max(seq[0], last_id)))
+        for sql in extras:
+            conn.execute(sql)
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+    return copied
+
+
+def _convert_text(conn, table, columns):
+    #ISO text the app wrote into a table that an earlier, unfinished run had already swapped
+    names = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    for col in columns:
+        if col not in names:
+            continue
+        query = f"SELECT rowid, CAST({col} AS TEXT) FROM {table} WHERE typeof({col}) = 'text'"
+        rows = conn.execute(query).fetchall()
+        if rows:
+            with conn:
+                conn.executemany(f"UPDATE {table} SET {col} = ? WHERE rowid = ?",
+                                 [(_to_epoch(decode(value)), rowid) for rowid, value in rows])
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3 or sys.argv[1] != "migrate":
+        sys.exit("usage: python timestamps.py migrate path/to/gamelife.db")
+    migrate_conn = sqlite3.connect(sys.argv[2], detect_types=sqlite3.PARSE_DECLTYPES)
+    total = migrate_to_epoch(migrate_conn, progress=lambda table, n: print(f"{table}: {n} rows"))
+    migrate_conn.execute("VACUUM")
+    migrate_conn.close()
+    print(f"Migrated {total} rows to epoch timestamps")
@@ -1,5 +1,6 @@
 import sqlite3
 import datetime
+import json
 from config import *
 from game import *
 
@@ -133,53 +134,53 @@ def get_user_by_id(self, user_id):
 # ============= PLAYER OPERATIONS =============
 
 def get_player(self, user_id):
-    """Get player data by user_id."""
+    """Get player data by user_id.
+
+    The user, the player and the achievements come back from one statement
+    (achievements as a JSON array), and every column is read by name.
+    """
     with self.get_connection() as conn:
         cursor = conn.cursor()
-        
-        # Get user
-        cursor.execute("SELECT * FROM users WHERE id = ?", (user_id,))
-        user_row = cursor.fetchone()
-        if not user_row:
-            return None
-        
-        user = User(user_row['username'], user_row['email'])
-        user.created_at = datetime.datetime.fromisoformat(user_row['created_at'])
-        
-        # Get player data
-        cursor.execute("SELECT * FROM players WHERE user_id = ?", (user_id,))
-        player_row = cursor.fetchone()
-        
-        if not player_row:
+        cursor.row_factory = sqlite3.Row
+        cursor.execute("""
+            SELECT u.username, u.email, u.created_at, p.*,
+                   (SELECT json_group_array(json_object(
+                               'name', a.name, 'description', a.description,
+                               'date_earned', a.date_earned, 'xp_reward', a.xp_reward))
+                    FROM achievements a WHERE a.player_id = p.id) AS achievements_json
+            FROM users u JOIN players p ON p.user_id = u.id
+            WHERE u.id = ?
+        """, (user_id,))
+        row = cursor.fetchone()
+
+        if not row:
             return None
-        
+
+        user = User(row['username'], row['email'])
+        user.created_at = datetime.datetime.fromisoformat(row['created_at'])
+
         # Create player object
-        player = Player(user, xp=player_row['xp'], level=player_row['level'])
-        player.tasks_completed = player_row['tasks_completed']
-        player.tasks_failed = player_row['tasks_failed']
-        player.current_streak = player_row['current_streak']
-        player.longest_streak = player_row['longest_streak']
-        player.tasks_completed_early = player_row['tasks_completed_early']
-        player.tasks_completed_at_night = player_row['tasks_completed_at_night']
-        player.critical_tasks_completed = player_row['critical_tasks_completed']
-        player.perfect_days = player_row['perfect_days']
-        player.previous_rank = player_row['previous_rank']
-        
-        # Load achievements
-        cursor.execute("""
-            SELECT * FROM achievements WHERE player_id = ?
-        """, (player_row['id'],))
-        
-        for ach_row in cursor.fetchall():
+        player = Player(user, xp=row['xp'], level=row['level'])
+        player.tasks_completed = row['tasks_completed']
+        player.tasks_failed = row['tasks_failed']
+        player.current_streak = row['current_streak']
+        player.longest_streak = row['longest_streak']
+        player.tasks_completed_early = row['tasks_completed_early']
+        player.tasks_completed_at_night = row['tasks_completed_at_night']
+        player.critical_tasks_completed = row['critical_tasks_completed']
+        player.perfect_days = row['perfect_days']
+        player.previous_rank = row['previous_rank']
+
+        for ach in json.loads(row['achievements_json']):
             achievement = Achievement(
-                name=ach_row['name'],
-                description=ach_row['description'],
-                date_earned=datetime.date.fromisoformat(ach_row['date_earned']),
-                xp_reward=ach_row['xp_reward']
+                name=ach['name'],
+                description=ach['description'],
+                date_earned=datetime.date.fromisoformat(ach['date_earned']),
+                xp_reward=ach['xp_reward']
             )
             player.achievements.append(achievement)
-        
-        return player, player_row['id']
+
+        return player, row['id']
 
 def save_player(self, user_id, player):
     """Save player data."""